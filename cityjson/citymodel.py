@@ -2,6 +2,10 @@
 
 import json
 
+import numpy as np
+
+from cityjson.geometry import FlatBoundaries, flatten_levels, get_depth, nest_levels
+
 min_cityjson = {
     "type": "CityJSON",
     "version": "1.1",
@@ -29,6 +33,7 @@ class CityJSON:
             self._coords_transformer = CoordinatesTransformer([0, 0, 0],
                                                               [1, 1, 1])
         self._vertex_handler = IndexedVerticesHandler(self)
+        self._filename = None
 
     @classmethod
     def from_file(cls, filename: str):
@@ -40,7 +45,14 @@ class CityJSON:
             raise TypeError("Not a JSON file!") from exp
         cityjson_data.close()
 
-        return cls(citymodel)
+        result = cls(citymodel)
+        result._filename = filename
+        return result
+
+    @property
+    def filename(self):
+        """Returns the file the model was loaded from or saved to (if any)."""
+        return self._filename
 
     @property
     def coordinates_transformer(self):
@@ -85,35 +97,58 @@ class CityJSON:
         """Saves the CityJSON model in a file."""
         with open(filename, "w", encoding="UTF-8") as outfile:
             json.dump(self.data, outfile)
+        self._filename = filename
 
 class CityObjectDict:
-    """Wrapper class for a dict of city objects."""
+    """Wrapper class for a dict of city objects.
 
-    def __init__(self, data: dict):
+    City objects that are not in the dict are looked up in the given packs
+    (if any), which are decompressed on demand.
+    """
+
+    def __init__(self, data: dict, packs: list = None):
         self._data = data
+        self._packs = [] if packs is None else packs
 
     def __getitem__(self, key: str) -> 'CityObject':
         #TODO: This should dereference the vertices
-        return CityObject(self._data[key], key)
+        if key in self._data:
+            return CityObject(self._data[key], key)
+        for pack in self._packs:
+            if key in pack:
+                return CityObject(pack[key], key)
+
+        raise KeyError(key)
 
     def __setitem__(self, key: str, value: 'CityObject'):
         #TODO: This should reference the vertices
         self._data[key] = value._data
 
     def __len__(self):
-        return len(self._data)
+        if len(self._packs) == 0:
+            return len(self._data)
+        return sum(1 for _ in self)
 
     def __iter__(self):
-        return self._data.__iter__()
+        yield from self._data
+        seen = set()
+        for pack in self._packs:
+            for key in pack:
+                if key not in self._data and key not in seen:
+                    seen.add(key)
+                    yield key
 
     def items(self):
-        return self._data.items()
+        for key in self:
+            yield key, self[key].data
 
     def values(self):
-        return self._data.values()
+        for key in self:
+            yield self[key].data
 
     def __contains__(self, item):
-        return item in self._data
+        return (item in self._data or
+                any(item in pack for pack in self._packs))
 
 class CityObject:
     """Class that represents a city object in CityJSON."""
@@ -151,6 +186,26 @@ class CityObject:
     def __contains__(self, item):
         return item in self._data
 
+class LazyCityObject(CityObject):
+    """Class that represents a city object whose data is only read from a
+    dict of city objects when it's first used."""
+
+    def __init__(self, cityobjects: 'CityObjectDict', key: str, name: str = None):
+        self._cityobjects = cityobjects
+        self._key = key
+        self._loaded = None
+        super().__init__(None, name)
+
+    @property
+    def _data(self):
+        if self._loaded is None:
+            self._loaded = self._cityobjects[self._key].data
+        return self._loaded
+
+    @_data.setter
+    def _data(self, value):
+        self._loaded = value
+
 class IndexedVerticesHandler:
     """Class that handles vertices of city objects as indices with a global
     list of coordinates in the city model.
@@ -163,26 +218,22 @@ class IndexedVerticesHandler:
         self.prepare_cache()
 
     def prepare_cache(self):
-        """Calculates the lookup cache for vertices."""
+        """Calculates the lookup cache for vertices.
+
+        Vertices are keyed by their real coordinates rounded to the precision,
+        as a tuple of integers."""
         cm = self._citymodel.data
-        h = {}
-        for v in cm["vertices"]:
-            c = self._citymodel.coordinates_transformer.decode_coords(v)
-            s = ("{{x:.{p}f}} {{y:.{p}f}} {{z:.{p}f}}"
-                 .format(p=self._precision).format(x=c[0], y=c[1], z=c[2]))
-            if s not in h:
-                newid = len(h)
-                h[s] = newid
-        self._lookup = h
+        coords = self._citymodel.coordinates_transformer.decode_many(cm["vertices"])
+        keys = np.round(coords * 10 ** self._precision).astype(np.int64)
+        self._lookup = {key: i for i, key in
+                        enumerate(dict.fromkeys(map(tuple, keys.tolist())))}
 
     def update_vertex_list(self):
         """Updates the city model's vertex list based on the lookup."""
-        new_vertices = []
-        for v in self._lookup:
-            new_v = list(map(float, v.split()))
-            new_v = self._citymodel.coordinates_transformer.encode_coords(new_v)
-            new_vertices.append(new_v)
-        self._citymodel["vertices"] = new_vertices
+        coords = np.array(list(self._lookup), dtype=np.float64).reshape(-1, 3)
+        coords /= 10 ** self._precision
+        new_vertices = self._citymodel.coordinates_transformer.encode_many(coords)
+        self._citymodel["vertices"] = new_vertices.tolist()
 
     def dereference(self, cityobject: 'CityObject'):
         """Dereferences the geometries of the provided city object.
@@ -197,11 +248,9 @@ class IndexedVerticesHandler:
 
     def dereference_list(self, vertex_list: list):
         """Dereferences a list of vertices (e.g. 'boundaries')."""
-        for i, l in enumerate(vertex_list):
-            if isinstance(l, list):
-                self.dereference_list(l)
-            else:
-                vertex_list[i] = self.get_coords_of_index(l)
+        flat = FlatBoundaries.from_nested(vertex_list)
+        vertices = self._citymodel["vertices"]
+        vertex_list[:] = flat.to_nested([vertices[i] for i in flat.indices.tolist()])
 
     def get_coords_of_index(self, i: int) -> list:
         """Returns the coordinates of the i-th vertex from the global list."""
@@ -217,21 +266,19 @@ class IndexedVerticesHandler:
 
     def reference_list(self, vertex_list: list):
         """References a list of vertices."""
-        for i, l in enumerate(vertex_list):
-            if isinstance(l[0], list):
-                self.reference_list(l)
-            else:
-                vertex_list[i] = self.get_index_of_coords(l)
+        offsets, coords = flatten_levels(vertex_list, get_depth(vertex_list) - 2)
+        vertex_list[:] = nest_levels([self.get_index_of_coords(v) for v in coords],
+                                     offsets)
 
     def get_index_of_coords(self, v: list) -> int:
         """Returns the index of the specified coords in the global list."""
-        s = ("{{x:.{p}f}} {{y:.{p}f}} {{z:.{p}f}}"
-             .format(p=self._precision).format(x=v[0], y=v[1], z=v[2]))
-        if s in self._lookup:
-            return self._lookup[s]
+        factor = 10 ** self._precision
+        key = (round(v[0] * factor), round(v[1] * factor), round(v[2] * factor))
+        if key in self._lookup:
+            return self._lookup[key]
 
         newid = len(self._lookup)
-        self._lookup[s] = newid
+        self._lookup[key] = newid
         return newid
 
 class CoordinatesTransformer:
@@ -248,7 +295,28 @@ class CoordinatesTransformer:
                 coords[2] * self._scale[2] + self._translate[2]]
 
     def encode_coords(self, coords: list):
-        """Applies the reverse transformation to the provided coordinates."""
-        return [int((coords[0] - self._translate[0]) / self._scale[0]),
-                int((coords[1] - self._translate[1]) / self._scale[1]),
-                int((coords[2] - self._translate[2]) / self._scale[2])]
+        """Applies the reverse transformation to the provided coordinates,
+        rounded to the nearest integers."""
+        return [round((coords[0] - self._translate[0]) / self._scale[0]),
+                round((coords[1] - self._translate[1]) / self._scale[1]),
+                round((coords[2] - self._translate[2]) / self._scale[2])]
+
+    def decode_many(self, vertices) -> np.ndarray:
+        """Applies the transformation to a list or (N, 3) array of vertices.
+
+        Returns the coordinates as a (N, 3) array of floats."""
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        if len(vertices) == 0:
+            return vertices
+        return vertices * self._scale + self._translate
+
+    def encode_many(self, coords) -> np.ndarray:
+        """Applies the reverse transformation to a list or (N, 3) array of
+        coordinates.
+
+        Returns the vertices as a (N, 3) array of integers, rounded like in
+        encode_coords."""
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        if len(coords) == 0:
+            return coords.astype(np.int64)
+        return np.rint((coords - self._translate) / self._scale).astype(np.int64)
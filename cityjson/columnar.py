@@ -0,0 +1,179 @@
+"""Module that exports city objects as flat, column-oriented arrays."""
+
+import json
+
+import numpy as np
+
+from cityjson.geometry import FlatBoundaries, get_depth
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+# Boundaries are padded to the nesting of a MultiSolid: solids, shells,
+# surfaces, rings and vertex indices.
+MAX_DEPTH = 5
+
+OFFSET_NAMES = ["geometry_offsets",
+                "solid_offsets",
+                "shell_offsets",
+                "surface_offsets",
+                "ring_offsets"]
+
+def flatten_boundaries(boundaries, indices: list, offsets: list):
+    """Appends the boundaries of a geometry to a flat list of indices.
+
+    The boundaries are padded to the depth of a MultiSolid, so offsets has a
+    list per level (geometries, solids, shells, surfaces and rings) with the
+    position where the children of every item end. Each list must start with
+    a zero."""
+    for _ in range(MAX_DEPTH - get_depth(boundaries)):
+        boundaries = [boundaries]
+
+    # The geometry itself is the single item of the first level
+    flat = FlatBoundaries.from_nested([boundaries])
+    for level_offsets, flat_offsets in zip(offsets, flat.offsets):
+        level_offsets.extend((flat_offsets[1:] + level_offsets[-1]).tolist())
+    indices.extend(flat.indices.tolist())
+
+class ColumnarVersion:
+    """Class that represents the city objects of a version as flat arrays.
+
+    Attributes become one column per name. Boundaries are stored as a flat
+    array of vertex indices with offset arrays for every level of nesting,
+    and only the vertices used by the objects are kept.
+    """
+
+    def __init__(self, cityobjects, vertices: list, transform: dict = None):
+        self._transform = transform
+        self._arrays = {}
+        self.build(cityobjects, vertices)
+
+    @property
+    def arrays(self):
+        """Returns the dict of named arrays."""
+        return self._arrays
+
+    def build(self, cityobjects, vertices):
+        """Builds the arrays from the (id, object) pairs."""
+        ids = []
+        types = []
+        attributes = {}
+        object_offsets = [0]
+        geom_object = []
+        geom_types = []
+        geom_lods = []
+        geom_depths = []
+        indices = []
+        offsets = [[0] for _ in OFFSET_NAMES]
+
+        for i, (obj_id, obj) in enumerate(cityobjects):
+            ids.append(obj_id)
+            types.append(obj.get("type", ""))
+            for name, value in obj.get("attributes", {}).items():
+                attributes.setdefault(name, {})[i] = value
+
+            for g in obj.get("geometry", []):
+                geom_object.append(i)
+                geom_types.append(g["type"])
+                geom_lods.append(str(g.get("lod", "")))
+                geom_depths.append(get_depth(g["boundaries"]))
+                flatten_boundaries(g["boundaries"], indices, offsets)
+            object_offsets.append(len(geom_object))
+
+        arrays = self._arrays
+        arrays["object_id"] = np.array(ids, dtype=str)
+        arrays["object_type"] = np.array(types, dtype=str)
+        for name, values in attributes.items():
+            arrays["attributes." + name] = get_attribute_column(values, len(ids))
+
+        arrays["object_geometry_offsets"] = np.array(object_offsets, dtype=np.int64)
+        arrays["geometry_object"] = np.array(geom_object, dtype=np.int64)
+        arrays["geometry_type"] = np.array(geom_types, dtype=str)
+        arrays["geometry_lod"] = np.array(geom_lods, dtype=str)
+        arrays["geometry_depth"] = np.array(geom_depths, dtype=np.int8)
+        for name, offset_list in zip(OFFSET_NAMES, offsets):
+            arrays[name] = np.array(offset_list, dtype=np.int64)
+
+        # Keep only the used vertices and renumber the boundaries accordingly
+        boundaries = np.array(indices, dtype=np.int64)
+        used, inverse = np.unique(boundaries[boundaries >= 0], return_inverse=True)
+        boundaries[boundaries >= 0] = inverse
+        arrays["boundaries"] = boundaries
+        if len(vertices) > 0:
+            arrays["vertices"] = np.asarray(vertices)[used]
+        else:
+            arrays["vertices"] = np.zeros((0, 3))
+
+        if self._transform is not None:
+            arrays["transform_scale"] = np.array(self._transform["scale"])
+            arrays["transform_translate"] = np.array(self._transform["translate"])
+
+    def get_coordinates(self) -> np.ndarray:
+        """Returns the real coordinates of the vertices as a (N, 3) array."""
+        vertices = self._arrays["vertices"].astype(np.float64)
+        if self._transform is not None:
+            vertices = (vertices * self._arrays["transform_scale"] +
+                        self._arrays["transform_translate"])
+        return vertices
+
+    def save_npz(self, filename: str):
+        """Saves the arrays as an (uncompressed) NumPy .npz file."""
+        with open(filename, "wb") as outfile:
+            np.savez(outfile, **self._arrays)
+
+    def save_arrow(self, filename: str):
+        """Saves the objects as an Arrow IPC file.
+
+        Every row is an object, and its geometries have the boundaries as
+        nested lists of coordinates that share the offsets of the arrays."""
+        if pa is None:
+            raise ImportError("The arrow format needs the 'pyarrow' package.")
+
+        arrays = self._arrays
+
+        coords = self.get_coordinates()[arrays["boundaries"]]
+        boundaries = pa.FixedSizeListArray.from_arrays(pa.array(coords.ravel()), 3)
+        for name in reversed(OFFSET_NAMES):
+            boundaries = pa.ListArray.from_arrays(pa.array(arrays[name].astype(np.int32)),
+                                                  boundaries)
+        geometries = pa.StructArray.from_arrays(
+            [pa.array(arrays["geometry_type"]),
+             pa.array(arrays["geometry_lod"]),
+             pa.array(arrays["geometry_depth"]),
+             boundaries],
+            names=["type", "lod", "depth", "boundaries"])
+
+        columns = {
+            "id": pa.array(arrays["object_id"]),
+            "type": pa.array(arrays["object_type"])
+        }
+        for name, values in arrays.items():
+            if name.startswith("attributes."):
+                columns[name] = pa.array(values)
+        columns["geometry"] = pa.ListArray.from_arrays(
+            pa.array(arrays["object_geometry_offsets"].astype(np.int32)), geometries)
+
+        table = pa.table(columns)
+        with pa.OSFile(filename, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+def get_attribute_column(values: dict, length: int) -> np.ndarray:
+    """Returns a column with the values of an attribute by object position.
+
+    Numeric attributes become floats (with NaN if missing) and all others
+    become strings (JSON-encoded if they are not strings already)."""
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool)
+           for v in values.values()):
+        column = np.full(length, np.nan)
+        for i, value in values.items():
+            column[i] = value
+        return column
+
+    column = [""] * length
+    for i, value in values.items():
+        column[i] = value if isinstance(value, str) else json.dumps(value)
+    return np.array(column, dtype=str)
@@ -0,0 +1,82 @@
+"""Module with an on-disk cache of the diffs between versions."""
+
+import hashlib
+import json
+import os
+
+class DiffCache:
+    """Class that keeps the id maps of diffs between versions in a directory.
+
+    Version names are hashes of their content, so the diff between two of
+    them never changes. Every diff is a JSON file named after the pair of
+    versions. Reading a diff updates the modification time of its file, and
+    the least recently used diffs are removed when the directory grows
+    beyond the maximum size (in bytes).
+    """
+
+    def __init__(self, directory: str, max_size: int = 64 * 1024 * 1024):
+        self._directory = directory
+        self._max_size = max_size
+
+    @property
+    def directory(self):
+        """Returns the path of the cache directory."""
+        return self._directory
+
+    def get_path(self, source: str, dest: str) -> str:
+        """Returns the path of the file of a diff."""
+        m = hashlib.new('sha1')
+        m.update(json.dumps([source, dest]).encode('utf-8'))
+        return os.path.join(self._directory, m.hexdigest() + ".json")
+
+    def get(self, source: str, dest: str):
+        """Returns the id maps of the diff between two versions, or None if
+        it's not in the cache."""
+        path = self.get_path(source, dest)
+        try:
+            with open(path, encoding="UTF-8") as diff_file:
+                result = json.load(diff_file)
+        except (OSError, ValueError):
+            return None
+
+        os.utime(path)
+        return result
+
+    def put(self, source: str, dest: str, result: dict):
+        """Stores the id maps of the diff between two versions."""
+        os.makedirs(self._directory, exist_ok=True)
+        path = self.get_path(source, dest)
+        with open(path + ".tmp", "w", encoding="UTF-8") as diff_file:
+            json.dump(result, diff_file)
+        os.replace(path + ".tmp", path)
+
+        self.evict()
+
+    def clear(self):
+        """Removes all the diffs, e.g. after the city objects were renamed."""
+        if not os.path.isdir(self._directory):
+            return
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(".json"):
+                os.remove(entry.path)
+
+    def evict(self):
+        """Removes the least recently used diffs until the cache fits in its
+        maximum size (keeping at least the most recent one)."""
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:
+            if total <= self._max_size:
+                break
+            os.remove(path)
+            total -= size
+
+def get_cache_path(filename: str) -> str:
+    """Returns the path of the diff cache of a versioned city model."""
+    return filename + ".diffcache"
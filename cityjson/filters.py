@@ -0,0 +1,71 @@
+"""Module with filters of city objects by the value of their attributes."""
+
+import json
+import operator
+import re
+
+OPERATORS = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge
+}
+
+PREDICATE_RE = re.compile(r"^\s*([^=!<>\s]+)\s*(==|=|!=|<=|>=|<|>)\s*(.*?)\s*$")
+
+class AttributeFilter:
+    """Class that represents a comparison of an attribute with a value.
+
+    Values are parsed as JSON when possible (e.g. numbers, true or null),
+    but string attributes are always compared with the value as written.
+    Objects without the attribute, or with a value that can't be compared,
+    don't match.
+    """
+
+    def __init__(self, name: str, op: str, value, text: str = None):
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator '{op}'.")
+        self._name = name
+        self._op = op
+        self._value = value
+        if text is None:
+            text = value if isinstance(value, str) else json.dumps(value)
+        self._text = text
+
+    @classmethod
+    def parse(cls, text: str) -> 'AttributeFilter':
+        """Returns the filter of an expression like 'key op value'."""
+        match = PREDICATE_RE.match(text)
+        if match is None:
+            raise ValueError(f"Invalid filter '{text}', expected 'key op value'.")
+
+        name, op, text = match.groups()
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = text
+        return cls(name, op, value, text)
+
+    @property
+    def name(self):
+        """Returns the name of the attribute."""
+        return self._name
+
+    def matches(self, cityobject) -> bool:
+        """Returns True if the attribute of the city object matches."""
+        attributes = cityobject["attributes"] if "attributes" in cityobject else {}
+        if self._name not in attributes:
+            return False
+
+        value = attributes[self._name]
+        other = self._text if isinstance(value, str) else self._value
+        try:
+            return OPERATORS[self._op](value, other)
+        except TypeError:
+            return False
+
+    def __repr__(self):
+        return f"{self._name} {self._op} {json.dumps(self._value)}"
@@ -0,0 +1,194 @@
+"""Module with a flat representation of the boundaries of geometries."""
+
+import itertools
+
+import numpy as np
+
+def get_depth(boundaries) -> int:
+    """Returns the nesting depth of the boundaries of a geometry.
+
+    Empty children are skipped, as they don't tell how deep the others are."""
+    depth = 0
+    while isinstance(boundaries, list):
+        depth += 1
+        if len(boundaries) == 0:
+            break
+        boundaries = next((child for child in boundaries if child != []), boundaries[0])
+    return depth
+
+def flatten_levels(boundaries, levels: int):
+    """Flattens the given number of levels of nested lists.
+
+    Returns the offsets of every level (where the children of each item start
+    and end in the next level) and the list of items of the last level."""
+    offsets = []
+    items = boundaries
+    for _ in range(levels):
+        lengths = np.fromiter((len(child) for child in items),
+                              dtype=np.int64,
+                              count=len(items))
+        offsets.append(np.concatenate(([0], np.cumsum(lengths))))
+        items = [item for child in items for item in child]
+    return offsets, items
+
+def nest_levels(items: list, offsets: list) -> list:
+    """Rebuilds nested lists from the items of the last level and the offsets
+    of every level (the reverse of flatten_levels)."""
+    for level_offsets in reversed(offsets):
+        o = level_offsets.tolist()
+        items = [items[o[i]:o[i + 1]] for i in range(len(o) - 1)]
+    return items
+
+def get_leaf_lists(a, leaves):
+    """Appends the innermost lists of vertex indices of boundaries to leaves."""
+    if a and isinstance(a[0], list):
+        for each in a:
+            get_leaf_lists(each, leaves)
+    else:
+        leaves.append(a)
+
+def get_geometries_leaves(geometries) -> list:
+    """Returns the innermost lists of vertex indices of all geometries."""
+    leaves = []
+    for g in geometries:
+        get_leaf_lists(g["boundaries"], leaves)
+    return leaves
+
+def set_leaf_lists(leaves, values):
+    """Replaces the items of the given lists with the consecutive values."""
+    start = 0
+    for leaf in leaves:
+        end = start + len(leaf)
+        leaf[:] = values[start:end]
+        start = end
+
+def get_leaf_indices(leaves) -> np.ndarray:
+    """Returns the vertex indices of the given lists as a flat array, with
+    null indices as -1."""
+    try:
+        return np.fromiter(itertools.chain.from_iterable(leaves), dtype=np.int64)
+    except TypeError:
+        return np.fromiter((-1 if i is None else i
+                            for i in itertools.chain.from_iterable(leaves)),
+                           dtype=np.int64)
+
+def set_leaf_indices(leaves, indices: np.ndarray):
+    """Replaces the vertex indices of the given lists with a flat array of
+    indices, with -1 as null."""
+    values = indices.tolist()
+    if (indices < 0).any():
+        values = [None if i < 0 else i for i in values]
+    set_leaf_lists(leaves, values)
+
+def remap_geometries(geometries, newids):
+    """Replaces the vertex indices of all geometries with their value in newids.
+
+    The innermost lists of all geometries are gathered in a single traversal,
+    their indices are remapped in one lookup (with NumPy if newids is an
+    array) and then written back in place."""
+    leaves = get_geometries_leaves(geometries)
+
+    indices = itertools.chain.from_iterable(leaves)
+    if isinstance(newids, np.ndarray):
+        mapped = newids[np.fromiter(indices, dtype=np.int64)].tolist()
+    else:
+        mapped = list(map(newids.__getitem__, indices))
+
+    set_leaf_lists(leaves, mapped)
+
+def shift_geometries(geometries, start: int, offset: int):
+    """Adds an offset to the vertex indices of all geometries from start on,
+    in place."""
+    leaves = get_geometries_leaves(geometries)
+    indices = get_leaf_indices(leaves)
+    indices[indices >= start] += offset
+    set_leaf_indices(leaves, indices)
+
+def get_max_index(geometries) -> int:
+    """Returns the highest vertex index used by the geometries, or -1 if
+    they have none."""
+    indices = get_leaf_indices(get_geometries_leaves(geometries))
+    return int(indices.max()) if len(indices) > 0 else -1
+
+def get_used_vertices(geometries) -> np.ndarray:
+    """Returns the sorted indices of the vertices used by the geometries."""
+    indices = get_leaf_indices(get_geometries_leaves(geometries))
+    return np.unique(indices[indices >= 0])
+
+def compact_vertices(geometries, vertices, first_use: bool = False):
+    """Returns a list with only the vertices used by the geometries, whose
+    indices are updated in place.
+
+    The vertices keep their order, or are put in order of first use."""
+    leaves = get_geometries_leaves(geometries)
+    indices = get_leaf_indices(leaves)
+    valid = indices >= 0
+
+    used, first, inverse = np.unique(indices[valid], return_index=True,
+                                     return_inverse=True)
+    if first_use:
+        order = np.argsort(first, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        used = used[order]
+        inverse = rank[inverse]
+
+    indices[valid] = inverse
+    set_leaf_indices(leaves, indices)
+
+    return [vertices[i] for i in used.tolist()]
+
+class FlatBoundaries:
+    """Class that represents the boundaries of a geometry as a flat array of
+    vertex indices and an array of offsets per level of nesting.
+
+    For a MultiSurface, for example, the offsets are those of the surfaces
+    (into the rings) and of the rings (into the indices), like in Arrow or
+    CityJSONSeq. Null indices are stored as -1.
+    """
+
+    def __init__(self, indices: np.ndarray, offsets: list):
+        self._indices = indices
+        self._offsets = offsets
+
+    @classmethod
+    def from_nested(cls, boundaries: list) -> 'FlatBoundaries':
+        """Returns the flat representation of nested boundaries."""
+        offsets, items = flatten_levels(boundaries, get_depth(boundaries) - 1)
+        indices = np.fromiter((-1 if i is None else i for i in items),
+                              dtype=np.int64,
+                              count=len(items))
+        return cls(indices, offsets)
+
+    @property
+    def indices(self) -> np.ndarray:
+        """Returns the flat array of vertex indices."""
+        return self._indices
+
+    @property
+    def offsets(self) -> list:
+        """Returns the offsets of every level, from the outer to the inner."""
+        return self._offsets
+
+    @property
+    def depth(self) -> int:
+        """Returns the nesting depth of the boundaries."""
+        return len(self._offsets) + 1
+
+    def to_nested(self, values: list = None) -> list:
+        """Returns the boundaries as nested lists.
+
+        If values are provided, they are used instead of the indices (e.g. to
+        put the coordinates of the vertices)."""
+        if values is None:
+            values = [None if i < 0 else i for i in self._indices.tolist()]
+        return nest_levels(values, self._offsets)
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __eq__(self, other):
+        return (np.array_equal(self._indices, other.indices) and
+                len(self._offsets) == len(other.offsets) and
+                all(np.array_equal(a, b)
+                    for a, b in zip(self._offsets, other.offsets)))
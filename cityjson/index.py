@@ -0,0 +1,130 @@
+"""Module with indexes over the city objects of a versioned city model."""
+
+import json
+
+class TypeIndex:
+    """Class that keeps the type of every city object, indexed by its hash.
+
+    Objects never change for the same hash, so the index is shared by all
+    versions and only has to be extended with new objects. The objects of a
+    version with some types can then be found from its objects map, without
+    reading the objects themselves.
+    """
+
+    def __init__(self, types: dict = None):
+        self._types = {} if types is None else types
+
+    @classmethod
+    def load(cls, filename: str) -> 'TypeIndex':
+        """Returns the index stored in the given file."""
+        with open(filename, encoding="UTF-8") as index_file:
+            return cls(json.load(index_file)["types"])
+
+    def save(self, filename: str):
+        """Saves the index in the given file."""
+        with open(filename, "w", encoding="UTF-8") as index_file:
+            json.dump({"types": self._types}, index_file)
+
+    def update(self, keys, cityobjects) -> int:
+        """Adds the objects with the given keys that are not indexed yet.
+
+        Returns the number of added objects."""
+        added = 0
+        for key in keys:
+            if key in self._types or key not in cityobjects:
+                continue
+            obj = cityobjects[key]
+            self._types[key] = obj["type"] if "type" in obj else None
+            added += 1
+        return added
+
+    def select(self, objects: dict, types) -> set:
+        """Returns the original ids of the objects map whose type is one of
+        the given."""
+        types = set(types)
+        return {obj_id for obj_id, key in objects.items()
+                if self._types.get(key) in types}
+
+    def __contains__(self, key):
+        return key in self._types
+
+    def __getitem__(self, key):
+        return self._types[key]
+
+    def __len__(self):
+        return len(self._types)
+
+class HistoryIndex:
+    """Class that keeps, for every original object id, the versions where the
+    object got a new state (i.e. was added, changed or removed).
+
+    Every entry is a [version name, object hash] pair, with None as the hash
+    if the object was removed. A version only has entries for the objects
+    whose state differs from all its parents, so merges only appear when
+    they bring something new. Versions are immutable, so the index only has
+    to be extended with the new versions.
+    """
+
+    def __init__(self, versions: list = None, transitions: dict = None):
+        self._versions = set([] if versions is None else versions)
+        self._transitions = {} if transitions is None else transitions
+
+    @classmethod
+    def load(cls, filename: str) -> 'HistoryIndex':
+        """Returns the index stored in the given file."""
+        with open(filename, encoding="UTF-8") as index_file:
+            data = json.load(index_file)
+        return cls(data["versions"], data["transitions"])
+
+    def save(self, filename: str):
+        """Saves the index in the given file."""
+        with open(filename, "w", encoding="UTF-8") as index_file:
+            json.dump({"versions": list(self._versions),
+                       "transitions": self._transitions},
+                      index_file)
+
+    def update(self, versions: dict) -> int:
+        """Adds the versions (given as a dict of Version) that are not indexed
+        yet.
+
+        Returns the number of added versions."""
+        added = 0
+        for name, version in versions.items():
+            if name not in self._versions:
+                self.add_version(version)
+                added += 1
+        return added
+
+    def add_version(self, version):
+        """Adds the transitions of the objects of a version."""
+        objects = version.objects
+        parents = [parent.objects for parent in version.parents]
+
+        obj_ids = set(objects)
+        for parent in parents:
+            obj_ids.update(parent)
+
+        for obj_id in obj_ids:
+            key = objects.get(obj_id)
+            if all(parent.get(obj_id) != key for parent in parents):
+                self._transitions.setdefault(obj_id, []).append([version.name, key])
+
+        self._versions.add(version.name)
+
+    def get_transitions(self, obj_id: str) -> list:
+        """Returns the [version name, object hash] transitions of an object."""
+        return self._transitions.get(obj_id, [])
+
+    def __contains__(self, obj_id):
+        return obj_id in self._transitions
+
+    def __len__(self):
+        return len(self._transitions)
+
+def get_type_index_path(filename: str) -> str:
+    """Returns the path of the type index of a versioned city model."""
+    return filename + ".tidx"
+
+def get_history_index_path(filename: str) -> str:
+    """Returns the path of the history index of a versioned city model."""
+    return filename + ".hidx"
@@ -0,0 +1,90 @@
+"""Module with the journal of a versioned CityJSON file.
+
+The journal is an append-only file next to the versioned file (with the
+'.journal' extension) with a JSON line per save. Every line has the vertices,
+objects and versions that were added, and the refs that were moved, so a
+small change doesn't rewrite the whole file. It's replayed when the file is
+loaded and folded back into it when the whole file is written.
+"""
+
+import json
+import os
+
+def get_journal_path(filename: str) -> str:
+    """Returns the path of the journal of a versioned file."""
+    return filename + ".journal"
+
+def apply_record(data: dict, record: dict):
+    """Applies a record of the journal to the data of a versioned city model.
+
+    Applying a record again has no effect, so a journal that was already
+    folded in the file can be replayed safely."""
+    vertices = data["vertices"]
+    start = record.get("vertices_start", len(vertices))
+    new_vertices = record.get("vertices", [])
+    if len(vertices) == start:
+        vertices.extend(new_vertices)
+    elif len(vertices) < start + len(new_vertices):
+        raise ValueError("The journal does not match the vertices of the file.")
+
+    data["CityObjects"].update(record.get("CityObjects", {}))
+    versioning = data["versioning"]
+    versioning["versions"].update(record.get("versions", {}))
+    for kind in ["branches", "tags"]:
+        for name, version in record.get(kind, {}).items():
+            if version is None:
+                versioning[kind].pop(name, None)
+            else:
+                versioning[kind][name] = version
+
+class Journal:
+    """Class that represents the journal of a versioned file."""
+
+    def __init__(self, path: str):
+        self._path = path
+
+    @property
+    def path(self):
+        """Returns the path of the journal."""
+        return self._path
+
+    def exists(self) -> bool:
+        """Returns True if the journal has been written."""
+        return os.path.isfile(self._path)
+
+    def read(self):
+        """Returns the records of the journal and the size of the part that
+        was read.
+
+        A last line without a line break is left out, as it was not written
+        completely."""
+        if not self.exists():
+            return [], 0
+
+        with open(self._path, "rb") as infile:
+            content = infile.read()
+        end = content.rfind(b"\n") + 1
+        records = [json.loads(line) for line in content[:end].splitlines()
+                   if line.strip()]
+        return records, end
+
+    def replay(self, data: dict) -> int:
+        """Applies the records of the journal to the data of a versioned
+        city model, and returns the size of the part that was read."""
+        records, size = self.read()
+        for record in records:
+            apply_record(data, record)
+        return size
+
+    def append(self, record: dict):
+        """Appends a record to the journal as a line, and flushes it to the disk."""
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with open(self._path, "a", encoding="UTF-8") as outfile:
+            outfile.write(line)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+    def remove(self):
+        """Removes the journal (once it has been folded into the file)."""
+        if self.exists():
+            os.remove(self._path)
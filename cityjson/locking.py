@@ -0,0 +1,95 @@
+"""Module with the locks and errors of concurrent writes to versioned files."""
+
+import contextlib
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# The locks held by this process, with how many times they were taken
+_held_locks = {}
+
+class ConcurrentUpdate(Exception):
+    """Raised when a versioned file was changed by another process in a way
+    that can't be merged with the changes of this one. The command can be
+    run again on the new state of the file."""
+
+class RefConflict(ConcurrentUpdate):
+    """Raised when a ref was moved by another process since the versioned
+    city model was loaded."""
+
+    def __init__(self, ref: str, expected: str, actual: str):
+        super().__init__(f"Ref '{ref}' was moved to '{actual}' by another process "
+                         f"(expected '{expected}').")
+        self.ref = ref
+        self.expected = expected
+        self.actual = actual
+
+def get_lock_path(filename: str) -> str:
+    """Returns the path of the lock file of a file."""
+    return filename + ".lock"
+
+@contextlib.contextmanager
+def file_lock(path: str, timeout: float = 60.0):
+    """Holds an exclusive, advisory lock on a file while the block runs.
+
+    The lock is taken on a '.lock' file next to it with flock, so it's
+    released if the process dies. Without fcntl (e.g. on Windows), the lock
+    file is created exclusively and removed afterwards instead. Other
+    processes wait until the lock is released, or the timeout expires. The
+    lock can be taken again by the process that holds it."""
+    lock_path = get_lock_path(path)
+    key = os.path.abspath(lock_path)
+    if key in _held_locks:
+        _held_locks[key] += 1
+        try:
+            yield
+        finally:
+            _held_locks[key] -= 1
+        return
+
+    with _acquire(lock_path, timeout):
+        _held_locks[key] = 1
+        try:
+            yield
+        finally:
+            del _held_locks[key]
+
+@contextlib.contextmanager
+def _acquire(lock_path: str, timeout: float):
+    """Holds the lock file of a path while the block runs."""
+    start = time.monotonic()
+
+    if fcntl is not None:
+        with open(lock_path, "a", encoding="UTF-8") as lock_file:
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() - start > timeout:
+                        raise TimeoutError(f"Could not lock '{lock_path}'.")
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return
+
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f"Could not lock '{lock_path}'.")
+            time.sleep(0.05)
+
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
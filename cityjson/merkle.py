@@ -0,0 +1,164 @@
+"""Module with a Merkle tree over the objects maps of versions."""
+
+import hashlib
+import json
+import zlib
+
+BUCKET_COUNT = 4096
+
+def get_bucket(obj_id: str) -> int:
+    """Returns the bucket of an original object id."""
+    return zlib.crc32(obj_id.encode('utf-8')) % BUCKET_COUNT
+
+def hash_bucket(entries: dict) -> str:
+    """Returns the hash of the sorted (id, hash) entries of a bucket."""
+    encoded = json.dumps(sorted(entries.items())).encode('utf-8')
+    m = hashlib.new('sha1')
+    m.update(encoded)
+    return m.hexdigest()
+
+EMPTY_BUCKET_HASH = hash_bucket({})
+
+class ObjectsTree:
+    """Class that represents an objects map as a Merkle tree of two levels.
+
+    The entries of the map are split in buckets by their original id, and
+    every bucket is hashed over its sorted entries. The root is the hash of
+    all bucket hashes, so it doesn't depend on the order of the map. A map
+    that differs in a few entries shares the rest of the buckets (and their
+    hashes) with the tree of the original map.
+
+    A tree loaded from a TreeIndex only has the bucket hashes (its buckets
+    are None) until it's updated.
+    """
+
+    def __init__(self, buckets: list, hashes: list):
+        self._buckets = buckets
+        self._hashes = hashes
+
+    @classmethod
+    def from_objects(cls, objects: dict) -> 'ObjectsTree':
+        """Returns the tree of an objects map."""
+        buckets = split_buckets(objects)
+        hashes = [EMPTY_BUCKET_HASH if entries is None else hash_bucket(entries)
+                  for entries in buckets]
+        return cls(buckets, hashes)
+
+    @classmethod
+    def from_hashes(cls, hashes: list) -> 'ObjectsTree':
+        """Returns a tree that only has the hashes of its buckets."""
+        return cls(None, hashes)
+
+    def update(self, objects: dict, changed_ids) -> 'ObjectsTree':
+        """Returns the tree of an objects map that only differs from the map
+        of this tree in the given original ids (added, changed or removed).
+
+        Only the buckets of the changed ids are hashed again. If this tree
+        only has its bucket hashes, the ids of the new map are split in
+        buckets first (which is much cheaper than hashing them)."""
+        hashes = list(self._hashes)
+        if self._buckets is None:
+            buckets = split_buckets(objects)
+            for bucket in {get_bucket(obj_id) for obj_id in changed_ids}:
+                entries = buckets[bucket]
+                hashes[bucket] = EMPTY_BUCKET_HASH if entries is None else hash_bucket(entries)
+            return ObjectsTree(buckets, hashes)
+
+        buckets = list(self._buckets)
+
+        touched = set()
+        for obj_id in changed_ids:
+            bucket = get_bucket(obj_id)
+            if bucket not in touched:
+                buckets[bucket] = dict(buckets[bucket] or {})
+                touched.add(bucket)
+            if obj_id in objects:
+                buckets[bucket][obj_id] = objects[obj_id]
+            else:
+                buckets[bucket].pop(obj_id, None)
+
+        for bucket in touched:
+            hashes[bucket] = hash_bucket(buckets[bucket])
+
+        return ObjectsTree(buckets, hashes)
+
+    @property
+    def hashes(self) -> list:
+        """Returns the hashes of the buckets."""
+        return self._hashes
+
+    @property
+    def root(self) -> str:
+        """Returns the root hash of the tree."""
+        m = hashlib.new('sha1')
+        m.update("".join(self._hashes).encode('utf-8'))
+        return m.hexdigest()
+
+def split_buckets(objects: dict) -> list:
+    """Returns the entries of an objects map split in buckets, with None for
+    the empty buckets."""
+    buckets = [None] * BUCKET_COUNT
+    for obj_id, obj_hash in objects.items():
+        bucket = get_bucket(obj_id)
+        if buckets[bucket] is None:
+            buckets[bucket] = {}
+        buckets[bucket][obj_id] = obj_hash
+    return buckets
+
+class TreeIndex:
+    """Class that keeps the bucket hashes of the Merkle trees of versions.
+
+    Only the trees of the versions pointed by branches and tags are kept, as
+    those are the parents of the next commits. A commit in a new process can
+    then start from the tree of its parent instead of hashing its whole
+    objects map.
+    """
+
+    def __init__(self, trees: dict = None):
+        self._trees = {} if trees is None else trees
+
+    @classmethod
+    def load(cls, filename: str) -> 'TreeIndex':
+        """Returns the index stored in the given file."""
+        with open(filename, encoding="UTF-8") as index_file:
+            return cls(json.load(index_file)["trees"])
+
+    def save(self, filename: str):
+        """Saves the index in the given file."""
+        with open(filename, "w", encoding="UTF-8") as index_file:
+            json.dump({"trees": self._trees}, index_file)
+
+    def update(self, trees: dict, keep_names=None) -> int:
+        """Adds the given trees (as a dict of ObjectsTree per version name)
+        and, if keep_names is given, drops the trees of the other versions.
+
+        Returns the number of added or dropped trees."""
+        changed = 0
+        if keep_names is not None:
+            keep_names = set(keep_names)
+            for name in list(self._trees):
+                if name not in keep_names:
+                    del self._trees[name]
+                    changed += 1
+        for name, tree in trees.items():
+            if name not in self._trees:
+                self._trees[name] = tree.hashes
+                changed += 1
+        return changed
+
+    def get_tree(self, name: str) -> ObjectsTree:
+        """Returns the tree of a version (with only its bucket hashes), or
+        None if it's not indexed."""
+        if name not in self._trees:
+            return None
+        return ObjectsTree.from_hashes(self._trees[name])
+
+    def __contains__(self, name):
+        return name in self._trees
+
+    def __len__(self):
+        return len(self._trees)
+
+def get_tree_index_path(filename: str) -> str:
+    """Returns the path of the tree index of a versioned city model."""
+    return filename + ".midx"
@@ -0,0 +1,221 @@
+"""Module that compares versions of a city object part by part."""
+
+import copy
+import hashlib
+import json
+
+from cityjson.geometry import flatten_levels, get_depth
+
+# Depth of the boundaries of a MultiSurface, where the items are surfaces
+SURFACE_DEPTH = 3
+
+def get_hash(value) -> str:
+    """Returns the hash of a JSON value."""
+    m = hashlib.new('sha1')
+    m.update(json.dumps(value).encode('utf-8'))
+    return m.hexdigest()
+
+def get_leaf_refs(a, refs):
+    """Appends (list, index) pairs for the values of nested lists to refs."""
+    for i, each in enumerate(a):
+        if isinstance(each, list):
+            get_leaf_refs(each, refs)
+        else:
+            refs.append((a, i))
+
+def get_surfaces(boundaries) -> list:
+    """Returns the surfaces of boundaries (from all shells and solids), or
+    None if the geometry has no surfaces (e.g. points or lines)."""
+    depth = get_depth(boundaries)
+    if depth < SURFACE_DEPTH:
+        return None
+    return flatten_levels(boundaries, depth - SURFACE_DEPTH)[1]
+
+def get_semantic_refs(geometry: dict) -> list:
+    """Returns (list, index) pairs for the semantic value of every surface."""
+    refs = []
+    values = geometry.get("semantics", {}).get("values")
+    if isinstance(values, list):
+        get_leaf_refs(values, refs)
+    return refs
+
+class GeometryTree:
+    """Class with the hashes of the parts of a geometry: one per surface (with
+    its semantic surface) and one for the rest of its members."""
+
+    def __init__(self, geometry: dict):
+        rest = {key: value for key, value in geometry.items()
+                if key != "boundaries"}
+        surfaces = get_surfaces(geometry["boundaries"])
+        if surfaces is None:
+            rest["boundaries"] = geometry["boundaries"]
+            self.surfaces = None
+        else:
+            # The semantic values are part of the hash of every surface
+            semantics = geometry.get("semantics", {})
+            if "semantics" in rest:
+                rest["semantics"] = {key: value for key, value in semantics.items()
+                                     if key != "values"}
+            semantic_surfaces = semantics.get("surfaces", [])
+            values = [values_list[i] for values_list, i in get_semantic_refs(geometry)]
+            self.surfaces = []
+            for i, surface in enumerate(surfaces):
+                value = values[i] if i < len(values) else None
+                semantic = (semantic_surfaces[value]
+                            if isinstance(value, int) and value < len(semantic_surfaces)
+                            else None)
+                self.surfaces.append(get_hash([surface, semantic]))
+
+        self.rest = get_hash(rest)
+        self.hash = get_hash([self.rest, self.surfaces])
+
+class ObjectTree:
+    """Class that represents a city object as a Merkle tree.
+
+    The object has a hash per attribute, per member (e.g. its type or
+    parents) and per geometry, which in turn has a hash per surface. Two
+    versions of an object are compared from the top, so identical geometries
+    are skipped without looking at their surfaces.
+    """
+
+    def __init__(self, data: dict):
+        self.attributes = {name: get_hash(value)
+                           for name, value in data.get("attributes", {}).items()}
+        self.members = {key: get_hash(value) for key, value in data.items()
+                        if key not in ("attributes", "geometry")}
+        self.geometries = [GeometryTree(g) for g in data.get("geometry", [])]
+
+def diff_trees(old: ObjectTree, new: ObjectTree) -> list:
+    """Returns the paths of the parts that differ between two trees of an
+    object. A path is a tuple like ('attributes', name), (member,),
+    ('geometry', i) or ('geometry', i, 'surfaces', j)."""
+    paths = []
+
+    for name in sorted(set(old.attributes) | set(new.attributes)):
+        if old.attributes.get(name) != new.attributes.get(name):
+            paths.append(("attributes", name))
+
+    for key in sorted(set(old.members) | set(new.members)):
+        if old.members.get(key) != new.members.get(key):
+            paths.append((key, ))
+
+    if len(old.geometries) != len(new.geometries):
+        paths.append(("geometry", ))
+        return paths
+
+    for i, (old_geom, new_geom) in enumerate(zip(old.geometries, new.geometries)):
+        if old_geom.hash == new_geom.hash:
+            continue
+        if (old_geom.rest != new_geom.rest or old_geom.surfaces is None or
+                len(old_geom.surfaces) != len(new_geom.surfaces)):
+            paths.append(("geometry", i))
+            continue
+        for j, (old_surface, new_surface) in enumerate(zip(old_geom.surfaces,
+                                                           new_geom.surfaces)):
+            if old_surface != new_surface:
+                paths.append(("geometry", i, "surfaces", j))
+
+    return paths
+
+def paths_conflict(paths1: list, paths2: list) -> bool:
+    """Returns True if a path of a list is the same as, or part of, a path of
+    the other."""
+    for path1 in paths1:
+        for path2 in paths2:
+            length = min(len(path1), len(path2))
+            if path1[:length] == path2[:length]:
+                return True
+    return False
+
+def apply_paths(target: dict, source: dict, paths: list):
+    """Copies the parts at the given paths from the source object to the
+    target object."""
+    for path in paths:
+        if path[0] == "attributes":
+            attributes = target.setdefault("attributes", {})
+            if path[1] in source.get("attributes", {}):
+                attributes[path[1]] = copy.deepcopy(source["attributes"][path[1]])
+            else:
+                attributes.pop(path[1], None)
+        elif len(path) == 1:
+            if path[0] in source:
+                target[path[0]] = copy.deepcopy(source[path[0]])
+            else:
+                target.pop(path[0], None)
+        elif len(path) == 2:
+            target["geometry"][path[1]] = copy.deepcopy(source["geometry"][path[1]])
+        else:
+            i, j = path[1], path[3]
+            target_geom = target["geometry"][i]
+            source_geom = source["geometry"][i]
+            target_surface = get_surfaces(target_geom["boundaries"])[j]
+            target_surface[:] = copy.deepcopy(get_surfaces(source_geom["boundaries"])[j])
+
+            source_refs = get_semantic_refs(source_geom)
+            target_refs = get_semantic_refs(target_geom)
+            if j < len(source_refs) and j < len(target_refs):
+                values_list, k = target_refs[j]
+                values_list[k] = source_refs[j][0][source_refs[j][1]]
+
+class ObjectDiff:
+    """Class that compares versions of city objects through their trees.
+
+    Trees are kept by object hash, so an object that is compared more than
+    once (e.g. the common ancestor of a merge) is only hashed once.
+    """
+
+    def __init__(self):
+        self._trees = {}
+
+    def get_tree(self, obj_hash: str, data: dict) -> ObjectTree:
+        """Returns the tree of an object."""
+        if obj_hash not in self._trees:
+            self._trees[obj_hash] = ObjectTree(data)
+        return self._trees[obj_hash]
+
+    def compare(self, old, new) -> list:
+        """Returns the paths of the parts that differ between two versioned
+        city objects."""
+        if old.name == new.name:
+            return []
+        return diff_trees(self.get_tree(old.name, old.data),
+                          self.get_tree(new.name, new.data))
+
+    def merge(self, common, left, right):
+        """Returns the data of an object with the changes of both sides from
+        their common version, or None if they change the same parts."""
+        left_paths = self.compare(common, left)
+        right_paths = self.compare(common, right)
+        if paths_conflict(left_paths, right_paths):
+            return None
+
+        result = copy.deepcopy(common.data)
+        apply_paths(result, left.data, left_paths)
+        apply_paths(result, right.data, right_paths)
+        return result
+
+def describe_paths(paths: list) -> list:
+    """Returns a line of text per changed part of an object."""
+    lines = []
+    attributes = [path[1] for path in paths if path[0] == "attributes"]
+    if len(attributes) > 0:
+        lines.append("attributes: {}".format(", ".join(attributes)))
+
+    members = [path[0] for path in paths if len(path) == 1 and path[0] != "geometry"]
+    if len(members) > 0:
+        lines.append("members: {}".format(", ".join(members)))
+
+    surfaces = {}
+    for path in paths:
+        if path[0] != "geometry":
+            continue
+        if len(path) == 1:
+            lines.append("geometries: added or removed")
+        elif len(path) == 2:
+            lines.append("geometry {}: changed".format(path[1]))
+        else:
+            surfaces.setdefault(path[1], []).append(str(path[3]))
+    for i, indices in surfaces.items():
+        lines.append("geometry {}: surfaces {}".format(i, ", ".join(indices)))
+
+    return lines
@@ -0,0 +1,117 @@
+"""Module that handles pack files of compressed city objects."""
+
+import json
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class PackFile:
+    """Class that represents a file of compressed city objects, indexed by
+    their hash.
+
+    The pack is a concatenation of compressed JSON blobs. Its index is kept in
+    a separate file (with an '.idx' suffix) that maps every hash to the offset
+    and length of the respective blob.
+    """
+
+    def __init__(self, filename: str, index: dict = None):
+        self._filename = filename
+        if index is None:
+            with open(filename + ".idx", encoding="UTF-8") as idx_file:
+                index = json.load(idx_file)
+        self._compression = index["compression"]
+        self._objects = index["objects"]
+        self._file = None
+
+    @property
+    def filename(self):
+        """Returns the path of the pack file."""
+        return self._filename
+
+    @property
+    def compression(self):
+        """Returns the compression method of the blobs."""
+        return self._compression
+
+    @classmethod
+    def write(cls, filename: str, objects, compression: str = "zlib"):
+        """Writes the (key, data) pairs of objects in a new pack file.
+
+        The pack is written next to the destination and moved in place at the
+        end, so that an existing pack with the same name can still be read
+        while writing."""
+        compress = get_compressor(compression)
+
+        index = {"compression": compression, "objects": {}}
+        offset = 0
+        with open(filename + ".tmp", "wb") as pack_file:
+            for key, data in objects:
+                blob = compress(json.dumps(data).encode('utf-8'))
+                pack_file.write(blob)
+                index["objects"][key] = [offset, len(blob)]
+                offset += len(blob)
+
+        with open(filename + ".idx.tmp", "w", encoding="UTF-8") as idx_file:
+            json.dump(index, idx_file)
+
+        os.replace(filename + ".tmp", filename)
+        os.replace(filename + ".idx.tmp", filename + ".idx")
+
+        return cls(filename, index)
+
+    def __getitem__(self, key: str) -> dict:
+        offset, length = self._objects[key]
+        if self._file is None:
+            self._file = open(self._filename, "rb")
+        self._file.seek(offset)
+        blob = self._file.read(length)
+
+        return json.loads(get_decompressor(self._compression)(blob))
+
+    def __contains__(self, key):
+        return key in self._objects
+
+    def __iter__(self):
+        return self._objects.__iter__()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def close(self):
+        """Closes the pack file, if open."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Closes the pack and removes it and its index from the disk."""
+        self.close()
+        for path in [self._filename, self._filename + ".idx"]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+def get_compressor(compression: str):
+    """Returns the compression function for the given method."""
+    if compression == "zlib":
+        return zlib.compress
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression needs the 'zstandard' package.")
+        return zstandard.ZstdCompressor().compress
+
+    raise ValueError(f"Unknown compression '{compression}'.")
+
+def get_decompressor(compression: str):
+    """Returns the decompression function for the given method."""
+    if compression == "zlib":
+        return zlib.decompress
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression needs the 'zstandard' package.")
+        return zstandard.ZstdDecompressor().decompress
+
+    raise ValueError(f"Unknown compression '{compression}'.")
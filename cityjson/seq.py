@@ -0,0 +1,90 @@
+"""Module that reads and writes CityJSON Text Sequences (CityJSONSeq).
+
+A sequence has a CityJSON header on its first line (with the transform and
+no objects) and then a CityJSONFeature per line, with its own vertices.
+"""
+
+import copy
+import json
+
+from cityjson.geometry import compact_vertices
+
+SEQ_EXTENSIONS = (".jsonl", ".cjseq")
+
+def is_seq_file(filename: str) -> bool:
+    """Returns True if the filename has the extension of a CityJSONSeq."""
+    return filename.endswith(SEQ_EXTENSIONS)
+
+def get_feature(obj_id: str, obj: dict, vertices: list) -> dict:
+    """Returns a CityJSONFeature with a city object and only its vertices.
+
+    The object is copied, so its geometries can be renumbered."""
+    obj = dict(obj)
+    local_vertices = []
+    if "geometry" in obj:
+        obj["geometry"] = copy.deepcopy(obj["geometry"])
+        local_vertices = compact_vertices(obj["geometry"], vertices, first_use=True)
+
+    return {
+        "type": "CityJSONFeature",
+        "id": obj_id,
+        "CityObjects": {obj_id: obj},
+        "vertices": local_vertices
+    }
+
+class SeqWriter:
+    """Class that writes a CityJSONSeq to a text stream, a line at a time."""
+
+    def __init__(self, stream, header: dict):
+        self._stream = stream
+        self._count = 0
+        self.write_line(header)
+
+    @property
+    def count(self):
+        """Returns the number of features written."""
+        return self._count
+
+    def write_line(self, data: dict):
+        """Writes a JSON object as a line."""
+        self._stream.write(json.dumps(data, separators=(",", ":")) + "\n")
+
+    def write_object(self, obj_id: str, obj: dict, vertices: list):
+        """Writes a city object as a feature with its own vertices."""
+        self.write_line(get_feature(obj_id, obj, vertices))
+        self._count += 1
+
+class SeqReader:
+    """Class that reads a CityJSONSeq from a text stream, a line at a time.
+
+    The header is read when the reader is created and the features are read
+    as the reader is iterated."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._header = None
+        for line in stream:
+            if line.strip():
+                self._header = json.loads(line)
+                break
+        if self._header is None or self._header.get("type") != "CityJSON":
+            raise ValueError("The first line is not a CityJSON header.")
+
+    @property
+    def header(self) -> dict:
+        """Returns the header of the sequence."""
+        return self._header
+
+    @property
+    def transform(self):
+        """Returns the transform of the vertices of the features (if any)."""
+        return self._header.get("transform")
+
+    def __iter__(self):
+        for line in self._stream:
+            if not line.strip():
+                continue
+            feature = json.loads(line)
+            if feature.get("type") != "CityJSONFeature":
+                raise ValueError("Not a CityJSONFeature: {}".format(line[:80]))
+            yield feature
@@ -0,0 +1,139 @@
+"""Module with a spatial index over the bounding boxes of city objects."""
+
+import json
+import math
+
+import numpy as np
+
+from cityjson.citymodel import CoordinatesTransformer
+from cityjson.geometry import FlatBoundaries
+
+class GridIndex:
+    """Class that indexes the bounding boxes of city objects in a regular 2D
+    grid.
+
+    Objects are indexed by their hash, so the bounding box of an object never
+    changes and the index only has to be extended with the new objects of a
+    model. Bounding boxes are in real coordinates, as [minx, miny, minz, maxx,
+    maxy, maxz].
+    """
+
+    def __init__(self, cell_size: float = 100.0, bboxes: dict = None):
+        self._cell_size = cell_size
+        self._bboxes = {}
+        self._cells = {}
+        for key, bbox in (bboxes or {}).items():
+            self.add(key, bbox)
+
+    @classmethod
+    def load(cls, filename: str) -> 'GridIndex':
+        """Returns the index stored in the given file."""
+        with open(filename, encoding="UTF-8") as index_file:
+            data = json.load(index_file)
+        return cls(data["cell_size"], data["bboxes"])
+
+    def save(self, filename: str):
+        """Saves the index in the given file."""
+        with open(filename, "w", encoding="UTF-8") as index_file:
+            json.dump({"cell_size": self._cell_size, "bboxes": self._bboxes},
+                      index_file)
+
+    @property
+    def cell_size(self):
+        """Returns the size of the cells of the grid."""
+        return self._cell_size
+
+    def get_cell_range(self, bbox: list):
+        """Returns the first and last column and row of the cells that overlap
+        a bbox."""
+        return (math.floor(bbox[0] / self._cell_size),
+                math.floor(bbox[1] / self._cell_size),
+                math.floor(bbox[3] / self._cell_size),
+                math.floor(bbox[4] / self._cell_size))
+
+    def get_cells(self, bbox: list):
+        """Returns the (column, row) of the cells that overlap a bbox."""
+        min_col, min_row, max_col, max_row = self.get_cell_range(bbox)
+        for col in range(min_col, max_col + 1):
+            for row in range(min_row, max_row + 1):
+                yield col, row
+
+    def add(self, key: str, bbox: list):
+        """Adds the bbox of an object to the index."""
+        if key in self._bboxes:
+            return
+        self._bboxes[key] = bbox
+        if bbox is None:
+            return
+        for cell in self.get_cells(bbox):
+            self._cells.setdefault(cell, []).append(key)
+
+    def update(self, keys, cityobjects, vertices, transform: dict = None) -> int:
+        """Adds the objects with the given keys that are not indexed yet.
+
+        Returns the number of added objects."""
+        coords = None
+        added = 0
+        for key in keys:
+            if key in self._bboxes or key not in cityobjects:
+                continue
+            if coords is None:
+                if transform is None:
+                    coords = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+                else:
+                    coords = CoordinatesTransformer(transform["translate"],
+                                                    transform["scale"]).decode_many(vertices)
+            self.add(key, get_bbox(cityobjects[key], coords))
+            added += 1
+        return added
+
+    def query(self, bbox: list) -> set:
+        """Returns the keys of the objects that intersect a 2D bbox, given as
+        [minx, miny, maxx, maxy]."""
+        bbox = [bbox[0], bbox[1], -math.inf, bbox[2], bbox[3], math.inf]
+
+        # Large queries go through the non-empty cells instead
+        min_col, min_row, max_col, max_row = self.get_cell_range(bbox)
+        if (max_col - min_col + 1) * (max_row - min_row + 1) > len(self._cells):
+            cells = list(self._cells)
+        else:
+            cells = self.get_cells(bbox)
+
+        result = set()
+        for cell in cells:
+            for key in self._cells.get(cell, []):
+                if key not in result and intersects(self._bboxes[key], bbox):
+                    result.add(key)
+        return result
+
+    def __contains__(self, key):
+        return key in self._bboxes
+
+    def __getitem__(self, key):
+        return self._bboxes[key]
+
+    def __len__(self):
+        return len(self._bboxes)
+
+def get_bbox(cityobject, coords: np.ndarray):
+    """Returns the 3D bbox of the geometries of an object, or None if it has
+    no vertices."""
+    geometries = cityobject["geometry"] if "geometry" in cityobject else []
+    indices = [FlatBoundaries.from_nested(g["boundaries"]).indices
+               for g in geometries]
+    indices = np.concatenate(indices) if len(indices) > 0 else np.zeros(0, np.int64)
+    indices = indices[indices >= 0]
+    if len(indices) == 0:
+        return None
+
+    points = coords[indices]
+    return points.min(axis=0).tolist() + points.max(axis=0).tolist()
+
+def intersects(bbox: list, other: list) -> bool:
+    """Returns True if two 3D bboxes intersect."""
+    return all(bbox[i] <= other[i + 3] and other[i] <= bbox[i + 3]
+               for i in range(3))
+
+def get_index_path(filename: str) -> str:
+    """Returns the path of the spatial index of a versioned city model."""
+    return filename + ".sidx"
@@ -0,0 +1,245 @@
+"""Module that stores versioned city models in SQLite databases."""
+
+import collections.abc
+import json
+import os
+import sqlite3
+
+from cityjson.locking import ConcurrentUpdate, RefConflict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS versions (hash TEXT PRIMARY KEY, data TEXT);
+CREATE TABLE IF NOT EXISTS refs (kind TEXT, name TEXT, version TEXT,
+                                 PRIMARY KEY (kind, name));
+CREATE TABLE IF NOT EXISTS objects (hash TEXT PRIMARY KEY, data TEXT);
+CREATE TABLE IF NOT EXISTS vertices (id INTEGER PRIMARY KEY, x, y, z);
+"""
+
+class SQLiteMapping(collections.abc.MutableMapping):
+    """Class that exposes a table of (hash, json data) rows as a dict.
+
+    Rows are read on demand. Changes are kept in memory until they are
+    flushed, so values must be assigned again (and not modified in place) to
+    be stored.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, table: str, cache: bool = False):
+        self._connection = connection
+        self._table = table
+        self._cache = {} if cache else None
+        self._pending = {}
+        self._deleted = set()
+
+    def __getitem__(self, key):
+        if key in self._pending:
+            return self._pending[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        if self._cache is not None and key in self._cache:
+            return self._cache[key]
+
+        row = self._connection.execute(
+            f"SELECT data FROM {self._table} WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+
+        value = json.loads(row[0])
+        if self._cache is not None:
+            self._cache[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._deleted.discard(key)
+        self._pending[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._pending.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self._pending:
+            return True
+        if key in self._deleted:
+            return False
+        row = self._connection.execute(
+            f"SELECT 1 FROM {self._table} WHERE hash = ?", (key,)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        for (key,) in self._connection.execute(f"SELECT hash FROM {self._table}"):
+            if key not in self._deleted and key not in self._pending:
+                yield key
+        yield from list(self._pending)
+
+    def __len__(self):
+        if len(self._pending) == 0 and len(self._deleted) == 0:
+            return self._connection.execute(
+                f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+        return sum(1 for _ in self)
+
+    def flush(self):
+        """Writes the pending changes to the database."""
+        self._connection.executemany(
+            f"DELETE FROM {self._table} WHERE hash = ?",
+            ((key,) for key in self._deleted))
+        self._connection.executemany(
+            f"INSERT OR REPLACE INTO {self._table} (hash, data) VALUES (?, ?)",
+            ((key, json.dumps(value)) for key, value in self._pending.items()))
+
+        if self._cache is not None:
+            self._cache.update(self._pending)
+            for key in self._deleted:
+                self._cache.pop(key, None)
+        self._pending = {}
+        self._deleted = set()
+
+class SQLiteStorage:
+    """Class that loads and saves versioned city models in a SQLite database.
+
+    City objects and versions are indexed by their hash and read on demand;
+    refs, vertices and the rest of the model are loaded in memory. Saving a
+    model to the database it was loaded from only writes what changed, in a
+    single transaction.
+    """
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._connection = sqlite3.connect(filename)
+        self._connection.executescript(SCHEMA)
+        self._vertices = None
+        self._vertex_count = 0
+
+    @property
+    def filename(self):
+        """Returns the path of the database."""
+        return self._filename
+
+    def load(self) -> dict:
+        """Returns the data of the versioned city model in the database."""
+        con = self._connection
+
+        data = {key: json.loads(value)
+                for key, value in con.execute("SELECT key, value FROM meta")}
+
+        versioning = data.pop("versioning", {})
+        versioning["versions"] = SQLiteMapping(con, "versions", cache=True)
+        versioning["branches"] = {}
+        versioning["tags"] = {}
+        for kind, name, version in con.execute("SELECT kind, name, version FROM refs"):
+            versioning[kind][name] = version
+        data["versioning"] = versioning
+
+        data["CityObjects"] = SQLiteMapping(con, "objects")
+
+        self._vertices = [list(row) for row in
+                          con.execute("SELECT x, y, z FROM vertices ORDER BY id")]
+        self._vertex_count = len(self._vertices)
+        data["vertices"] = self._vertices
+
+        return data
+
+    def save(self, data: dict, ref_updates: dict = None):
+        """Saves the data of a versioned city model in the database.
+
+        Tables whose content was replaced (e.g. by a plain dict or list) or
+        comes from another storage are written in full. If the refs that
+        changed since the model was loaded are given, as (kind, name) pairs
+        with the version they pointed to, only those refs are written, and
+        only if they still point there and no vertices were added by another
+        process. Otherwise, the transaction is rolled back."""
+        con = self._connection
+        versioning = data["versioning"]
+
+        with con:
+            # Locks the database for writing until the end of the transaction
+            con.execute("BEGIN IMMEDIATE")
+            if ref_updates is not None:
+                self._check_updates(ref_updates, data["vertices"])
+
+            con.execute("DELETE FROM meta")
+            con.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                ((key, json.dumps(value)) for key, value in data.items()
+                 if key not in ("CityObjects", "vertices", "versioning")))
+            con.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                ("versioning", json.dumps({key: value for key, value in versioning.items()
+                                           if key not in ("versions", "branches", "tags")})))
+
+            if ref_updates is None:
+                con.execute("DELETE FROM refs")
+                for kind in ["branches", "tags"]:
+                    con.executemany(
+                        "INSERT INTO refs (kind, name, version) VALUES (?, ?, ?)",
+                        ((kind, name, version) for name, version in versioning[kind].items()))
+            else:
+                for kind, name in ref_updates:
+                    con.execute("DELETE FROM refs WHERE kind = ? AND name = ?", (kind, name))
+                    if name in versioning[kind]:
+                        con.execute("INSERT INTO refs (kind, name, version) VALUES (?, ?, ?)",
+                                    (kind, name, versioning[kind][name]))
+
+            self._save_mapping(versioning["versions"], "versions")
+            self._save_mapping(data["CityObjects"], "objects")
+            self._save_vertices(data["vertices"])
+
+    def _check_updates(self, ref_updates: dict, vertices):
+        """Raises an error if a ref or the vertices were changed by another
+        process since the model was loaded."""
+        con = self._connection
+        for (kind, name), expected in ref_updates.items():
+            row = con.execute("SELECT version FROM refs WHERE kind = ? AND name = ?",
+                              (kind, name)).fetchone()
+            actual = None if row is None else row[0]
+            if actual != expected:
+                raise RefConflict(name, expected, actual)
+
+        count = con.execute("SELECT COUNT(*) FROM vertices").fetchone()[0]
+        if vertices is self._vertices and count != self._vertex_count:
+            raise ConcurrentUpdate("The vertices were changed by another process.")
+
+    def _save_mapping(self, mapping, table):
+        """Saves the rows of a mapping in the given table."""
+        con = self._connection
+        if isinstance(mapping, SQLiteMapping) and mapping._connection is con:
+            mapping.flush()
+            return
+
+        con.execute(f"DELETE FROM {table}")
+        con.executemany(
+            f"INSERT INTO {table} (hash, data) VALUES (?, ?)",
+            ((key, json.dumps(value)) for key, value in mapping.items()))
+
+    def _save_vertices(self, vertices):
+        """Saves the vertices, appending only the new ones if the list is the
+        same that was loaded."""
+        con = self._connection
+        if vertices is self._vertices:
+            start = self._vertex_count
+        else:
+            con.execute("DELETE FROM vertices")
+            start = 0
+
+        con.executemany(
+            "INSERT INTO vertices (id, x, y, z) VALUES (?, ?, ?, ?)",
+            ((i, *vertices[i]) for i in range(start, len(vertices))))
+
+        self._vertices = vertices
+        self._vertex_count = len(vertices)
+
+    def close(self):
+        """Closes the connection to the database."""
+        self._connection.close()
+
+def is_database(filename: str) -> bool:
+    """Returns True if the filename is a versioned city model database."""
+    return filename.endswith(".cjvdb")
+
+def create_database(filename: str) -> 'SQLiteStorage':
+    """Returns the storage of a new, empty database at the given path."""
+    if os.path.exists(filename):
+        os.remove(filename)
+    return SQLiteStorage(filename)
@@ -0,0 +1,139 @@
+"""Module with repositories whose city objects are split in spatial tiles.
+
+A tiled repository is a directory with a versioned CityJSON file per tile
+(in 'tiles/') and a shared ref store ('refs.json'), which maps every branch
+and tag to the head version of each of its tiles.
+"""
+
+import json
+import math
+import os
+
+from cityjson.locking import file_lock
+from cityjson.spatial import get_bbox
+
+REFS_FILENAME = "refs.json"
+TILES_DIRNAME = "tiles"
+
+class TiledRepository:
+    """Class that represents a versioned city model split in square tiles.
+
+    Every object belongs to the tile of the center of its bbox, so tiles can
+    be committed to and checked out independently. Only the ref store is
+    shared, and it's only locked while the heads of a ref are updated. It
+    also keeps how far objects reach out of their tiles, so the tiles of a
+    bbox include those with objects that overlap it.
+    """
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._refs = self.load_refs()
+
+    @classmethod
+    def create(cls, directory: str, tile_size: float) -> 'TiledRepository':
+        """Creates an empty repository in a directory."""
+        os.makedirs(os.path.join(directory, TILES_DIRNAME), exist_ok=True)
+        refs_path = os.path.join(directory, REFS_FILENAME)
+        if not os.path.exists(refs_path):
+            with open(refs_path, "w", encoding="UTF-8") as refs_file:
+                json.dump({"tile_size": tile_size, "branches": {}, "tags": {}},
+                          refs_file)
+        return cls(directory)
+
+    @staticmethod
+    def is_repository(path: str) -> bool:
+        """Returns True if the path is the directory of a tiled repository."""
+        return os.path.isfile(os.path.join(path, REFS_FILENAME))
+
+    @property
+    def directory(self):
+        """Returns the directory of the repository."""
+        return self._directory
+
+    @property
+    def refs_path(self):
+        """Returns the path of the ref store."""
+        return os.path.join(self._directory, REFS_FILENAME)
+
+    @property
+    def tile_size(self):
+        """Returns the size of the tiles."""
+        return self._refs["tile_size"]
+
+    @property
+    def margin(self):
+        """Returns how far the objects reach out of their tiles (the largest
+        half size of their bboxes)."""
+        return self._refs.get("margin", 0)
+
+    def load_refs(self) -> dict:
+        """Reads the ref store."""
+        with open(self.refs_path, encoding="UTF-8") as refs_file:
+            return json.load(refs_file)
+
+    def get_tile_path(self, tile_id: str) -> str:
+        """Returns the path of the versioned file of a tile."""
+        return os.path.join(self._directory, TILES_DIRNAME, tile_id + ".json")
+
+    def get_tile_id(self, x: float, y: float) -> str:
+        """Returns the id of the tile of a point."""
+        return "{}_{}".format(math.floor(x / self.tile_size),
+                              math.floor(y / self.tile_size))
+
+    def get_tiles_in_bbox(self, bbox: list) -> set:
+        """Returns the ids of the tiles that can have objects that overlap a
+        2D bbox, given as [minx, miny, maxx, maxy].
+
+        The bbox is widened by the margin, as an object that overlaps it can
+        have its center (and thus its tile) out of it."""
+        margin = self.margin
+        minx, miny = bbox[0] - margin, bbox[1] - margin
+        maxx, maxy = bbox[2] + margin, bbox[3] + margin
+        return {"{}_{}".format(col, row)
+                for col in range(math.floor(minx / self.tile_size),
+                                 math.floor(maxx / self.tile_size) + 1)
+                for row in range(math.floor(miny / self.tile_size),
+                                 math.floor(maxy / self.tile_size) + 1)}
+
+    def split_objects(self, citymodel):
+        """Returns the ids of the objects of a city model per tile id, and
+        the largest half size of their bboxes.
+
+        Objects without vertices go to the tile of the origin."""
+        coords = citymodel.coordinates_transformer.decode_many(citymodel["vertices"])
+
+        result = {}
+        margin = 0
+        for obj_id, obj in citymodel["CityObjects"].items():
+            bbox = get_bbox(obj, coords)
+            if bbox is None:
+                tile_id = self.get_tile_id(0, 0)
+            else:
+                tile_id = self.get_tile_id((bbox[0] + bbox[3]) / 2,
+                                           (bbox[1] + bbox[4]) / 2)
+                margin = max(margin, (bbox[3] - bbox[0]) / 2, (bbox[4] - bbox[1]) / 2)
+            result.setdefault(tile_id, []).append(obj_id)
+        return result, float(margin)
+
+    def get_heads(self, ref: str) -> dict:
+        """Returns the head version of every tile of a branch or tag."""
+        if ref in self._refs["branches"]:
+            return self._refs["branches"][ref]
+        if ref in self._refs["tags"]:
+            return self._refs["tags"][ref]
+        raise KeyError(f"Ref '{ref}' does not exist.")
+
+    def update_heads(self, branch: str, heads: dict, margin: float = 0):
+        """Sets the head versions of some tiles of a branch, and extends the
+        margin of the repository to the given one.
+
+        The ref store is read again under its lock, so the heads of other
+        tiles that were updated in the meantime are kept."""
+        with file_lock(self.refs_path):
+            self._refs = self.load_refs()
+            self._refs["branches"].setdefault(branch, {}).update(heads)
+            if margin > self.margin:
+                self._refs["margin"] = margin
+            with open(self.refs_path + ".tmp", "w", encoding="UTF-8") as refs_file:
+                json.dump(self._refs, refs_file)
+            os.replace(self.refs_path + ".tmp", self.refs_path)
@@ -1,13 +1,35 @@
 """Module that contains logic to handle versioned CityJSON files"""
 
 import abc
+import collections
+import copy
 import datetime
 import hashlib
+import itertools
 import json
+import os.path
 from typing import Dict, List
 
 from colorama import Fore, Style
-from cityjson.citymodel import CityJSON, CityObject
+from cityjson.citymodel import CityJSON, CityObject, CityObjectDict, LazyCityObject
+from cityjson.diffcache import DiffCache, get_cache_path
+from cityjson.geometry import get_max_index, shift_geometries
+from cityjson.index import (HistoryIndex, TypeIndex, get_history_index_path,
+                            get_type_index_path)
+from cityjson.journal import Journal, get_journal_path
+from cityjson.locking import ConcurrentUpdate, RefConflict, file_lock
+from cityjson.merkle import ObjectsTree, TreeIndex, get_tree_index_path
+from cityjson.pack import PackFile
+from cityjson.spatial import GridIndex, get_index_path
+from cityjson.storage import SQLiteStorage, create_database, is_database
+
+# The function that returns the path of the sidecar file of every index
+INDEX_PATHS = {
+    GridIndex: get_index_path,
+    TypeIndex: get_type_index_path,
+    HistoryIndex: get_history_index_path,
+    TreeIndex: get_tree_index_path
+}
 
 empty_vcityjson = {
     "type": "CityJSON",
@@ -34,26 +56,457 @@ class Hashable(abc.ABC):
 
     def hash(self):
         """Computes the hash of the objects."""
-        encoded = json.dumps(self.data).encode('utf-8')
-        m = hashlib.new('sha1')
-        m.update(encoded)
+        return get_hash(self.data)
 
-        return m.hexdigest()
+def get_hash(data) -> str:
+    """Returns the hash of the JSON of some data."""
+    encoded = json.dumps(data).encode('utf-8')
+    m = hashlib.new('sha1')
+    m.update(encoded)
+
+    return m.hexdigest()
 
 class VersionedCityJSON(CityJSON):
     """Class that represents a versioned CityJSON file."""
 
     def __init__(self, data: dict = None):
         if data is None:
-            self._citymodel = empty_vcityjson.copy()
-        else:
-            super(VersionedCityJSON, self).__init__(data)
+            data = copy.deepcopy(empty_vcityjson)
+        super(VersionedCityJSON, self).__init__(data)
+        self._objects_cache = ObjectsMapCache()
+        self._trees_cache = ObjectsMapCache()
+        self._packs = {}
+        self._storage = None
+        self._indexes = {}
+        self._loaded_state = None
+
+    @classmethod
+    def from_file(cls, filename: str):
+        """Loads a versioned CityJSON from a given file or database."""
+        if not is_database(filename):
+            # Taken before reading, so a write in between is never missed
+            stat = os.stat(filename)
+            result = super(VersionedCityJSON, cls).from_file(filename)
+            journal_size = Journal(get_journal_path(filename)).replay(result._citymodel)
+            result._loaded_state = result.get_loaded_state(stat, journal_size)
+            return result
+
+        storage = SQLiteStorage(filename)
+        result = cls(storage.load())
+        result._storage = storage
+        result._filename = filename
+        result._loaded_state = result.get_loaded_state()
+        return result
+
+    @property
+    def objects_cache(self) -> 'ObjectsMapCache':
+        """Returns the cache of resolved objects maps of versions."""
+        return self._objects_cache
+
+    @property
+    def trees_cache(self) -> 'ObjectsMapCache':
+        """Returns the cache of Merkle trees of the objects maps of versions."""
+        return self._trees_cache
+
+    @property
+    def diff_cache(self) -> DiffCache:
+        """Returns the cache of diffs next to the versioned file, or None if
+        the city model has no file yet."""
+        if self._filename is None:
+            return None
+        return DiffCache(get_cache_path(self._filename))
 
     @property
     def versioning(self):
         """Returns the versioning aspect of CityJSON"""
         return Versioning(self, self._citymodel["versioning"])
 
+    def get_pack_path(self, pack_name):
+        """Returns the path of a pack file, which is stored relative to the
+        versioned file."""
+        if self._filename is None:
+            return pack_name
+        return os.path.join(os.path.dirname(self._filename), pack_name)
+
+    @property
+    def packs(self) -> List[PackFile]:
+        """Returns the pack files of the city model."""
+        result = []
+        for pack_name in self._citymodel["versioning"].get("packs", []):
+            path = self.get_pack_path(pack_name)
+            if path not in self._packs:
+                self._packs[path] = PackFile(path)
+            result.append(self._packs[path])
+        return result
+
+    def set_packs(self, packs: List[PackFile]):
+        """Updates the pack files of the city model."""
+        for pack in self._packs.values():
+            if pack not in packs:
+                pack.close()
+        self._packs = {pack.filename: pack for pack in packs}
+
+        base = "." if self._filename is None else os.path.dirname(self._filename)
+        self._citymodel["versioning"]["packs"] = [os.path.relpath(pack.filename, base)
+                                                  for pack in packs]
+        if len(packs) == 0:
+            del self._citymodel["versioning"]["packs"]
+
+    @property
+    def cityobjects(self):
+        """Returns the city objects, including the packed ones."""
+        return CityObjectDict(self._citymodel["CityObjects"], self.packs)
+
+    def get_index(self, index_class, *args, save: bool = True):
+        """Returns an index of the city model, after updating it with the
+        given arguments.
+
+        Every index is kept in a sidecar file next to the versioned file,
+        which is loaded the first time the index is needed. The file is saved
+        again when something was added to the index, unless save is False
+        (then it's saved along with the versioned file)."""
+        index = self._indexes.get(index_class)
+        if index is None:
+            index = index_class()
+            if self._filename is not None:
+                path = INDEX_PATHS[index_class](self._filename)
+                if os.path.exists(path):
+                    index = index_class.load(path)
+            self._indexes[index_class] = index
+
+        added = index.update(*args)
+        if added > 0 and save and self._filename is not None:
+            index.save(INDEX_PATHS[index_class](self._filename))
+
+        return index
+
+    def has_index(self, index_class) -> bool:
+        """Returns True if the index is loaded or has a sidecar file."""
+        return (index_class in self._indexes or
+                (self._filename is not None and
+                 os.path.exists(INDEX_PATHS[index_class](self._filename))))
+
+    def get_spatial_index(self, keys=None) -> GridIndex:
+        """Returns the spatial index of the city objects, after indexing the
+        objects with the given keys (or all of them) if they are not yet."""
+        cityobjects = self.cityobjects
+        return self.get_index(GridIndex,
+                              cityobjects if keys is None else keys,
+                              cityobjects,
+                              self._citymodel["vertices"],
+                              self._citymodel.get("transform"))
+
+    def get_type_index(self, keys=None) -> TypeIndex:
+        """Returns the type index of the city objects, after indexing the
+        objects with the given keys (or all of them) if they are not yet."""
+        cityobjects = self.cityobjects
+        return self.get_index(TypeIndex, cityobjects if keys is None else keys, cityobjects)
+
+    def get_history_index(self) -> HistoryIndex:
+        """Returns the history index of the objects, after indexing the
+        versions that are not indexed yet."""
+        return self.get_index(HistoryIndex, self.versioning.versions)
+
+    def update_history_index(self):
+        """Adds the new versions to the history index, if the city model has
+        one, so it's saved along with them instead of when it's next read."""
+        if self.has_index(HistoryIndex):
+            self.get_index(HistoryIndex, self.versioning.versions, save=False)
+
+    def get_cached_tree(self, name: str) -> ObjectsTree:
+        """Returns the Merkle tree of a version from the cache or, with only
+        its bucket hashes, from the tree index. Returns None if it's in
+        neither."""
+        if name in self._trees_cache:
+            return self._trees_cache[name]
+        if not self.has_index(TreeIndex):
+            return None
+        return self.get_index(TreeIndex, {}, save=False).get_tree(name)
+
+    def update_tree_index(self):
+        """Puts the cached Merkle trees of the versions of branches and tags
+        in the tree index, and drops the others, so it's saved along with the
+        versioned file."""
+        versioning = self._citymodel["versioning"]
+        if versioning.get("hash_scheme") != "merkle":
+            return
+
+        heads = set(versioning["branches"].values()).union(versioning["tags"].values())
+        trees = {name: self._trees_cache[name] for name in heads
+                 if name in self._trees_cache}
+        if len(trees) > 0 or self.has_index(TreeIndex):
+            self.get_index(TreeIndex, trees, heads, save=False)
+
+    def clear_indexes(self):
+        """Drops the indexes (and their sidecar files), the diff cache and
+        the caches of objects maps, after the city objects were renamed.
+        They are built again when they are needed."""
+        self._indexes = {}
+        self._objects_cache.clear()
+        self._trees_cache.clear()
+        if self._filename is None:
+            return
+
+        for get_path in INDEX_PATHS.values():
+            if os.path.exists(get_path(self._filename)):
+                os.remove(get_path(self._filename))
+        self.diff_cache.clear()
+
+    def get_loaded_state(self, stat=None, journal_size=None) -> dict:
+        """Returns what concurrent writes to the file of the city model are
+        checked against: its refs, number of vertices, objects and versions,
+        and the status of the file and the size of its journal (the current
+        ones, unless they're given)."""
+        versioning = self._citymodel["versioning"]
+        state = {
+            "filename": os.path.abspath(self._filename),
+            "branches": dict(versioning["branches"]),
+            "tags": dict(versioning["tags"]),
+            "vertices": len(self._citymodel["vertices"]),
+            "objects": len(self._citymodel["CityObjects"]),
+            "versions": len(versioning["versions"]),
+            "head": self.get_head_fingerprint(),
+            "stat": None,
+            "journal": journal_size
+        }
+        if stat is None and os.path.isfile(self._filename):
+            stat = os.stat(self._filename)
+        if stat is not None:
+            state["stat"] = (stat.st_mtime_ns, stat.st_size)
+        if journal_size is None:
+            journal_path = get_journal_path(self._filename)
+            state["journal"] = (os.path.getsize(journal_path)
+                                if os.path.isfile(journal_path) else 0)
+        return state
+
+    def get_head_fingerprint(self) -> str:
+        """Returns the JSON of everything but the objects, vertices, versions
+        and refs, which can't be changed by a record of the journal."""
+        head = {key: value for key, value in self._citymodel.items()
+                if key not in ("CityObjects", "vertices", "versioning")}
+        head["versioning"] = {key: value
+                              for key, value in self._citymodel["versioning"].items()
+                              if key not in ("versions", "branches", "tags")}
+        return json.dumps(head, sort_keys=True)
+
+    def is_changed_on_disk(self, filename) -> bool:
+        """Returns True if the file (or its journal) was changed since the
+        city model was loaded from it."""
+        stat = os.stat(filename)
+        journal_path = get_journal_path(filename)
+        journal_size = os.path.getsize(journal_path) if os.path.isfile(journal_path) else 0
+        return ((stat.st_mtime_ns, stat.st_size) != self._loaded_state["stat"] or
+                journal_size != self._loaded_state["journal"])
+
+    def get_journal_record(self) -> dict:
+        """Returns the changes since the city model was loaded as a record of
+        the journal, or None if they can't be stored as one (because more
+        than new objects, versions, vertices and refs changed)."""
+        state = self._loaded_state
+        data = self._citymodel
+        versioning = data["versioning"]
+        if (len(data["vertices"]) < state["vertices"] or
+                len(data["CityObjects"]) < state["objects"] or
+                len(versioning["versions"]) < state["versions"] or
+                self.get_head_fingerprint() != state["head"]):
+            return None
+
+        # New keys are always at the end, as dicts keep the insertion order
+        record = {
+            "vertices_start": state["vertices"],
+            "vertices": data["vertices"][state["vertices"]:],
+            "CityObjects": dict(itertools.islice(data["CityObjects"].items(),
+                                                 state["objects"], None)),
+            "versions": dict(itertools.islice(versioning["versions"].items(),
+                                              state["versions"], None))
+        }
+        for (kind, name), _ in self.get_ref_updates().items():
+            record.setdefault(kind, {})[name] = versioning[kind].get(name)
+        return record
+
+    def get_ref_updates(self) -> dict:
+        """Returns the refs that changed since the city model was loaded, as
+        (kind, name) pairs with the version they pointed to (or None)."""
+        if self._loaded_state is None:
+            return {}
+
+        versioning = self._citymodel["versioning"]
+        result = {}
+        for kind in ["branches", "tags"]:
+            loaded = self._loaded_state[kind]
+            for name in set(loaded) | set(versioning[kind]):
+                if loaded.get(name) != versioning[kind].get(name):
+                    result[(kind, name)] = loaded.get(name)
+        return result
+
+    def merge_file(self, filename):
+        """Adds the versions, objects and refs of the file, as changed by
+        other processes since it was loaded, to the city model.
+
+        Every ref that was changed here must still point to the version it
+        pointed to when the file was loaded (compare-and-swap), otherwise a
+        RefConflict is raised. The vertices added here are moved after the
+        ones added by others, and the new objects are renumbered. Since keys
+        are hashes of the content, the renumbered objects and the new
+        versions that use them are renamed."""
+        with open(filename, encoding="UTF-8") as infile:
+            disk = json.load(infile)
+        Journal(get_journal_path(filename)).replay(disk)
+
+        ref_updates = self.get_ref_updates()
+        for (kind, name), expected in ref_updates.items():
+            actual = disk["versioning"][kind].get(name)
+            if actual != expected:
+                raise RefConflict(name, expected, actual)
+
+        count = self._loaded_state["vertices"]
+        vertices = self._citymodel["vertices"]
+        disk_vertices = disk["vertices"]
+        if (len(disk_vertices) < count or disk_vertices[:count] != vertices[:count] or
+                (count > 0 and disk.get("transform") != self._citymodel.get("transform"))):
+            raise ConcurrentUpdate("The vertices were changed by another process.")
+        offset = len(disk_vertices) - count
+
+        # Only the objects added here can use the new vertices, and they are
+        # at the end, as dicts keep the insertion order
+        keypairs = {}
+        for key, obj in itertools.islice(self._citymodel["CityObjects"].items(),
+                                         self._loaded_state["objects"], None):
+            if offset > 0 and get_max_index(obj.get("geometry", [])) >= count:
+                obj = copy.deepcopy(obj)
+                shift_geometries(obj["geometry"], count, offset)
+                keypairs[key] = get_hash(obj)
+                key = keypairs[key]
+            if key not in disk["CityObjects"]:
+                disk["CityObjects"][key] = obj
+        disk_vertices.extend(vertices[count:])
+
+        disk_versions = disk["versioning"]["versions"]
+        new_versions = [key for key in self._citymodel["versioning"]["versions"]
+                        if key not in disk_versions]
+        for key in new_versions:
+            disk_versions[key] = self._citymodel["versioning"]["versions"][key]
+
+        for (kind, name), _ in ref_updates.items():
+            if name in self._citymodel["versioning"][kind]:
+                disk["versioning"][kind][name] = self._citymodel["versioning"][kind][name]
+            else:
+                disk["versioning"][kind].pop(name, None)
+
+        self._citymodel = disk
+        # The indexes are loaded again from the files the other process saved
+        self._indexes = {}
+        self._objects_cache.clear()
+        self._trees_cache.clear()
+        if any(key != new_key for key, new_key in keypairs.items()):
+            self.rename_versions(new_versions, keypairs)
+
+    def rename_versions(self, names: list, keypairs: dict):
+        """Replaces the keys of renamed objects in the objects maps of the
+        given versions, and renames them after their new hashes.
+
+        The versions must be given with the parents before their children,
+        as they were added."""
+        versioning = self._citymodel["versioning"]
+        versions = versioning["versions"]
+        renamed = {}
+        for name in names:
+            data = versions.pop(name)
+            if "objects_delta" in data:
+                maps = [data["objects_delta"]["added"], data["objects_delta"]["changed"]]
+            else:
+                maps = [data["objects"]]
+            for objects in maps:
+                for obj_id, key in objects.items():
+                    objects[obj_id] = keypairs.get(key, key)
+            if "parents" in data:
+                data["parents"] = [renamed.get(parent, parent) for parent in data["parents"]]
+
+            new_name = Version(self.versioning, data, name).hash()
+            versions[new_name] = data
+            renamed[name] = new_name
+
+        for kind in ["branches", "tags"]:
+            for ref, name in versioning[kind].items():
+                versioning[kind][ref] = renamed.get(name, name)
+        self._objects_cache.clear()
+        self._trees_cache.clear()
+
+    def save(self, filename, append: bool = False):
+        """Saves the versioned CityJSON in a file, or in a database if the
+        filename has the '.cjvdb' extension.
+
+        The file is locked while it's saved. If it's the file the city model
+        was loaded from and another process changed it in the meantime, its
+        changes are merged first (see merge_file). The paths of the pack files
+        are updated to be relative to the new location, and the indexes (if
+        loaded) are saved next to it.
+
+        With append, the changes are appended to the journal of the file
+        instead of rewriting it, if it's the file the city model was loaded
+        from and only objects, versions, vertices and refs were added or
+        moved. Otherwise, the whole file is written and its journal removed."""
+        same_file = (self._loaded_state is not None and
+                     self._loaded_state["filename"] == os.path.abspath(filename))
+
+        with file_lock(filename):
+            if same_file and not is_database(filename) and os.path.isfile(filename):
+                if self.is_changed_on_disk(filename):
+                    self.merge_file(filename)
+                    append = False
+            else:
+                append = False
+
+            packs = self.packs
+            self._filename = filename
+            if len(packs) > 0:
+                self.set_packs(packs)
+            if HistoryIndex in self._indexes:
+                self._indexes[HistoryIndex].update(self.versioning.versions)
+            self.update_tree_index()
+            for index_class, index in self._indexes.items():
+                index.save(INDEX_PATHS[index_class](filename))
+
+            if not (append and self.append_journal(filename)):
+                self.write(filename, same_file)
+
+            self._loaded_state = self.get_loaded_state()
+
+    def write(self, filename, same_file: bool):
+        """Writes the whole versioned CityJSON to a file or a database."""
+        if is_database(filename):
+            if (self._storage is None or
+                    os.path.abspath(self._storage.filename) != os.path.abspath(filename)):
+                self._storage = create_database(filename)
+                same_file = False
+            self._storage.save(self._citymodel,
+                               self.get_ref_updates() if same_file else None)
+            return
+
+        data = self._citymodel.copy()
+        data["CityObjects"] = dict(data["CityObjects"])
+        data["versioning"] = data["versioning"].copy()
+        data["versioning"]["versions"] = dict(data["versioning"]["versions"])
+        # Written to a temporary file first, so readers never see a partial file
+        with open(filename + ".tmp", "w", encoding="UTF-8") as outfile:
+            json.dump(data, outfile)
+        os.replace(filename + ".tmp", filename)
+        # The journal is now in the file, and replaying it again has no
+        # effect if it can't be removed
+        Journal(get_journal_path(filename)).remove()
+
+    def append_journal(self, filename) -> bool:
+        """Appends the changes since the city model was loaded to the journal
+        of its file, and returns False if they can't be stored as a record."""
+        record = self.get_journal_record()
+        if record is None:
+            return False
+
+        if (len(record["vertices"]) > 0 or len(record["CityObjects"]) > 0 or
+                len(record["versions"]) > 0 or "branches" in record or "tags" in record):
+            Journal(get_journal_path(filename)).append(record)
+        return True
+
 class Versioning:
     """Class that represents the versioning aspect of a CityJSON file."""
 
@@ -115,10 +568,54 @@ class Versioning:
                     in self._json["versions"].items()}
         return versions
 
+    @property
+    def keyframe_interval(self):
+        """Returns the number of versions between full objects maps, or None
+        if objects maps are not delta-encoded."""
+        return self._json.get("keyframe_interval")
+
+    @keyframe_interval.setter
+    def keyframe_interval(self, value):
+        """Updates the number of versions between full objects maps."""
+        if value is None:
+            self._json.pop("keyframe_interval", None)
+        else:
+            self._json["keyframe_interval"] = value
+
+    @property
+    def hash_scheme(self):
+        """Returns how versions are hashed: 'legacy' (over their full JSON) or
+        'merkle' (over the root of the Merkle tree of their objects map)."""
+        return self._json.get("hash_scheme", "legacy")
+
+    @hash_scheme.setter
+    def hash_scheme(self, value):
+        """Updates how versions are hashed."""
+        if value not in ("legacy", "merkle"):
+            raise ValueError(f"Unknown hash scheme '{value}'.")
+        if value == "legacy":
+            self._json.pop("hash_scheme", None)
+        else:
+            self._json["hash_scheme"] = value
+
     def add_version(self, new_version: 'Version'):
-        """Adds version to the city model."""
+        """Adds version to the city model.
+
+        If the versioning uses delta-encoded objects maps, the version only
+        stores the differences to its first parent, unless it's time for a
+        keyframe."""
         if new_version.name is None:
             new_version.name = new_version.hash()
+
+        interval = self.keyframe_interval
+        if (interval is not None and new_version.has_parents() and
+                not new_version.is_delta_encoded()):
+            parent = new_version.parents[0]
+            if parent.delta_depth + 1 < interval:
+                objects = new_version.objects
+                new_version.encode_objects_delta(parent)
+                self._citymodel.objects_cache[new_version.name] = objects
+
         self._json["versions"][new_version.name] = new_version.data
 
     @property
@@ -153,11 +650,12 @@ class Version(Hashable):
                  version_name: str = None):
         self._versioning = versioning
         self._date_format = "%Y-%m-%dT%H:%M:%S.%fZ"
+        self._changed_ids = None
         if data is None:
             self._json = {
                 "objects": {}
             }.copy()
-        elif isinstance(data["objects"], list):
+        elif isinstance(data.get("objects"), list):
             raise Exception("This is an old versioning file!")
         else:
             self._json = data
@@ -167,6 +665,11 @@ class Version(Hashable):
         else:
             self._version_name = version_name
 
+    @property
+    def versioning(self) -> 'Versioning':
+        """Returns the versioning that the version belongs to."""
+        return self._versioning
+
     @property
     def name(self):
         """Returns the id of this version."""
@@ -223,13 +726,183 @@ class Version(Hashable):
         else:
             self._json["parents"].append(value.name)
 
+    def is_delta_encoded(self):
+        """Returns 'True' if the objects map is stored as a delta to the first
+        parent, otherwise 'False'."""
+        return "objects_delta" in self._json
+
+    @property
+    def delta_depth(self):
+        """Returns the number of delta-encoded versions since the last version
+        with a full objects map."""
+        depth = 0
+        version = self
+        while version.is_delta_encoded():
+            depth += 1
+            version = version.parents[0]
+
+        return depth
+
+    @property
+    def objects(self) -> Dict[str, str]:
+        """Returns the map of original object ids to versioned object ids.
+
+        Delta-encoded maps are resolved through the cache of the city model,
+        starting from the closest version already resolved or keyframe. The
+        returned dict must not be modified."""
+        if not self.is_delta_encoded():
+            return self._json["objects"]
+
+        cache = self._versioning.citymodel.objects_cache
+        if self.name in cache:
+            return cache[self.name]
+
+        chain = []
+        version = self
+        while version.is_delta_encoded() and version.name not in cache:
+            chain.append(version)
+            version = version.parents[0]
+
+        if version.is_delta_encoded():
+            objects = cache[version.name]
+        else:
+            objects = version.data["objects"]
+
+        for version in reversed(chain):
+            delta = version.data["objects_delta"]
+            objects = objects.copy()
+            for obj_id in delta["removed"]:
+                del objects[obj_id]
+            objects.update(delta["changed"])
+            objects.update(delta["added"])
+            cache[version.name] = objects
+
+        return objects
+
+    def encode_objects_delta(self, parent: 'Version'):
+        """Replaces the objects map with its differences to the parent's."""
+        objects = self.objects
+        parent_objects = parent.objects
+
+        delta = {
+            "added": {},
+            "changed": {},
+            "removed": [obj_id for obj_id in parent_objects
+                        if obj_id not in objects]
+        }
+        for obj_id, vobj_id in objects.items():
+            if obj_id not in parent_objects:
+                delta["added"][obj_id] = vobj_id
+            elif parent_objects[obj_id] != vobj_id:
+                delta["changed"][obj_id] = vobj_id
+
+        self._json = {("objects_delta" if k == "objects" else k):
+                      (delta if k == "objects" else v)
+                      for k, v in self._json.items()}
+
+    def decode_objects_delta(self):
+        """Replaces the delta of the objects map with the full map."""
+        objects = dict(self.objects)
+        self._json = {("objects" if k == "objects_delta" else k):
+                      (objects if k == "objects_delta" else v)
+                      for k, v in self._json.items()}
+
+    def set_changed_ids(self, changed_ids):
+        """Sets the ids of the objects that were added, changed or removed
+        since the first parent, when the command that creates the version
+        already knows them, so the objects maps don't have to be compared."""
+        self._changed_ids = changed_ids
+
+    def get_objects_tree(self) -> ObjectsTree:
+        """Returns the Merkle tree of the objects map.
+
+        If the tree of the first parent is cached, or saved in the tree index
+        of the file, only the buckets of the objects that changed since the
+        parent are hashed. Otherwise, the tree is built from the whole
+        objects map."""
+        citymodel = self._versioning.citymodel
+        cache = citymodel.trees_cache
+        # Versions that are not named yet don't have a tree in the cache
+        name = self.name if isinstance(self.name, str) else None
+        if name is not None and name in cache:
+            return cache[name]
+
+        objects = self.objects
+        tree = None
+        parent_tree = None
+        if self.has_parents():
+            parent_tree = citymodel.get_cached_tree(self._json["parents"][0])
+        if parent_tree is not None:
+            parent = self.parents[0]
+            if self.is_delta_encoded():
+                delta = self._json["objects_delta"]
+                changed = itertools.chain(delta["added"], delta["changed"], delta["removed"])
+            elif self._changed_ids is not None:
+                changed = self._changed_ids
+            else:
+                parent_objects = parent.objects
+                changed = [obj_id for obj_id, vobj_id in objects.items()
+                           if parent_objects.get(obj_id) != vobj_id]
+                changed.extend(obj_id for obj_id in parent_objects
+                               if obj_id not in objects)
+            tree = parent_tree.update(objects, changed)
+
+        if tree is None:
+            tree = ObjectsTree.from_objects(objects)
+        if name is not None:
+            cache[name] = tree
+
+        return tree
+
+    def hash(self):
+        """Computes the hash of the version.
+
+        The hash is always computed over the full objects map, so that it
+        doesn't depend on how the map is stored. With the 'merkle' scheme, the
+        map is replaced by the root of its Merkle tree."""
+        if self._versioning.hash_scheme == "merkle":
+            tree = self.get_objects_tree()
+            content = {("objects_root" if k in ("objects", "objects_delta") else k):
+                       (tree.root if k in ("objects", "objects_delta") else v)
+                       for k, v in self._json.items()}
+            encoded = json.dumps(content).encode('utf-8')
+            m = hashlib.new('sha1')
+            m.update(encoded)
+
+            # Versions are named after their hash, so this is the key of the
+            # tree when the version is added
+            self._versioning.citymodel.trees_cache[m.hexdigest()] = tree
+            return m.hexdigest()
+
+        if not self.is_delta_encoded():
+            return super().hash()
+
+        content = {("objects" if k == "objects_delta" else k):
+                   (self.objects if k == "objects_delta" else v)
+                   for k, v in self._json.items()}
+        encoded = json.dumps(content).encode('utf-8')
+        m = hashlib.new('sha1')
+        m.update(encoded)
+
+        return m.hexdigest()
+
     @property
     def versioned_objects(self) -> List['VersionedCityObject']:
         """Returns a list of versioned city objects."""
+        return self.get_versioned_objects()
+
+    def get_versioned_objects(self, object_ids=None) -> List['VersionedCityObject']:
+        """Returns a list of versioned city objects, only with the given
+        original ids (if provided)."""
         cm = self._versioning.citymodel
 
+        objects = self.objects
+        if object_ids is not None:
+            objects = {obj_id: objects[obj_id] for obj_id in object_ids
+                       if obj_id in objects}
+
         result = []
-        for obj_id, vobj_id in self._json["objects"].items():
+        for obj_id, vobj_id in objects.items():
             if vobj_id not in cm.cityobjects:
                 print("  Object '%s' not found! Skipping..." % vobj_id)
                 continue
@@ -240,6 +913,20 @@ class Version(Hashable):
 
         return result
 
+    def get_objects_in_bbox(self, bbox: list) -> set:
+        """Returns the original ids of the objects that intersect a 2D bbox,
+        given as [minx, miny, maxx, maxy]."""
+        objects = self.objects
+        index = self._versioning.citymodel.get_spatial_index(objects.values())
+        keys = index.query(bbox)
+        return {obj_id for obj_id, key in objects.items() if key in keys}
+
+    def get_objects_of_type(self, types) -> set:
+        """Returns the original ids of the objects with one of the types."""
+        objects = self.objects
+        index = self._versioning.citymodel.get_type_index(objects.values())
+        return index.select(objects, types)
+
     def add_cityobject(self, value: 'VersionedCityObject'):
         """Adds the provided versioned city object to the version."""
         self._json["objects"][value.original_cityobject.name] = value.name
@@ -276,14 +963,40 @@ class Version(Hashable):
 
     def __repr__(self):
         repr_dict = self._json.copy()
-        del repr_dict["objects"]
+        repr_dict.pop("objects", None)
+        repr_dict.pop("objects_delta", None)
         return str(repr_dict)
 
+class ObjectsMapCache:
+    """Class that keeps the most recently resolved objects maps of versions."""
+
+    def __init__(self, max_size: int = 16):
+        self._max_size = max_size
+        self._maps = collections.OrderedDict()
+
+    def __contains__(self, version_name):
+        return version_name in self._maps
+
+    def __getitem__(self, version_name):
+        self._maps.move_to_end(version_name)
+        return self._maps[version_name]
+
+    def __setitem__(self, version_name, objects):
+        self._maps[version_name] = objects
+        self._maps.move_to_end(version_name)
+        while len(self._maps) > self._max_size:
+            self._maps.popitem(last=False)
+
+    def clear(self):
+        """Removes all maps from the cache."""
+        self._maps.clear()
+
 class VersionedCityObject(Hashable):
     """Class that represents a versioned city object."""
 
     def __init__(self, cityobject: 'CityObject', name: str = None):
         self._cityobject = cityobject
+        self._hash = None
         if name is None:
             self._name = self.hash()
         else:
@@ -301,6 +1014,13 @@ class VersionedCityObject(Hashable):
         h = m.hexdigest()
         return int(h, 16)
 
+    def hash(self):
+        """Computes the hash of the object, only once per instance."""
+        if self._hash is None:
+            self._hash = super().hash()
+
+        return self._hash
+
     @property
     def original_cityobject(self) -> 'CityObject':
         """Returns the original city object."""
@@ -316,58 +1036,146 @@ class VersionedCityObject(Hashable):
         return self._name
 
 class SimpleVersionDiff:
-    """Class that implements the calculation of a diff of two versions."""
+    """Class that implements the calculation of a diff of two versions.
 
-    def __init__(self, source_version: 'Version', dest_version: 'Version'):
+    The diff is computed on the objects maps of the versions, so the city
+    objects are only read when they are used from the result. If a cache is
+    given, the id maps of the diff are looked up and stored there.
+    """
+
+    def __init__(self, source_version: 'Version', dest_version: 'Version',
+                 object_ids=None, cache: DiffCache = None):
         self._source_version = source_version
         self._dest_version = dest_version
-        self._result = VersionsDiffResult()
-
-    def compute(self) -> 'VersionsDiffResult':
-        """Computes the diff of the provided versions."""
-
-        new_objects = (set(self._dest_version.versioned_objects) -
-                       set(self._source_version.versioned_objects))
-
-        old_objects = (set(self._source_version.versioned_objects) -
-                       set(self._dest_version.versioned_objects))
+        self._object_ids = object_ids
+        self._cache = cache
+
+    def get_objects(self, version: 'Version') -> Dict[str, str]:
+        """Returns the objects map of a version (only for the given original
+        object ids, if any)."""
+        objects = version.objects
+        if self._object_ids is None:
+            return objects
+        return {obj_id: objects[obj_id] for obj_id in self._object_ids
+                if obj_id in objects}
+
+    def _use_cache(self):
+        """Returns True if the id maps of the diff can be cached."""
+        return (self._cache is not None and self._object_ids is None and
+                self._source_version.name is not None and
+                self._dest_version.name is not None)
+
+    def _classify(self):
+        """Yields a (status, original id, source hash, dest hash) record per
+        added, changed or removed object, comparing the objects maps."""
+        source_objects = self.get_objects(self._source_version)
+        dest_objects = self.get_objects(self._dest_version)
+
+        for obj_id, obj_hash in dest_objects.items():
+            old_hash = source_objects.get(obj_id)
+            if old_hash is None:
+                yield "added", obj_id, None, obj_hash
+            elif old_hash != obj_hash:
+                yield "changed", obj_id, old_hash, obj_hash
+        for obj_id, obj_hash in source_objects.items():
+            if obj_id not in dest_objects:
+                yield "removed", obj_id, obj_hash, None
+
+    def iter_changes(self):
+        """Yields a (status, original id, source hash, dest hash) record per
+        added, changed or removed object, as soon as it's classified.
+
+        The status is 'added', 'changed' or 'removed' and the missing hash of
+        added and removed objects is None. The city objects are not read."""
+        use_cache = self._use_cache()
+        if use_cache:
+            result = self._cache.get(self._source_version.name,
+                                     self._dest_version.name)
+            if result is not None:
+                for obj_id, (old_hash, new_hash) in result["changed"].items():
+                    yield "changed", obj_id, old_hash, new_hash
+                for obj_id, obj_hash in result["added"].items():
+                    yield "added", obj_id, None, obj_hash
+                for obj_id, obj_hash in result["removed"].items():
+                    yield "removed", obj_id, obj_hash, None
+                return
+
+        result = {"changed": {}, "added": {}, "removed": {}}
+        for record in self._classify():
+            if use_cache:
+                add_record(result, record)
+            yield record
+
+        if use_cache:
+            self._cache.put(self._source_version.name,
+                            self._dest_version.name,
+                            result)
+
+    def compute_ids(self) -> dict:
+        """Computes the id maps of the diff: 'changed' maps the original ids
+        to the [source, dest] object hashes, while 'added' and 'removed' map
+        them to the object hash."""
+        use_cache = self._use_cache()
+        if use_cache:
+            result = self._cache.get(self._source_version.name,
+                                     self._dest_version.name)
+            if result is not None:
+                return result
+
+        result = {"changed": {}, "added": {}, "removed": {}}
+        for record in self._classify():
+            add_record(result, record)
+
+        if use_cache:
+            self._cache.put(self._source_version.name,
+                            self._dest_version.name,
+                            result)
 
-        same_objects = (set(self._dest_version.versioned_objects).intersection(
-                        set(self._source_version.versioned_objects)))
-
-        new_names = {obj.original_cityobject.name: obj
-                     for obj in new_objects}
-        old_names = {obj.original_cityobject.name: obj
-                     for obj in old_objects}
+        return result
 
-        # new_objects might contain changed ones
-        common_names = set(obj.original_cityobject.name for obj in new_objects
-                           if obj.original_cityobject.name in old_names)
+    def get_object(self, obj_id: str, obj_hash: str) -> 'VersionedCityObject':
+        """Returns a versioned city object that is only read when used."""
+        cityobjects = self._dest_version.versioning.citymodel.cityobjects
+        return VersionedCityObject(LazyCityObject(cityobjects, obj_hash, obj_id),
+                                   obj_hash)
 
-        new_objects = set(obj for obj in new_objects
-                          if obj.original_cityobject.name not in common_names)
-        old_objects = set(obj for obj in old_objects
-                          if obj.original_cityobject.name not in common_names)
+    def compute(self) -> 'VersionsDiffResult':
+        """Computes the diff of the provided versions (only for the given
+        original object ids, if any)."""
+        ids = self.compute_ids()
+        get_object = self.get_object
 
         result = VersionsDiffResult()
 
-        for obj_id in common_names:
+        for obj_id, (old_hash, new_hash) in ids["changed"].items():
             result.changed[obj_id] = {
-                "source": old_names[obj_id],
-                "dest": new_names[obj_id]
+                "source": get_object(obj_id, old_hash),
+                "dest": get_object(obj_id, new_hash)
             }
 
-        for obj in new_objects:
-            result.added[obj.original_cityobject.name] = obj
+        for obj_id, obj_hash in ids["added"].items():
+            result.added[obj_id] = get_object(obj_id, obj_hash)
 
-        for obj in old_objects:
-            result.removed[obj.original_cityobject.name] = obj
+        for obj_id, obj_hash in ids["removed"].items():
+            result.removed[obj_id] = get_object(obj_id, obj_hash)
 
-        for obj in same_objects:
-            result.unchanged[obj.original_cityobject.name] = obj
+        for obj_id, obj_hash in self.get_objects(self._dest_version).items():
+            if obj_id not in ids["changed"] and obj_id not in ids["added"]:
+                result.unchanged[obj_id] = get_object(obj_id, obj_hash)
 
         return result
 
+def add_record(result: dict, record: tuple):
+    """Adds a (status, original id, source hash, dest hash) record to the id
+    maps of a diff."""
+    status, obj_id, old_hash, new_hash = record
+    if status == "changed":
+        result["changed"][obj_id] = [old_hash, new_hash]
+    elif status == "added":
+        result["added"][obj_id] = new_hash
+    else:
+        result["removed"][obj_id] = old_hash
+
 class VersionsDiffResult:
     """Class that represents a versions' diff result."""
 
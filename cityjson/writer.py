@@ -0,0 +1,109 @@
+"""Module that writes CityJSON files with the objects serialized in parallel."""
+
+import concurrent.futures
+import itertools
+import json
+
+import numpy as np
+
+from cityjson.geometry import get_used_vertices as get_geometries_used_vertices
+from cityjson.geometry import remap_geometries
+
+# Vertices are much smaller than objects, so they are serialized in larger
+# shards, of this many vertices
+VERTEX_SHARD_SIZE = 100000
+
+# The new index of every vertex of the pool, set in every worker process
+_newids = None
+
+def init_worker(newids):
+    """Sets the new vertex indices for the shards of a worker process."""
+    global _newids
+    _newids = newids
+
+def serialize_objects(objects: list) -> str:
+    """Returns the (id, object) pairs of a shard as the members of a JSON
+    object, without the braces."""
+    if _newids is not None:
+        remap_geometries((g for _, obj in objects for g in obj.get("geometry", [])),
+                         _newids)
+    return json.dumps(dict(objects))[1:-1]
+
+def serialize_vertices(vertices: list) -> str:
+    """Returns a list of vertices as JSON, without the brackets."""
+    return json.dumps(vertices)[1:-1]
+
+def get_used_vertices(objects) -> np.ndarray:
+    """Returns the sorted indices of the vertices used by the objects."""
+    return get_geometries_used_vertices(g for obj in objects
+                                        for g in obj.get("geometry", []))
+
+class ParallelWriter:
+    """Class that writes a CityJSON file with a pool of worker processes.
+
+    The objects are split in shards of a number of objects, which are
+    serialized by the workers and written in order. At most two shards per
+    worker are in flight at once, so the shard size sets how much memory the
+    serialized objects take.
+    """
+
+    def __init__(self, jobs: int, shard_size: int = 1000):
+        self._jobs = jobs
+        self._shard_size = shard_size
+
+    def get_shards(self, items, size):
+        """Yields lists of up to size items."""
+        iterator = iter(items)
+        while True:
+            shard = list(itertools.islice(iterator, size))
+            if len(shard) == 0:
+                return
+            yield shard
+
+    def map_shards(self, executor, function, shards):
+        """Yields the results of a function over the shards in order, with
+        a bounded number of shards in flight."""
+        pending = []
+        for shard in shards:
+            pending.append(executor.submit(function, shard))
+            if len(pending) >= 2 * self._jobs:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+    def write(self, filename: str, citymodel: dict, objects, vertices: list,
+              used: np.ndarray = None):
+        """Writes a city model with the given (id, object) pairs and vertices.
+
+        If the indices of the used vertices are given, only those vertices
+        are written and the objects are renumbered accordingly."""
+        newids = None
+        if used is not None:
+            mapping = np.full(len(vertices), -1, dtype=np.int64)
+            mapping[used] = np.arange(len(used))
+            newids = mapping
+            vertices = [vertices[i] for i in used.tolist()]
+
+        head = {key: value for key, value in citymodel.items()
+                if key not in ("CityObjects", "vertices")}
+
+        with concurrent.futures.ProcessPoolExecutor(self._jobs,
+                                                    initializer=init_worker,
+                                                    initargs=(newids, )) as executor, \
+                open(filename, "w", encoding="UTF-8") as outfile:
+            outfile.write(json.dumps(head)[:-1])
+            outfile.write(', "CityObjects": {' if len(head) > 0 else '"CityObjects": {')
+            separator = ""
+            for fragment in self.map_shards(executor, serialize_objects,
+                                            self.get_shards(objects, self._shard_size)):
+                if len(fragment) > 0:
+                    outfile.write(separator + fragment)
+                    separator = ", "
+
+            outfile.write('}, "vertices": [')
+            separator = ""
+            for fragment in self.map_shards(executor, serialize_vertices,
+                                            self.get_shards(vertices, VERTEX_SHARD_SIZE)):
+                outfile.write(separator + fragment)
+                separator = ", "
+            outfile.write(']}')
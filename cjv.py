@@ -1,12 +1,18 @@
 """Main module that defines the cjv command-line logic."""
 
+import glob
 import os.path
 import sys
 
 import click
 
 import commands
+import utils
 from cityjson.citymodel import CityJSON
+from cityjson.filters import AttributeFilter
+from cityjson.locking import ConcurrentUpdate
+from cityjson.seq import SeqReader, is_seq_file
+from cityjson.tiles import TiledRepository
 from cityjson.versioning import VersionedCityJSON
 
 
@@ -35,7 +41,8 @@ def cli(context, v_cityjson):
     """A tool to create and manipulate versioned CityJSON
     files.
 
-    V_CITYJSON can be either a versioned CityJSON file or the word 'init'.
+    V_CITYJSON can be either a versioned CityJSON file, a versioned city
+    model database ('.cjvdb') or the word 'init'.
     """
 
     context.obj = {"filename": v_cityjson}
@@ -43,19 +50,37 @@ def cli(context, v_cityjson):
 @cli.result_callback()
 def process_pipeline(processor, v_cityjson):
     """Process the input versioned CityJSON file."""
-    if v_cityjson == "init":
-        citymodel = VersionedCityJSON()
-    else:
-        if not os.path.isfile(v_cityjson):
-            click.secho("ERROR: This file does not exist!", fg="red")
+    if getattr(processor, "takes_path", False):
+        # The command works on a regular CityJSON file or a tiled repository
+        processor(v_cityjson)
+        return
+
+    # A command is run again on the new state of the file if another process
+    # changed it in a way that can't be merged, as many times as it allows
+    attempts = getattr(processor, "retries", 0) + 1
+    for attempt in range(attempts):
+        if v_cityjson == "init":
+            citymodel = VersionedCityJSON()
+        else:
+            if not os.path.isfile(v_cityjson):
+                click.secho("ERROR: This file does not exist!", fg="red")
+                sys.exit()
+            citymodel = VersionedCityJSON.from_file(v_cityjson)
+
+        if "versioning" not in citymodel:
+            click.secho("The file provided is not a versioned CityJSON!", fg="red")
             sys.exit()
-        citymodel = VersionedCityJSON.from_file(v_cityjson)
-
-    if "versioning" not in citymodel:
-        click.secho("The file provided is not a versioned CityJSON!", fg="red")
-        sys.exit()
 
-    processor(citymodel)
+        try:
+            processor(citymodel)
+            return
+        except ConcurrentUpdate as error:
+            if attempt + 1 < attempts:
+                click.secho("{} Trying again...".format(error), fg="yellow")
+                continue
+            click.secho("ERROR: {} Nothing was saved, run the command again."
+                        .format(error), fg="red")
+            sys.exit(1)
 
 @cli.command()
 @click.argument('refs', nargs=-1)
@@ -80,38 +105,209 @@ def log(refs, graph):
               show_default=True,
               help='property name of the original city object id')
 @click.option('--no_objectid', is_flag=True)
-def checkout(ref, output, objectid_property, no_objectid):
+@click.option('--format', 'output_format',
+              type=click.Choice(['json', 'jsonl', 'npz', 'arrow']),
+              default='json',
+              show_default=True,
+              help='format of the output file')
+@click.option('--bbox', type=float, nargs=4, default=None,
+              metavar='MINX MINY MAXX MAXY',
+              help='only extract the objects that intersect the bbox')
+@click.option('--type', 'types', multiple=True,
+              help='only extract the objects of this type (can be repeated)')
+@click.option('--where', multiple=True,
+              help="only extract the objects whose attributes match 'key op value' "
+                   "(can be repeated)")
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              show_default=True,
+              help='number of processes that write the objects of a JSON file')
+@click.option('--shard-size', type=click.IntRange(min=1), default=1000,
+              show_default=True,
+              help='number of objects written by a process at once')
+def checkout(ref, output, objectid_property, no_objectid, output_format, bbox,
+             types, where, jobs, shard_size):
     """Extract a version from a specific commit.
 
     REF is a ref to a commit (id, tag or branch name).
-    OUTPUT is the path of the output CityJSON."""
+    OUTPUT is the path of the output CityJSON (or CityJSONSeq, NumPy or Arrow
+    file), or '-' to write a CityJSONSeq to the standard output."""
+    try:
+        filters = [AttributeFilter.parse(text) for text in where]
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="'--where'")
+
+    if output == '-' or is_seq_file(output):
+        output_format = 'jsonl'
+
     def processor(citymodel):
         command = commands.CheckoutCommand(citymodel, ref, output)
         command.set_objectid_property(objectid_property)
         if no_objectid:
             command.set_objectid_property(None)
+        command.set_format(output_format)
+        if bbox:
+            command.set_bbox(list(bbox))
+        command.set_types(types)
+        command.set_filters(filters)
+        command.set_jobs(jobs, shard_size)
         command.execute()
     return processor
 
 @cli.command()
 @click.argument('dest_ref')
 @click.argument('source_ref')
-def diff(dest_ref, source_ref):
+@click.option('--bbox', type=float, nargs=4, default=None,
+              metavar='MINX MINY MAXX MAXY',
+              help='only compare the objects that intersect the bbox')
+@click.option('--detailed', is_flag=True,
+              help='show the changed attributes and surfaces of every object')
+@click.option('--format', 'output_format', type=click.Choice(['text', 'jsonl']),
+              default='text',
+              help='print colored text or a JSON record per changed object')
+def diff(dest_ref, source_ref, bbox, detailed, output_format):
     """Show the differences between two commits."""
     def processor(citymodel):
         command = commands.DiffCommand(citymodel, dest_ref, source_ref)
+        if bbox:
+            command.set_bbox(list(bbox))
+        command.set_detailed(detailed)
+        command.set_format(output_format)
         command.execute()
     return processor
 
+@cli.command()
+@click.argument('object_id')
+@click.argument('ref', required=False, default='main')
+def blame(object_id, ref):
+    """Show the versions that added, changed or removed a city object.
+
+    OBJECT_ID is the original id of the city object.
+    REF is the ref to look back from (default is 'main')."""
+    def processor(citymodel):
+        command = commands.BlameCommand(citymodel, object_id, ref)
+        command.execute()
+    return processor
+
+@cli.command(name='format-patch')
+@click.argument('source_ref')
+@click.argument('dest_ref')
+@click.argument('output')
+def format_patch(source_ref, dest_ref, output):
+    """Save the changes from one version to another as a patch.
+
+    OUTPUT is a JSON file with the added and changed city objects (with only
+    their vertices) and the ids of the removed ones."""
+    def processor(citymodel):
+        command = commands.FormatPatchCommand(citymodel, source_ref, dest_ref, output)
+        command.execute()
+    return processor
+
+@cli.command()
+@click.argument('patch')
+@click.option('-o', '--output', help='the output file (default is the input)')
+@click.pass_context
+def apply(context, patch, output):
+    """Apply a patch to a regular CityJSON file.
+
+    In this case, V_CITYJSON is the checkout of the source version of the
+    patch."""
+    if output is None:
+        output = context.obj["filename"]
+    def processor(filename):
+        command = commands.ApplyPatchCommand(filename, patch, output)
+        command.execute()
+    processor.takes_path = True
+    return processor
+
 @cli.command()
 @click.argument("output", required=False)
+@click.option("--scheme", type=click.Choice(["legacy", "merkle"]), default="legacy",
+              help="How version ids are hashed: over the full version or "
+              "over the Merkle tree of its objects map.")
 @click.pass_context
-def rehash(context, output):
+def rehash(context, output, scheme):
     """Recalculate all object and commit ids as hashes."""
     if output is None:
         output = context.obj["filename"]
     def processor(citymodel):
-        command = commands.RehashCommand(citymodel, output)
+        command = commands.RehashCommand(citymodel, output, scheme)
+        command.execute()
+    return processor
+
+@cli.command()
+@click.argument("output")
+def convert(output):
+    """Save the versioned city model as a JSON file or a SQLite database.
+
+    OUTPUT is a versioned CityJSON file or, if it has the '.cjvdb'
+    extension, a SQLite database.
+    """
+    def processor(citymodel):
+        command = commands.ConvertCommand(citymodel, output)
+        command.execute()
+    return processor
+
+@cli.command()
+@click.argument("output", required=False)
+@click.pass_context
+def compact(context, output):
+    """Fold the journal of changes back into the versioned file."""
+    if output is None:
+        output = context.obj["filename"]
+    def processor(citymodel):
+        command = commands.CompactCommand(citymodel, output)
+        command.execute()
+    return processor
+
+@cli.command()
+@click.argument("output", required=False)
+@click.pass_context
+def gc(context, output):
+    """Remove versions, city objects and vertices that are not reachable from
+    any branch or tag."""
+    if output is None:
+        output = context.obj["filename"]
+    def processor(citymodel):
+        command = commands.GarbageCollectCommand(citymodel, output)
+        command.execute()
+    return processor
+
+@cli.command()
+@click.argument("output", required=False)
+@click.option('--compression',
+              type=click.Choice(['zlib', 'zstd']),
+              default='zlib',
+              show_default=True,
+              help='compression of the packed objects')
+@click.pass_context
+def repack(context, output, compression):
+    """Move the city objects of older versions to a compressed pack file."""
+    if output is None:
+        output = context.obj["filename"]
+    def processor(citymodel):
+        command = commands.RepackCommand(citymodel, output, compression)
+        command.execute()
+    return processor
+
+@cli.command()
+@click.argument("output", required=False)
+@click.option('--keyframe-interval',
+              default=50,
+              show_default=True,
+              help='number of versions between full objects maps')
+@click.option('--full', is_flag=True, help='store all objects maps in full')
+@click.pass_context
+def delta(context, output, keyframe_interval, full):
+    """Store the objects maps of versions as deltas to their first parent.
+
+    From now on, new versions will be stored the same way.
+    """
+    if output is None:
+        output = context.obj["filename"]
+    if full:
+        keyframe_interval = None
+    def processor(citymodel):
+        command = commands.DeltaEncodeCommand(citymodel, keyframe_interval, output)
         command.execute()
     return processor
 
@@ -121,9 +317,26 @@ def rehash(context, output):
 @click.option('-a', '--author', prompt='Provide your name', help='name of the author')
 @click.option('-m', '--message', help='decsription of the changes')
 @click.option('-o', '--output')
+@click.option('--batch', is_flag=True,
+              help='treat NEW_VERSION as a glob of files to commit in sequence')
+@click.option('--sort-by',
+              type=click.Choice(['name', 'date']),
+              default='name',
+              show_default=True,
+              help='order of the files committed with --batch')
+@click.option('--partial', is_flag=True,
+              help='NEW_VERSION only has the added and changed objects')
+@click.option('--delete', 'deleted', multiple=True, metavar='OBJECT_ID',
+              help='remove an object in a partial commit (can be repeated)')
+@click.option('--retries', type=click.IntRange(min=0), default=0, show_default=True,
+              help='times to commit again if another process moved the branch')
 @click.pass_context
-def commit(context, new_version, ref, author, message, output):
+def commit(context, new_version, ref, author, message, output, batch, sort_by,
+           partial, deleted, retries):
     """Add a new version to the history based on the NEW_VERSION CityJSON file.
+
+    NEW_VERSION can also be a CityJSONSeq ('.jsonl') file, or '-' to read a
+    CityJSONSeq from the standard input.
     """
     if output is None:
         output = context.obj["filename"]
@@ -132,17 +345,144 @@ def commit(context, new_version, ref, author, message, output):
         if message is None:
             click.echo("No message provided. Doei!")
             quit()
-    new_citymodel = CityJSON.from_file(new_version)
+
+    if batch:
+        filenames = glob.glob(new_version)
+        if sort_by == 'date':
+            filenames.sort(key=os.path.getmtime)
+        else:
+            filenames.sort()
+        if len(filenames) == 0:
+            click.secho("ERROR: No files match '{}'!".format(new_version), fg="red")
+            sys.exit()
+
+        def batch_processor(citymodel):
+            command = commands.BatchCommitCommand(citymodel,
+                                                  filenames,
+                                                  ref,
+                                                  author,
+                                                  message)
+            command.execute()
+
+            click.echo("Saving {}...".format(output))
+            citymodel.save(output, append=True)
+        return batch_processor
+
     def processor(citymodel):
+        if new_version == '-' or is_seq_file(new_version):
+            # The features are read line by line while committing
+            infile = (sys.stdin if new_version == '-'
+                      else open(new_version, encoding="UTF-8"))
+            new_citymodel = SeqReader(infile)
+        else:
+            infile = None
+            new_citymodel = CityJSON.from_file(new_version)
+
         command = commands.CommitCommand(citymodel,
                                          new_citymodel,
                                          ref,
                                          author,
                                          message)
+        command.set_partial(partial or len(deleted) > 0)
+        command.set_deleted(deleted)
+        command.execute()
+        if infile is not None and infile is not sys.stdin:
+            infile.close()
+
+        click.echo("Saving {}...".format(output))
+        citymodel.save(output, append=True)
+    # The standard input can't be read again
+    processor.retries = retries if new_version != '-' else 0
+    return processor
+
+@cli.command(name='tile-commit')
+@click.argument('new_version')
+@click.argument('ref', required=False, default='main')
+@click.option('-a', '--author', prompt='Provide your name', help='name of the author')
+@click.option('-m', '--message', help='decsription of the changes')
+@click.option('--tile-size', type=float, default=1000.0, show_default=True,
+              help='size of the tiles of a new repository')
+@click.option('--partial', is_flag=True,
+              help='keep the objects of the tiles that are not in NEW_VERSION')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              show_default=True,
+              help='number of tiles committed at the same time')
+def tile_commit(new_version, ref, author, message, tile_size, partial, jobs):
+    """Add a version of every tile with objects in the NEW_VERSION CityJSON.
+
+    In this case, V_CITYJSON is the directory of a tiled repository, which is
+    created if it doesn't exist."""
+    if message is None:
+        message = click.edit('Write your message here')
+        if message is None:
+            click.echo("No message provided. Doei!")
+            quit()
+
+    def processor(directory):
+        if TiledRepository.is_repository(directory):
+            repository = TiledRepository(directory)
+        else:
+            repository = TiledRepository.create(directory, tile_size)
+
+        command = commands.TileCommitCommand(repository,
+                                             CityJSON.from_file(new_version),
+                                             ref,
+                                             author,
+                                             message)
+        command.set_partial(partial)
+        command.set_jobs(jobs)
+        command.execute()
+    processor.takes_path = True
+    return processor
+
+@cli.command(name='tile-checkout')
+@click.argument('ref')
+@click.argument('output')
+@click.option('--bbox', type=float, nargs=4, default=None,
+              metavar='MINX MINY MAXX MAXY',
+              help='only extract the objects that intersect the bbox')
+def tile_checkout(ref, output, bbox):
+    """Extract a version from the tiles of a tiled repository.
+
+    In this case, V_CITYJSON is the directory of a tiled repository.
+    REF is a branch or tag of the repository."""
+    def processor(directory):
+        if not TiledRepository.is_repository(directory):
+            click.secho("ERROR: This is not a tiled repository!", fg="red")
+            sys.exit()
+
+        command = commands.TileCheckoutCommand(TiledRepository(directory), ref, output)
+        if bbox:
+            command.set_bbox(list(bbox))
+        command.execute()
+    processor.takes_path = True
+    return processor
+
+@cli.command(name='import')
+@click.argument('change_log')
+@click.argument('ref', required=False, default='main')
+@click.option('-a', '--author', prompt='Provide your name', help='name of the author')
+@click.option('-o', '--output')
+@click.pass_context
+def import_changes(context, change_log, ref, author, output):
+    """Add versions to the history from a log of object changes.
+
+    CHANGE_LOG is a CSV, JSON or JSON Lines file with records of 'id',
+    'timestamp' and 'geometry'. Every timestamp becomes a version.
+    """
+    if output is None:
+        output = context.obj["filename"]
+
+    records = utils.load_change_log(change_log)
+    def processor(citymodel):
+        command = commands.ImportChangeLogCommand(citymodel,
+                                                  records,
+                                                  ref,
+                                                  author)
         command.execute()
 
         click.echo("Saving {}...".format(output))
-        citymodel.save(output)
+        citymodel.save(output, append=True)
     return processor
 
 def print_branches(ctx, param, value):
@@ -215,7 +555,7 @@ def merge(context, source_branch, dest_branch, author, output):
                                                 output)
         command.execute()
 
-        citymodel.save(output)
+        citymodel.save(output, append=True)
 
     return processor
 
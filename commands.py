@@ -1,7 +1,13 @@
 """Module with the commands that are run through the cjv cli."""
 
+import concurrent.futures
+import contextlib
+import copy
 import datetime
+import itertools
 import json
+import os.path
+import sys
 
 import networkx as nx
 # Code to have colors at the console output
@@ -12,8 +18,14 @@ from graph import GraphHistoryLog, History, SimpleHistoryLog
 from cityjson.versioning import VersionedCityJSON, SimpleVersionDiff, VersionedCityObject
 import cityjson.versioning as cjv
 import cityjson.citymodel as cjm
-
-from deepdiff import DeepDiff, Delta
+from cityjson.columnar import ColumnarVersion
+from cityjson.journal import Journal, get_journal_path
+from cityjson.objectdiff import ObjectDiff, describe_paths
+from cityjson.pack import PackFile
+from cityjson.seq import SeqReader, SeqWriter, is_seq_file
+from cityjson.locking import file_lock
+from cityjson.tiles import TiledRepository
+from cityjson.writer import ParallelWriter, get_used_vertices
 
 init()
 
@@ -60,13 +72,97 @@ class CheckoutCommand:
         self._version = version_name
         self._output = output_file
         self._objectid_property = "cityobject_id"
+        self._format = "json"
+        self._bbox = None
+        self._types = []
+        self._filters = []
+        self._jobs = 1
+        self._shard_size = 1000
 
     def set_objectid_property(self, property_name):
         """Updates the property that represents the original object's name."""
         self._objectid_property = property_name
 
+    def set_format(self, output_format):
+        """Updates the format of the output ('json', 'jsonl', 'npz' or 'arrow')."""
+        self._format = output_format
+
+    def set_bbox(self, bbox):
+        """Restricts the checkout to the objects that intersect a 2D bbox."""
+        self._bbox = bbox
+
+    def set_jobs(self, jobs, shard_size=1000):
+        """Sets the number of processes that serialize the objects of a JSON
+        checkout, in shards of the given number of objects."""
+        self._jobs = jobs
+        self._shard_size = shard_size
+
+    def set_types(self, types):
+        """Restricts the checkout to the objects of the given types."""
+        self._types = list(types)
+
+    def set_filters(self, filters):
+        """Restricts the checkout to the objects that match all the given
+        attribute filters."""
+        self._filters = list(filters)
+
+    def select_objects(self, version):
+        """Returns the original ids of the objects to extract from the
+        version, or None for all of them.
+
+        Types and the bbox are looked up in the indexes, so the attributes are
+        only read for the objects that are left."""
+        object_ids = None
+        if len(self._types) > 0:
+            object_ids = version.get_objects_of_type(self._types)
+        if self._bbox is not None:
+            in_bbox = version.get_objects_in_bbox(self._bbox)
+            object_ids = in_bbox if object_ids is None else object_ids & in_bbox
+        if len(self._filters) > 0:
+            cityobjects = self._citymodel.cityobjects
+            objects = version.objects
+            object_ids = {obj_id for obj_id in (objects if object_ids is None else object_ids)
+                          if objects[obj_id] in cityobjects and
+                          all(f.matches(cityobjects[objects[obj_id]]) for f in self._filters)}
+        return object_ids
+
+    def write_seq(self, version, object_ids, stream):
+        """Writes the objects of a version as a CityJSONSeq, a feature at a
+        time as every object is resolved."""
+        cm = self._citymodel
+
+        header = {"type": "CityJSON", "version": cjm.min_cityjson["version"]}
+        if "transform" in cm:
+            header["transform"] = cm["transform"]
+        header["CityObjects"] = {}
+        header["vertices"] = []
+        writer = SeqWriter(stream, header)
+
+        objects = version.objects
+        cityobjects = cm.cityobjects
+        vertices = cm.data["vertices"]
+        for obj_id in (objects if object_ids is None else object_ids):
+            if objects[obj_id] not in cityobjects:
+                print("  Object '%s' not found! Skipping..." % objects[obj_id])
+                continue
+            writer.write_object(obj_id, cityobjects[objects[obj_id]].data, vertices)
+
+        print("Written {} features.".format(writer.count))
+
     def execute(self):
-        """Executes the checkout command."""
+        """Executes the checkout command.
+
+        If the output is '-', the version is written to the standard output
+        and the messages to the standard error."""
+        if self._output == "-":
+            stream = sys.stdout
+            with contextlib.redirect_stdout(sys.stderr):
+                self.extract(stream)
+        else:
+            self.extract()
+
+    def extract(self, stream=None):
+        """Extracts the version to the output file, or to the given stream."""
         cm = self._citymodel
         ref = self._version
         output_file = self._output
@@ -79,12 +175,67 @@ class CheckoutCommand:
 
         new_model = cjm.min_cityjson.copy()
         print("Extracting version '%s'..." % version.name)
-        new_objects = version.versioned_objects
+        object_ids = self.select_objects(version)
+        if object_ids is not None:
+            print("Found {} matching objects...".format(len(object_ids)))
+
+        if self._format == "jsonl":
+            if stream is not None:
+                self.write_seq(version, object_ids, stream)
+            else:
+                print("Saving {0}...".format(output_file))
+                with open(output_file, "w", encoding="UTF-8") as outfile:
+                    self.write_seq(version, object_ids, outfile)
+            print("Done!")
+            return
+
+        new_objects = version.get_versioned_objects(object_ids)
+
+        if self._format != "json":
+            columns = ColumnarVersion(((obj.original_cityobject.name,
+                                        obj.original_cityobject.data)
+                                       for obj in new_objects),
+                                      cm.data["vertices"],
+                                      cm.data.get("transform"))
+            print("Saving {0}...".format(output_file))
+            if self._format == "arrow":
+                columns.save_arrow(output_file)
+            else:
+                columns.save_npz(output_file)
+            print("Done!")
+            return
+
+        if "transform" in cm:
+            new_model["transform"] = cm["transform"]
+
+        if self._jobs > 1:
+            used = None
+            if object_ids is not None:
+                used = get_used_vertices(obj.original_cityobject.data
+                                         for obj in new_objects)
+            print("Saving {0} with {1} processes...".format(output_file, self._jobs))
+            writer = ParallelWriter(self._jobs, self._shard_size)
+            writer.write(output_file,
+                         new_model,
+                         ((obj.original_cityobject.name, obj.original_cityobject.data)
+                          for obj in new_objects),
+                         cm.data["vertices"],
+                         used)
+            print("Done!")
+            return
 
         new_model["CityObjects"] = {obj.original_cityobject.name:
                                     obj.original_cityobject.data
                                     for obj in new_objects}
-        new_model["vertices"] = cm.data["vertices"]
+        if object_ids is None:
+            new_model["vertices"] = cm.data["vertices"]
+        else:
+            # Only the vertices of the objects are kept
+            new_model["CityObjects"] = copy.deepcopy(new_model["CityObjects"])
+            new_model["vertices"] = utils.compact_vertices(
+                (g for obj in new_model["CityObjects"].values()
+                 for g in obj.get("geometry", [])),
+                cm.data["vertices"])
 
         print("Saving {0}...".format(output_file))
         utils.save_cityjson(new_model, output_file)
@@ -97,6 +248,24 @@ class DiffCommand:
         self._citymodel = citymodel
         self._new_version = new_version
         self._old_version = old_version
+        self._bbox = None
+        self._detailed = False
+        self._format = "text"
+
+    def set_bbox(self, bbox):
+        """Restricts the diff to the objects that intersect a 2D bbox (in
+        either version)."""
+        self._bbox = bbox
+
+    def set_format(self, output_format):
+        """Sets the output format: 'text' or 'jsonl' (a JSON record per
+        added, changed or removed object)."""
+        self._format = output_format
+
+    def set_detailed(self, detailed):
+        """Sets whether the changed attributes and surfaces of every changed
+        object are printed."""
+        self._detailed = detailed
 
     def execute(self):
         """Executes the diff command."""
@@ -105,7 +274,17 @@ class DiffCommand:
         new_version = cm.versioning.get_version(self._new_version)
         old_version = cm.versioning.get_version(self._old_version)
 
-        diff = SimpleVersionDiff(old_version, new_version)
+        object_ids = None
+        if self._bbox is not None:
+            object_ids = (new_version.get_objects_in_bbox(self._bbox) |
+                          old_version.get_objects_in_bbox(self._bbox))
+
+        diff = SimpleVersionDiff(old_version, new_version, object_ids,
+                                 cache=cm.diff_cache)
+        if self._format == "jsonl":
+            self.write_records(diff)
+            return
+
         result = diff.compute()
 
         print("This is the diff between {commit_color}{new_version}"
@@ -117,16 +296,188 @@ class DiffCommand:
 
         result.print()
 
+        if self._detailed and len(result.changed) > 0:
+            object_diff = ObjectDiff()
+            print("Changed parts:\n")
+            for obj_name, objs in result.changed.items():
+                print("\t{}:".format(obj_name))
+                for line in describe_paths(object_diff.compare(objs["source"],
+                                                               objs["dest"])):
+                    print("\t\t{}".format(line))
+
+    def write_records(self, diff: SimpleVersionDiff):
+        """Writes a JSON line per added, changed or removed object to the
+        standard output, as soon as the object is classified."""
+        object_diff = ObjectDiff() if self._detailed else None
+        for status, obj_id, old_hash, new_hash in diff.iter_changes():
+            record = {"id": obj_id, "status": status,
+                      "source": old_hash, "dest": new_hash}
+            if object_diff is not None and status == "changed":
+                paths = object_diff.compare(diff.get_object(obj_id, old_hash),
+                                            diff.get_object(obj_id, new_hash))
+                record["parts"] = [list(path) for path in paths]
+            sys.stdout.write(json.dumps(record) + "\n")
+
+class FormatPatchCommand:
+    """Class that implements the format-patch command."""
+
+    def __init__(self, citymodel: 'VersionedCityJSON', source_ref, dest_ref, output_file):
+        self._citymodel = citymodel
+        self._source_ref = source_ref
+        self._dest_ref = dest_ref
+        self._output = output_file
+
+    def execute(self):
+        """Executes the format-patch command, saving the objects that were
+        added or changed from the source to the dest version (with only the
+        vertices they use) and the ids of the removed ones."""
+        cm = self._citymodel
+
+        source_version = cm.versioning.get_version(self._source_ref)
+        dest_version = cm.versioning.get_version(self._dest_ref)
+
+        diff = SimpleVersionDiff(source_version, dest_version, cache=cm.diff_cache)
+        ids = diff.compute_ids()
+
+        cityobjects = cm.cityobjects
+        new_objects = {}
+        for obj_id, (_, obj_hash) in ids["changed"].items():
+            new_objects[obj_id] = copy.deepcopy(cityobjects[obj_hash].data)
+        for obj_id, obj_hash in ids["added"].items():
+            new_objects[obj_id] = copy.deepcopy(cityobjects[obj_hash].data)
+
+        patch = {
+            "type": "CityJSONPatch",
+            "source": source_version.name,
+            "dest": dest_version.name,
+            "CityObjects": new_objects,
+            "removed": list(ids["removed"]),
+            "vertices": utils.compact_vertices((g for obj in new_objects.values()
+                                                for g in obj.get("geometry", [])),
+                                               cm.data["vertices"])
+        }
+        if "transform" in cm:
+            patch["transform"] = cm["transform"]
+
+        print("{} changed, {} added, {} removed".format(len(ids["changed"]),
+                                                        len(ids["added"]),
+                                                        len(ids["removed"])))
+        print("Saving {0}...".format(self._output))
+        utils.save_cityjson(patch, self._output)
+        print("Done!")
+
+class ApplyPatchCommand:
+    """Class that implements the apply command."""
+
+    def __init__(self, input_file, patch_file, output_file):
+        self._input = input_file
+        self._patch = patch_file
+        self._output = output_file
+        self._precision = 3
+
+    def apply(self, citymodel: 'cjm.CityJSON', patch: dict):
+        """Applies a patch to a city model in place.
+
+        The vertices of the patch are appended to the ones of the city model,
+        reusing the vertices that it already has. The vertices of the removed
+        objects are left in place."""
+        cityobjects = citymodel["CityObjects"]
+        for obj_id in patch["removed"]:
+            if cityobjects.pop(obj_id, None) is None:
+                print("Warning: removed object '{}' is not in the city model."
+                      .format(obj_id))
+
+        lookup = utils.build_vertex_lookup(citymodel["vertices"],
+                                           self._precision,
+                                           citymodel.data.get("transform"))
+        newids = utils.append_vertices(citymodel,
+                                       patch["vertices"],
+                                       lookup,
+                                       self._precision,
+                                       patch.get("transform"))
+        utils.remap_geometries((g for obj in patch["CityObjects"].values()
+                                for g in obj.get("geometry", [])),
+                               newids)
+
+        cityobjects.update(patch["CityObjects"])
+
+    def execute(self):
+        """Executes the apply command."""
+        citymodel = cjm.CityJSON(utils.load_cityjson(self._input))
+        patch = utils.load_cityjson(self._patch)
+        if patch.get("type") != "CityJSONPatch":
+            print("Oops! {} is not a patch!".format(self._patch))
+            quit()
+
+        print("Applying patch from {} to {}...".format(patch["source"], patch["dest"]))
+        self.apply(citymodel, patch)
+
+        print("Saving {0}...".format(self._output))
+        utils.save_cityjson(citymodel.data, self._output)
+        print("Done!")
+
+class BlameCommand:
+    """Class that implements the blame command."""
+
+    def __init__(self, citymodel: 'VersionedCityJSON', object_id, ref):
+        self._citymodel = citymodel
+        self._object_id = object_id
+        self._ref = ref
+
+    def execute(self):
+        """Executes the blame command, printing the versions that added,
+        changed or removed the object in the history of the ref."""
+        cm = self._citymodel
+        version = cm.versioning.get_version(self._ref)
+
+        history = History(cm)
+        history.add_versions(version.name)
+        order = {name: i for i, name in enumerate(nx.topological_sort(history.dag))}
+
+        index = cm.get_history_index()
+        transitions = sorted((t for t in index.get_transitions(self._object_id)
+                              if t[0] in order),
+                             key=lambda t: order[t[0]])
+
+        if len(transitions) == 0:
+            print("Object '{}' not found in the history of '{}'."
+                  .format(self._object_id, self._ref))
+            return
+
+        previous = None
+        for version_name, obj_hash in transitions:
+            change = cm.versioning.versions[version_name]
+            if obj_hash is None:
+                action = "{}removed{}".format(Fore.RED, Style.RESET_ALL)
+            elif previous is None:
+                action = "{}added{}".format(Fore.GREEN, Style.RESET_ALL)
+            else:
+                action = "{}changed{}".format(Fore.BLUE, Style.RESET_ALL)
+            previous = obj_hash
+
+            print("{color}{version}{reset} {date} {author}: {message}"
+                  .format(color=Fore.YELLOW,
+                          version=utils.trim_string(version_name),
+                          reset=Style.RESET_ALL,
+                          date=change.date,
+                          author=change.author,
+                          message=change.message))
+            print("\t{action}{hash}".format(
+                action=action,
+                hash="" if obj_hash is None else " ({})".format(utils.trim_string(obj_hash))))
+
 class RehashCommand:
     """Class that implements the rehash command."""
 
-    def __init__(self, citymodel: 'VersionedCityJSON', output_file):
+    def __init__(self, citymodel: 'VersionedCityJSON', output_file, scheme="legacy"):
         self._citymodel = citymodel
         self._output = output_file
+        self._scheme = scheme
 
     def execute(self):
         """Executes the rehash command."""
         cm = self._citymodel
+        versioning = cm.versioning
 
         # To keep the mapping between old and new keys
         keypairs = {}
@@ -136,60 +487,289 @@ class RehashCommand:
 
         # Re-hash the city objects
         new_cityobjects = {}
-        for obj_key, obj in cm.cityobjects.items():
+        cityobjects = cm.cityobjects
+        for obj_key in cityobjects:
             #TODO Later we'll have to do that first for the second-layer objects
             # and then for first ones
-            new_key = utils.get_hash_of_object(obj)
+            obj_data = cityobjects[obj_key].data
+            new_key = utils.get_hash_of_object(obj_data)
             print("{newkey} <- {oldkey}".format(newkey=new_key, oldkey=obj_key))
             keypairs[obj_key] = new_key
 
-            new_cityobjects[new_key] = cm.cityobjects[obj_key]
+            new_cityobjects[new_key] = obj_data
 
         print("Versions:")
 
         history = History(cm)
-        for branch, version in cm.versioning.branches.items():
+        for version in itertools.chain(versioning.branches.values(),
+                                       versioning.tags.values()):
             history.add_versions(version.name)
 
-        dag = history.dag
+        new_data = {
+            "versions": {},
+            "branches": {},
+            "tags": {}
+        }
+        new_versioning = cjv.Versioning(cm, new_data)
+        new_versioning.keyframe_interval = versioning.keyframe_interval
+        new_versioning.hash_scheme = self._scheme
+
+        versions = versioning.versions
+        for ver_key in nx.topological_sort(history.dag):
+            version = versions[ver_key]
+            objects = {obj_id: keypairs[obj_key]
+                       for obj_id, obj_key in version.objects.items()}
+
+            # Keep the order of the members, with a full objects map
+            data = {}
+            for key, value in version.data.items():
+                if key in ("objects", "objects_delta"):
+                    data["objects"] = objects
+                elif key == "parents":
+                    data["parents"] = [ver_keypairs[parent] for parent in value]
+                else:
+                    data[key] = value
+
+            new_version = cjv.Version(new_versioning, data)
+            new_version.name = new_version.hash()
+            new_versioning.add_version(new_version)
+            print("{newkey} <- {oldkey}".format(newkey=new_version.name, oldkey=ver_key))
+            ver_keypairs[ver_key] = new_version.name
+
+        for branch, version in versioning.branches.items():
+            new_data["branches"][branch] = ver_keypairs[version.name]
+
+        for tag, version in versioning.tags.items():
+            new_data["tags"][tag] = ver_keypairs[version.name]
+
+        old_packs = cm.packs
+        source = cm.filename
+        if len(old_packs) > 0:
+            cm.set_packs([])
+        cm.data["CityObjects"] = new_cityobjects
+        cm.data["versioning"] = new_data
+        cm.objects_cache.clear()
+        cm.trees_cache.clear()
 
-        new_versions = {}
-        sorted_keys = list(nx.topological_sort(dag))
-        for ver_key in sorted_keys:
-            version = cm.versioning.versions[ver_key]
-            new_objects = []
-            for obj_key in version.versioned_objects:
-                new_objects.append(keypairs[obj_key])
-            version.data["objects"] = new_objects
+        print("Saving as {0}...".format(self._output))
+        cm.save(self._output)
+        remove_replaced_packs(cm, old_packs, source)
+
+def remove_replaced_packs(citymodel, old_packs, source):
+    """Removes the old pack files that a city model no longer uses, once it
+    was saved over the file they belonged to (if it was saved elsewhere, the
+    original file still needs them)."""
+    if source is None or os.path.abspath(citymodel.filename) != os.path.abspath(source):
+        return
+
+    in_use = {os.path.abspath(pack.filename) for pack in citymodel.packs}
+    for pack in old_packs:
+        if os.path.abspath(pack.filename) not in in_use:
+            pack.remove()
+
+class GarbageCollectCommand:
+    """Class that removes versions, city objects and vertices that can't be
+    reached from any branch or tag."""
+
+    def __init__(self, citymodel: 'VersionedCityJSON', output_file):
+        self._citymodel = citymodel
+        self._output = output_file
 
-            if version.has_parents:
-                new_parents = []
-                for parent in version.parents:
-                    new_parents.append(ver_keypairs[parent.name])
-                version.data["parents"] = new_parents
+    def mark_versions(self):
+        """Returns the names of the versions that are reachable from branches
+        and tags."""
+        versioning = self._citymodel.data["versioning"]
+
+        reachable = set()
+        pending = (list(versioning["branches"].values()) +
+                   list(versioning["tags"].values()))
+        while len(pending) > 0:
+            ver_key = pending.pop()
+            if ver_key in reachable:
+                continue
+            reachable.add(ver_key)
+            pending.extend(versioning["versions"][ver_key].get("parents", []))
+
+        return reachable
+
+    def mark_objects(self, version_names):
+        """Returns the ids of the versioned objects used by the given versions.
+
+        Delta-encoded versions only need their own entries, as the rest of
+        their map comes from their (also reachable) ancestors."""
+        versions = self._citymodel.data["versioning"]["versions"]
+
+        reachable = set()
+        for ver_key in version_names:
+            version = versions[ver_key]
+            if "objects_delta" in version:
+                reachable.update(version["objects_delta"]["added"].values())
+                reachable.update(version["objects_delta"]["changed"].values())
+            else:
+                reachable.update(version["objects"].values())
+
+        return reachable
+
+    def compact_vertices(self):
+        """Keeps only the vertices used by the city objects.
+
+        Vertices are renumbered in order of first use, with the boundaries of
+        all objects remapped at once."""
+        cm = self._citymodel
+        old_count = len(cm.data["vertices"])
+
+        cityobjects = cm.data["CityObjects"]
+        objects = {obj_key: cityobjects[obj_key] for obj_key in list(cityobjects)}
+        cm.data["vertices"] = utils.compact_vertices((g for obj in objects.values()
+                                                      for g in obj.get("geometry", [])),
+                                                     cm.data["vertices"],
+                                                     first_use=True)
+        # Assigned again, in case the objects are not kept in memory
+        for obj_key, obj in objects.items():
+            cityobjects[obj_key] = obj
+
+        return old_count - len(cm.data["vertices"])
+
+    def rehash_objects(self):
+        """Renames the city objects after the hashes of their remapped
+        content, and updates the objects maps (or deltas) of the versions.
+
+        The versions keep their names, so refs and ids known to users still
+        work."""
+        cm = self._citymodel
+        keypairs = {}
+        new_cityobjects = {}
+        for obj_key, obj in cm.data["CityObjects"].items():
+            new_key = utils.get_hash_of_object(obj)
+            keypairs[obj_key] = new_key
+            new_cityobjects[new_key] = obj
+
+        def rename(objects):
+            return {obj_id: keypairs.get(obj_key, obj_key)
+                    for obj_id, obj_key in objects.items()}
+
+        # The versions are assigned again, as a database only stores those
+        versions = cm.data["versioning"]["versions"]
+        for name in list(versions):
+            version = dict(versions[name])
+            if "objects_delta" in version:
+                delta = dict(version["objects_delta"])
+                delta["added"] = rename(delta["added"])
+                delta["changed"] = rename(delta["changed"])
+                version["objects_delta"] = delta
+            else:
+                version["objects"] = rename(version["objects"])
+            versions[name] = version
+
+        cm.data["CityObjects"] = new_cityobjects
+
+        renamed = sum(1 for obj_key, new_key in keypairs.items() if obj_key != new_key)
+        # The indexes are kept by object key, so they only go stale on renames
+        if renamed > 0:
+            cm.clear_indexes()
+
+        return renamed
 
-            new_key = utils.get_hash_of_object(version.data)
-            print("{newkey} <- {oldkey}".format(newkey=new_key, oldkey=ver_key))
+    def execute(self):
+        """Executes the gc command."""
+        cm = self._citymodel
+        versions = cm.data["versioning"]["versions"]
+
+        reachable_versions = self.mark_versions()
+        unreachable_versions = [k for k in versions if k not in reachable_versions]
+        for ver_key in unreachable_versions:
+            del versions[ver_key]
+
+        reachable_objects = self.mark_objects(reachable_versions)
+        cityobjects = cm.data["CityObjects"]
+
+        # Packed objects can't be remapped in place, so the reachable ones
+        # are moved back to the file (a later repack will compress them again)
+        old_packs = cm.packs
+        source = cm.filename
+        if len(old_packs) > 0:
+            print("Unpacking objects...")
+            all_cityobjects = cm.cityobjects
+            for obj_key in reachable_objects:
+                if obj_key not in cityobjects and obj_key in all_cityobjects:
+                    cityobjects[obj_key] = all_cityobjects[obj_key].data
+            cm.set_packs([])
+
+        unreachable_objects = [k for k in cityobjects if k not in reachable_objects]
+        for obj_key in unreachable_objects:
+            del cityobjects[obj_key]
+
+        removed_vertices = self.compact_vertices()
+        # Object keys are hashes over the vertex indices, which just changed
+        renamed_objects = self.rehash_objects()
+
+        print("Removed {} versions, {} city objects and {} vertices."
+              .format(len(unreachable_versions),
+                      len(unreachable_objects),
+                      removed_vertices))
+        print("Renamed {} city objects.".format(renamed_objects))
+
+        print("Saving file at {filename}...".format(filename=self._output))
+        cm.save(self._output)
+        remove_replaced_packs(cm, old_packs, source)
 
-            new_versions[new_key] = version.data
-            ver_keypairs[ver_key] = new_key
+        print("Done! Tot ziens.")
 
-        new_branches = {}
-        for branch, version in cm.versioning.branches.items():
-            new_branches[branch] = ver_keypairs[version.name]
+class RepackCommand:
+    """Class that moves the historical city objects to a compressed pack."""
 
-        new_tags = {}
-        for tag, version in cm.versioning.tags.items():
-            new_tags[tag] = ver_keypairs[version.name]
+    def __init__(self, citymodel: 'VersionedCityJSON', output_file, compression="zlib"):
+        self._citymodel = citymodel
+        self._output = output_file
+        self._compression = compression
 
-        cm.cityobjects = new_cityobjects
-        cm.data["versioning"]["versions"] = new_versions
-        cm.data["versioning"]["branches"] = new_branches
-        cm.data["versioning"]["tags"] = new_tags
+    def execute(self):
+        """Executes the repack command.
 
-        print("Saving as {0}...".format(self._output))
-        with open(self._output, "w") as outfile:
-            json.dump(cm.data, outfile)
+        The objects of the versions pointed by branches and tags stay in the
+        file, while all others are written to a single new pack next to the
+        output file (replacing any previous packs)."""
+        cm = self._citymodel
+        versioning = cm.versioning
+
+        head_objects = set()
+        for version in (list(versioning.branches.values()) +
+                        list(versioning.tags.values())):
+            head_objects.update(version.objects.values())
+
+        inline = cm.data["CityObjects"]
+        cityobjects = cm.cityobjects
+        for obj_key in head_objects:
+            if obj_key not in inline and obj_key in cityobjects:
+                inline[obj_key] = cityobjects[obj_key].data
+
+        historical = [obj_key for obj_key in cityobjects
+                      if obj_key not in head_objects]
+
+        old_packs = cm.packs
+        source = cm.filename
+        if len(historical) > 0:
+            pack_path = "{}.pack".format(self._output)
+            print("Packing {} city objects in {}...".format(len(historical),
+                                                           pack_path))
+            pack = PackFile.write(pack_path,
+                                  ((obj_key, cityobjects[obj_key].data)
+                                   for obj_key in historical),
+                                  self._compression)
+            for obj_key in historical:
+                inline.pop(obj_key, None)
+            cm.set_packs([pack])
+        else:
+            print("No historical city objects to pack.")
+            cm.set_packs([])
+
+        print("{} city objects remain in the file.".format(len(inline)))
+
+        print("Saving file at {filename}...".format(filename=self._output))
+        cm.save(self._output)
+        remove_replaced_packs(cm, old_packs, source)
+
+        print("Done! Tot ziens.")
 
 class CommitCommand:
     """Class that implements the commit command."""
@@ -200,53 +780,188 @@ class CommitCommand:
         self._ref = ref
         self._author = author
         self._message = message
-
-    def execute(self):
-        """Executes the commit command"""
+        self._vertex_lookup = None
+        self._precision = 3
+        self._verbose = True
+        self._version = None
+        self._partial = False
+        self._deleted = []
+
+    def set_partial(self, partial):
+        """Sets whether the new city model only has the added and changed
+        objects, so the rest are kept from the parent version."""
+        self._partial = partial
+
+    def set_deleted(self, object_ids):
+        """Sets the original ids of the objects that a partial commit removes
+        from the parent version."""
+        self._deleted = list(object_ids)
+
+    def set_vertex_lookup(self, lookup):
+        """Sets the lookup of the vertices that are already in the versioned
+        city model, so it doesn't have to be computed again."""
+        self._vertex_lookup = lookup
+
+    def set_verbose(self, verbose):
+        """Sets whether the changes of the commit are printed in full."""
+        self._verbose = verbose
+
+    @property
+    def version(self):
+        """Returns the version created by the command (if any)."""
+        return self._version
+
+    def iter_objects(self):
+        """Yields the (id, object) pairs of the new city model, after their
+        vertices are appended to the versioned city model.
+
+        A CityJSONSeq is read a feature at a time, so only one feature is in
+        memory at once."""
         vcm = self._vcitymodel
         new_citymodel = self._new_citymodel
 
-        parent_versionid = None
-        if len(vcm.versioning.versions) > 0:
-            parent_versionid = vcm.versioning.resolve_ref(self._ref)
+        if isinstance(new_citymodel, SeqReader):
+            for feature in new_citymodel:
+                newids = utils.append_vertices(vcm,
+                                               feature["vertices"],
+                                               self._vertex_lookup,
+                                               self._precision,
+                                               new_citymodel.transform)
+                objects = feature["CityObjects"]
+                utils.remap_geometries((g for obj in objects.values()
+                                        for g in obj.get('geometry', [])),
+                                       newids)
+                yield from objects.items()
+            return
 
         print("Appending vertices...")
-        offset = len(vcm.data["vertices"])
-        vcm.data["vertices"] += new_citymodel["vertices"]
-        for _, obj in new_citymodel["CityObjects"].items():
-            for g in obj['geometry']:
-                utils.update_geom_indices_by_offset(g["boundaries"], offset)
+        newids = utils.append_vertices(vcm,
+                                       new_citymodel["vertices"],
+                                       self._vertex_lookup,
+                                       self._precision,
+                                       new_citymodel.data.get("transform"))
 
-        print("Removing duplicate vertices...")
-        newids, _ = utils.remove_duplicate_vertices(vcm, 3)
+        utils.remap_geometries((g for obj in new_citymodel["CityObjects"].values()
+                                for g in obj.get('geometry', [])),
+                               newids)
 
-        for obj_id, obj in new_citymodel["CityObjects"].items():
-            for g in obj['geometry']:
-                utils.update_geom_indices_by_map(g["boundaries"], newids)
+        yield from new_citymodel.cityobjects.items()
 
-        new_version = cjv.Version(vcm.versioning)
-        new_version.author = self._author
-        new_version.date = datetime.datetime.now()
-        new_version.message = self._message
+    def add_objects(self, new_version, parent_versionid):
+        """Adds all objects of the new city model to the version and names
+        it. Returns False if nothing changed since the parent version."""
+        vcm = self._vcitymodel
 
-        for obj_id, obj in new_citymodel.cityobjects.items():
+        for obj_id, obj in self.iter_objects():
             new_object = cjv.VersionedCityObject(cjm.CityObject(obj, obj_id))
             new_version.add_cityobject(new_object)
 
+        if parent_versionid is None:
+            new_version.name = new_version.hash()
+            return True
+
+        parent_version = vcm.versioning.get_version(parent_versionid)
+        new_version.add_parent(parent_version)
+        # Named before the diff, so that the diff can be cached
+        new_version.name = new_version.hash()
+        diff = cjv.SimpleVersionDiff(parent_version, new_version,
+                                     cache=vcm.diff_cache)
+        result = diff.compute()
+        if (len(result.added) == 0 and
+                len(result.removed) == 0 and
+                len(result.changed) == 0):
+            return False
+
+        if self._verbose:
+            result.print()
+        else:
+            print("{} changed, {} added, {} removed".format(len(result.changed),
+                                                            len(result.added),
+                                                            len(result.removed)))
+        return True
+
+    def overlay_objects(self, new_version, parent_versionid):
+        """Copies the objects map of the parent version to the version, with
+        the objects of the new city model and the deletions on top of it, and
+        names it. Returns False if nothing changed since the parent version.
+
+        Only the objects of the new city model are hashed and the diff with
+        the parent follows from the overlay, so it's stored in the diff cache
+        without comparing the maps."""
+        vcm = self._vcitymodel
+
+        parent_version = None
+        parent_objects = {}
         if parent_versionid is not None:
             parent_version = vcm.versioning.get_version(parent_versionid)
-            diff = cjv.SimpleVersionDiff(parent_version, new_version)
-            result = diff.compute()
-            if (len(result.added) == 0 and
-                    len(result.removed) == 0 and
-                    len(result.changed) == 0):
-                print("Nothing changed! Skipping this...")
-                return
+            parent_objects = parent_version.objects
+            new_version.data["objects"] = parent_objects.copy()
 
-            result.print()
+        ids = {"changed": {}, "added": {}, "removed": {}}
+        for obj_id, obj in self.iter_objects():
+            new_object = cjv.VersionedCityObject(cjm.CityObject(obj, obj_id))
+            old_hash = parent_objects.get(obj_id)
+            if old_hash == new_object.name:
+                continue
+            if old_hash is None:
+                ids["added"][obj_id] = new_object.name
+            else:
+                ids["changed"][obj_id] = [old_hash, new_object.name]
+            new_version.add_cityobject(new_object)
+
+        for obj_id in self._deleted:
+            if obj_id not in new_version.data["objects"]:
+                print("Warning: '{}' is not in the parent version.".format(obj_id))
+                continue
+            ids["removed"][obj_id] = new_version.data["objects"].pop(obj_id)
+
+        if sum(len(each) for each in ids.values()) == 0:
+            return False
+
+        if parent_version is not None:
             new_version.add_parent(parent_version)
+            new_version.set_changed_ids([obj_id for each in ids.values() for obj_id in each])
         new_version.name = new_version.hash()
+        if parent_version is not None and vcm.diff_cache is not None:
+            vcm.diff_cache.put(parent_version.name, new_version.name, ids)
+
+        if self._verbose:
+            for status in ["changed", "added", "removed"]:
+                for obj_id in ids[status]:
+                    print("\t{}: {}".format(status, obj_id))
+        print("{} changed, {} added, {} removed".format(len(ids["changed"]),
+                                                        len(ids["added"]),
+                                                        len(ids["removed"])))
+        return True
+
+    def execute(self):
+        """Executes the commit command"""
+        vcm = self._vcitymodel
+
+        parent_versionid = None
+        if len(vcm.versioning.versions) > 0:
+            parent_versionid = vcm.versioning.resolve_ref(self._ref)
+
+        if self._vertex_lookup is None:
+            self._vertex_lookup = utils.build_vertex_lookup(vcm.data["vertices"],
+                                                            self._precision,
+                                                            vcm.data.get("transform"))
+
+        new_version = cjv.Version(vcm.versioning)
+        new_version.author = self._author
+        new_version.date = datetime.datetime.now()
+        new_version.message = self._message
+
+        if self._partial:
+            if not self.overlay_objects(new_version, parent_versionid):
+                print("Nothing changed! Skipping this...")
+                return
+        elif not self.add_objects(new_version, parent_versionid):
+            print("Nothing changed! Skipping this...")
+            return
         vcm.versioning.add_version(new_version)
+        vcm.update_history_index()
+        self._version = new_version
 
         if (vcm.versioning.is_branch(self._ref) or
                 len(vcm.versioning.versions) == 1):
@@ -254,6 +969,390 @@ class CommitCommand:
                                                      id=new_version.name))
             vcm.versioning.set_branch(self._ref, new_version)
 
+class BatchCommitCommand:
+    """Class that commits a series of CityJSON files as a chain of versions."""
+
+    def __init__(self, vcitymodel: 'VersionedCityJSON', filenames, ref, author, message):
+        self._vcitymodel = vcitymodel
+        self._filenames = filenames
+        self._ref = ref
+        self._author = author
+        self._message = message
+
+    def execute(self):
+        """Executes the batch commit command.
+
+        The vertex lookup of the versioned city model is computed once and kept
+        up to date for all files, instead of hashing the whole list of vertices
+        again for every commit."""
+        vcm = self._vcitymodel
+        ref = self._ref
+
+        lookup = utils.build_vertex_lookup(vcm.data["vertices"], 3,
+                                           vcm.data.get("transform"))
+
+        for i, filename in enumerate(self._filenames):
+            print("[{}/{}] Committing {}...".format(i + 1,
+                                                   len(self._filenames),
+                                                   filename))
+            message = "{} ({})".format(self._message, os.path.basename(filename))
+            if is_seq_file(filename):
+                with open(filename, encoding="UTF-8") as infile:
+                    command = CommitCommand(vcm, SeqReader(infile), ref,
+                                            self._author, message)
+                    command.set_vertex_lookup(lookup)
+                    command.set_verbose(False)
+                    command.execute()
+            else:
+                new_citymodel = cjm.CityJSON.from_file(filename)
+                command = CommitCommand(vcm, new_citymodel, ref, self._author, message)
+                command.set_vertex_lookup(lookup)
+                command.set_verbose(False)
+                command.execute()
+
+            # Chain the next file to this version if the ref isn't a branch
+            if command.version is not None and not vcm.versioning.is_branch(ref):
+                ref = command.version.name
+
+def commit_tile(directory, tile_id, tile_data, ref, author, message, partial):
+    """Commits the objects of a tile to its versioned file, while holding the
+    lock of the file. Returns the name of the new version, or None if nothing
+    changed (or the tile doesn't have the ref)."""
+    repository = TiledRepository(directory)
+    path = repository.get_tile_path(tile_id)
+    with file_lock(path):
+        if os.path.exists(path):
+            vcm = VersionedCityJSON.from_file(path)
+        else:
+            vcm = VersionedCityJSON()
+
+        versioning = vcm.versioning
+        if len(versioning.versions) > 0 and not versioning.is_branch(ref):
+            print("Tile {} has no branch '{}'. Skipping...".format(tile_id, ref))
+            return None
+
+        print("Committing tile {}...".format(tile_id))
+        command = CommitCommand(vcm, cjm.CityJSON(tile_data), ref, author, message)
+        command.set_partial(partial)
+        command.set_verbose(False)
+        command.execute()
+        if command.version is None:
+            return None
+
+        vcm.save(path, append=True)
+        return command.version.name
+
+class TileCommitCommand:
+    """Class that commits a CityJSON to the tiles of a tiled repository."""
+
+    def __init__(self, repository: TiledRepository, new_citymodel, ref, author, message):
+        self._repository = repository
+        self._new_citymodel = new_citymodel
+        self._ref = ref
+        self._author = author
+        self._message = message
+        self._partial = False
+        self._jobs = 1
+
+    def set_partial(self, partial):
+        """Sets whether the objects of every tile are committed on top of the
+        objects the tile already has."""
+        self._partial = partial
+
+    def set_jobs(self, jobs):
+        """Sets the number of processes that commit tiles at the same time."""
+        self._jobs = jobs
+
+    def get_tile_data(self, obj_ids) -> dict:
+        """Returns a CityJSON with the given objects and only their vertices."""
+        new_citymodel = self._new_citymodel
+        objects = {obj_id: copy.deepcopy(new_citymodel["CityObjects"][obj_id])
+                   for obj_id in obj_ids}
+        data = {
+            "type": "CityJSON",
+            "version": new_citymodel["version"],
+            "CityObjects": objects,
+            "vertices": utils.compact_vertices((g for obj in objects.values()
+                                                for g in obj.get("geometry", [])),
+                                               new_citymodel["vertices"])
+        }
+        if "transform" in new_citymodel:
+            data["transform"] = new_citymodel["transform"]
+        return data
+
+    def execute(self):
+        """Executes the tile commit command.
+
+        Only the files of the tiles with objects (and, unless it's partial,
+        the tiles of the ref) are opened, each one under its own lock, and
+        the ref store is only locked to update the heads of those tiles. So
+        commits to different tiles can run at the same time, both within the
+        command and from other processes."""
+        repository = self._repository
+        tiles, margin = repository.split_objects(self._new_citymodel)
+        print("Found objects in {} tile(s)...".format(len(tiles)))
+        if not self._partial:
+            # The tiles whose objects were all removed or moved to other
+            # tiles are committed empty
+            try:
+                heads = repository.get_heads(self._ref)
+            except KeyError:
+                heads = {}
+            for tile_id in heads:
+                tiles.setdefault(tile_id, [])
+
+        args = [(repository.directory, tile_id, self.get_tile_data(obj_ids),
+                 self._ref, self._author, self._message, self._partial)
+                for tile_id, obj_ids in sorted(tiles.items())]
+        if self._jobs > 1:
+            with concurrent.futures.ProcessPoolExecutor(self._jobs) as executor:
+                names = list(executor.map(commit_tile, *zip(*args)))
+        else:
+            names = [commit_tile(*each) for each in args]
+
+        heads = {each[1]: name for each, name in zip(args, names) if name is not None}
+        if len(heads) == 0:
+            print("Nothing changed! Skipping this...")
+            return
+
+        repository.update_heads(self._ref, heads, margin)
+        print("Updated {} tile(s) of {}.".format(len(heads), self._ref))
+
+class TileCheckoutCommand:
+    """Class that extracts a version of a tiled repository."""
+
+    def __init__(self, repository: TiledRepository, ref, output_file):
+        self._repository = repository
+        self._ref = ref
+        self._output = output_file
+        self._bbox = None
+
+    def set_bbox(self, bbox):
+        """Restricts the checkout to the tiles and objects that intersect a 2D
+        bbox."""
+        self._bbox = bbox
+
+    def execute(self):
+        """Executes the tile checkout command, opening only the files of the
+        tiles that are needed."""
+        repository = self._repository
+        heads = repository.get_heads(self._ref)
+        tile_ids = set(heads)
+        if self._bbox is not None:
+            tile_ids &= repository.get_tiles_in_bbox(self._bbox)
+
+        new_model = cjm.CityJSON(copy.deepcopy(cjm.min_cityjson))
+        lookup = {}
+        for tile_id in sorted(tile_ids):
+            print("Extracting tile {}...".format(tile_id))
+            path = repository.get_tile_path(tile_id)
+            with file_lock(path):
+                vcm = VersionedCityJSON.from_file(path)
+            version = vcm.versioning.versions[heads[tile_id]]
+
+            object_ids = None
+            if self._bbox is not None:
+                object_ids = version.get_objects_in_bbox(self._bbox)
+            objects = {obj.original_cityobject.name: copy.deepcopy(obj.original_cityobject.data)
+                       for obj in version.get_versioned_objects(object_ids)}
+            geometries = [g for obj in objects.values() for g in obj.get("geometry", [])]
+            vertices = utils.compact_vertices(geometries, vcm.data["vertices"])
+
+            newids = utils.append_vertices(new_model, vertices, lookup, 3,
+                                           vcm.data.get("transform"))
+            utils.remap_geometries(geometries, newids)
+            new_model["CityObjects"].update(objects)
+
+        print("Saving {0}...".format(self._output))
+        utils.save_cityjson(new_model.data, self._output)
+        print("Done!")
+
+class ImportChangeLogCommand:
+    """Class that imports a log of object changes as a series of versions."""
+
+    def __init__(self, vcitymodel: 'VersionedCityJSON', records, ref, author):
+        self._vcitymodel = vcitymodel
+        self._records = records
+        self._ref = ref
+        self._author = author
+
+    def get_changed_object(self, record, objects, lookup):
+        """Returns the city object that results from applying a record to the
+        respective object (if any) of the given objects map, so that records
+        of the same timestamp apply on top of each other."""
+        vcm = self._vcitymodel
+
+        obj_id = record["id"]
+        if obj_id in objects:
+            obj = vcm.cityobjects[objects[obj_id]].data.copy()
+        else:
+            obj = {"type": "GenericCityObject"}
+
+        if "type" in record:
+            obj["type"] = record["type"]
+        if "attributes" in record:
+            obj["attributes"] = record["attributes"]
+
+        if "geometry" in record:
+            geometry = copy.deepcopy(record["geometry"])
+            vertices = []
+            for g in geometry:
+                utils.extract_vertices_from_boundaries(g["boundaries"], vertices)
+
+            newids = utils.append_vertices(vcm, vertices, lookup, 3)
+            utils.remap_geometries(geometry, newids)
+            obj["geometry"] = geometry
+
+        return cjm.CityObject(obj, obj_id)
+
+    def execute(self):
+        """Executes the import command.
+
+        Every group of records with the same timestamp becomes a version. The
+        objects map of the version starts as a copy of its parent's, so only
+        the changed objects have to be built, referenced and hashed."""
+        vcm = self._vcitymodel
+        versioning = vcm.versioning
+
+        lookup = utils.build_vertex_lookup(vcm.data["vertices"], 3,
+                                           vcm.data.get("transform"))
+
+        parent_version = None
+        if len(versioning.versions) > 0:
+            parent_version = versioning.get_version(self._ref)
+
+        groups = itertools.groupby(self._records, key=lambda r: r["timestamp"])
+        for timestamp, records in groups:
+            records = list(records)
+
+            new_version = cjv.Version(versioning)
+            new_version.author = self._author
+            new_version.date = datetime.datetime.fromisoformat(timestamp)
+            new_version.message = "Import {} change(s) of {}".format(len(records),
+                                                                    timestamp)
+
+            if parent_version is not None:
+                new_version.data["objects"] = parent_version.objects.copy()
+                new_version.add_parent(parent_version)
+
+            for record in records:
+                if record.get("deleted", False):
+                    new_version.data["objects"].pop(record["id"], None)
+                    continue
+
+                obj = self.get_changed_object(record, new_version.data["objects"],
+                                              lookup)
+                new_version.add_cityobject(cjv.VersionedCityObject(obj))
+
+            new_version.set_changed_ids([record["id"] for record in records])
+            new_version.name = new_version.hash()
+            versioning.add_version(new_version)
+            print("{} <- {} change(s) of {}".format(new_version.name,
+                                                   len(records),
+                                                   timestamp))
+
+            parent_version = new_version
+
+        if parent_version is None:
+            print("No changes found. Doei!")
+            return
+        vcm.update_history_index()
+
+        if (versioning.is_branch(self._ref) or
+                len(versioning.data["branches"]) == 0):
+            print("Updating {branch} to {id}".format(branch=self._ref,
+                                                     id=parent_version.name))
+            versioning.set_branch(self._ref, parent_version)
+
+class DeltaEncodeCommand:
+    """Class that changes how the objects maps of versions are stored."""
+
+    def __init__(self, citymodel: 'VersionedCityJSON', keyframe_interval, output_file):
+        self._citymodel = citymodel
+        self._keyframe_interval = keyframe_interval
+        self._output_file = output_file
+
+    def execute(self):
+        """Executes the delta command.
+
+        Versions are processed from the oldest to the newest, so that every
+        objects map is resolved from the one of its parent in the cache. A
+        keyframe interval of None stores all maps in full."""
+        vcm = self._citymodel
+        versioning = vcm.versioning
+        interval = self._keyframe_interval
+
+        dag = nx.DiGraph()
+        for version in versioning.versions.values():
+            dag.add_node(version.name)
+            for parent in version.parents:
+                dag.add_edge(parent.name, version.name)
+
+        depths = {}
+        sorted_keys = list(nx.topological_sort(dag))
+        for ver_key in sorted_keys:
+            version = versioning.versions[ver_key]
+            # Resolve the full map before any parent is re-encoded
+            objects = version.objects
+            vcm.objects_cache[ver_key] = objects
+
+            if version.is_delta_encoded():
+                version.decode_objects_delta()
+
+            depths[ver_key] = 0
+            if interval is not None and version.has_parents():
+                parent = version.parents[0]
+                if depths[parent.name] + 1 < interval:
+                    version.encode_objects_delta(parent)
+                    depths[ver_key] = depths[parent.name] + 1
+
+            versioning.data["versions"][ver_key] = version.data
+
+        versioning.keyframe_interval = interval
+
+        encoded = sum(1 for depth in depths.values() if depth > 0)
+        print("{} of {} versions are delta-encoded.".format(encoded, len(depths)))
+
+        print("Saving file at {filename}...".format(filename=self._output_file))
+        vcm.save(self._output_file)
+
+        print("Done! Tot ziens.")
+
+class ConvertCommand:
+    """Class that saves a versioned city model in another file or format."""
+
+    def __init__(self, citymodel: 'VersionedCityJSON', output_file):
+        self._citymodel = citymodel
+        self._output_file = output_file
+
+    def execute(self):
+        """Executes the convert command."""
+        print("Saving file at {filename}...".format(filename=self._output_file))
+        self._citymodel.save(self._output_file)
+
+        print("Done! Tot ziens.")
+
+class CompactCommand:
+    """Class that folds the journal of a versioned file back into it."""
+
+    def __init__(self, citymodel: 'VersionedCityJSON', output_file):
+        self._citymodel = citymodel
+        self._output_file = output_file
+
+    def execute(self):
+        """Executes the compact command."""
+        filename = self._citymodel.filename
+        records, _ = Journal(get_journal_path(filename)).read()
+        if len(records) == 0 and self._output_file == filename:
+            print("The journal is empty! Nothing to do.")
+            return
+
+        print("Folding {} journal records into {}...".format(len(records),
+                                                             self._output_file))
+        self._citymodel.save(self._output_file)
+
+        print("Done! Tot ziens.")
+
 class BranchCommand:
     """Class that creates a branch at a given ref"""
 
@@ -285,7 +1384,7 @@ class BranchCommand:
 
         print("Saving file at {filename}...".format(filename=self._output_file))
 
-        vcm.save(self._output_file)
+        vcm.save(self._output_file, append=True)
 
         print("Done! Tot ziens.")
 
@@ -310,7 +1409,7 @@ class BranchDeleteCommand:
 
         print("Saving file at {filename}...".format(filename=self._output_file))
 
-        vcm.save(self._output_file)
+        vcm.save(self._output_file, append=True)
 
         print("Done! Tot ziens.")
 
@@ -324,14 +1423,6 @@ class MergeBranchesCommand:
         self._author = author
         self._output_file = output
 
-    @staticmethod
-    def is_conflict(diff1: DeepDiff, diff2: DeepDiff) -> bool:
-        """Returns true if the two diffs are actually conflicting"""
-        paths1 = set([path for cat in diff1.to_dict() for path in diff1[cat]])
-        paths2 = set([path for cat in diff2.to_dict() for path in diff2[cat]])
-
-        return len(paths1.intersection(paths2)) > 0
-
     def execute(self):
         """Executers the merge command."""
         vcm = self._citymodel
@@ -366,10 +1457,12 @@ class MergeBranchesCommand:
 
         ancestor_version = vcm.versioning.get_version(common_ancestor)
 
-        diff = SimpleVersionDiff(ancestor_version, source_version)
+        diff = SimpleVersionDiff(ancestor_version, source_version,
+                                 cache=vcm.diff_cache)
         source_changes = diff.compute()
 
-        diff = SimpleVersionDiff(ancestor_version, dest_version)
+        diff = SimpleVersionDiff(ancestor_version, dest_version,
+                                 cache=vcm.diff_cache)
         dest_changes = diff.compute()
 
         source_ids_changed = (set(k for k in source_changes.changed)
@@ -386,25 +1479,17 @@ class MergeBranchesCommand:
         both_changed = (set(k for k in source_changes.changed)
                         .intersection(set(k for k in dest_changes.changed)))
 
+        # Objects changed on both sides are merged if they change different
+        # attributes or surfaces
+        object_diff = ObjectDiff()
         resolved = {}
         for co_id in both_changed:
-            common_obj = source_changes.changed[co_id]["source"].data
-            left_dest = source_changes.changed[co_id]["dest"].data
-            right_dest = dest_changes.changed[co_id]["dest"].data
-
-            left_diff = DeepDiff(common_obj, left_dest)
-            right_diff = DeepDiff(common_obj, right_dest)
-
-            if not self.is_conflict(left_diff, right_diff):
-                # print(f"Conflicts on {co_id} can be resolved...")
+            new_obj = object_diff.merge(source_changes.changed[co_id]["source"],
+                                        source_changes.changed[co_id]["dest"],
+                                        dest_changes.changed[co_id]["dest"])
+            if new_obj is not None:
                 conflicts.remove(co_id)
 
-                delta = Delta(left_diff)
-                new_obj = common_obj + delta
-
-                delta = Delta(right_diff)
-                new_obj = new_obj + delta
-
                 new_versioned_obj = VersionedCityObject(cjm.CityObject(new_obj, name=co_id))
                 resolved[co_id] = new_versioned_obj
 
@@ -444,12 +1529,15 @@ class MergeBranchesCommand:
         for obj in resolved.values():
             new_version.add_cityobject(obj)
 
+        # Only the objects changed on the dest side differ from the source
+        new_version.set_changed_ids(dest_ids_changed.union(resolved))
         new_version.name = new_version.hash()
         vcm.versioning.add_version(new_version)
+        vcm.update_history_index()
 
         if vcm.versioning.is_branch(dest_branch):
             print("Moving {} to {}".format(dest_branch, new_version.name))
             vcm.versioning.set_branch(dest_branch, new_version)
 
         print("Saving to {0}...".format(self._output_file))
-        vcm.save(self._output_file)
+        vcm.save(self._output_file, append=True)
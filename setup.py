@@ -8,8 +8,8 @@ setup(
         'Click',
         'colorama',
         'networkx',
-        'deepdiff',
-        'rich'
+        'rich',
+        'numpy'
     ],
     entry_points='''
         [console_scripts]
@@ -152,3 +152,30 @@ class TestIndexedVerticesHandler:
 
         assert len(cm["vertices"]) == 3
         assert cm["vertices"][0] == [1, 1, 1]
+
+class TestCoordinatesTransformer:
+    """Tests the CoordinatesTransformer class."""
+
+    def test_encode_and_decode_many(self):
+        """Tests if the batch methods give the same result as the per vertex
+        ones."""
+        transformer = citymodel.CoordinatesTransformer([1000, 2000, 0],
+                                                       [0.001, 0.001, 0.01])
+        coords = [[1000.5, 2000.25, 1.5], [999.0, 2001.0, -3.333]]
+
+        vertices = transformer.encode_many(coords)
+        assert vertices.tolist() == [transformer.encode_coords(c) for c in coords]
+
+        decoded = transformer.decode_many(vertices)
+        assert decoded.tolist() == [transformer.decode_coords(v)
+                                    for v in vertices.tolist()]
+        assert transformer.decode_many([]).shape == (0, 3)
+
+    def test_encode_rounds(self):
+        """Tests if coordinates are encoded to the nearest integer, like
+        when vertices are committed."""
+        transformer = citymodel.CoordinatesTransformer([0, 0, 0], [0.001, 0.001, 0.001])
+        coords = [[0.3, 0.7, 1.1]]
+
+        assert transformer.encode_coords(coords[0]) == [300, 700, 1100]
+        assert transformer.encode_many(coords).tolist() == [[300, 700, 1100]]
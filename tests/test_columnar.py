@@ -0,0 +1,44 @@
+import numpy as np
+
+import cityjson.columnar as columnar
+
+class TestColumnarVersion:
+    """Tests the ColumnarVersion class."""
+
+    def test_flatten_boundaries(self):
+        """Are boundaries of different depths padded to the same levels?"""
+        indices = []
+        offsets = [[0] for _ in columnar.OFFSET_NAMES]
+
+        columnar.flatten_boundaries([[[0, 1, 2]], [[2, 3, 0], [4, 5, 6]]],
+                                    indices, offsets)
+        columnar.flatten_boundaries([7, 8], indices, offsets)
+
+        assert indices == [0, 1, 2, 2, 3, 0, 4, 5, 6, 7, 8]
+        assert offsets == [[0, 1, 2],
+                           [0, 1, 2],
+                           [0, 2, 3],
+                           [0, 1, 3, 4],
+                           [0, 3, 6, 9, 11]]
+
+    def test_build_arrays(self):
+        """Are attributes and vertices stored as columns?"""
+        cityobjects = [
+            ("a", {"type": "Building",
+                   "attributes": {"height": 10, "owner": "Bilbo"},
+                   "geometry": [{"type": "MultiSurface", "lod": 1,
+                                 "boundaries": [[[4, 2, 3]]]}]}),
+            ("b", {"type": "Road", "attributes": {"owner": "Frodo"}})
+        ]
+        vertices = [[i, i, i] for i in range(5)]
+
+        arrays = columnar.ColumnarVersion(cityobjects, vertices).arrays
+
+        assert list(arrays["object_id"]) == ["a", "b"]
+        assert arrays["attributes.height"][0] == 10
+        assert np.isnan(arrays["attributes.height"][1])
+        assert list(arrays["attributes.owner"]) == ["Bilbo", "Frodo"]
+        assert list(arrays["object_geometry_offsets"]) == [0, 1, 1]
+        assert arrays["vertices"][arrays["boundaries"]].tolist() == [[4, 4, 4],
+                                                                    [2, 2, 2],
+                                                                    [3, 3, 3]]
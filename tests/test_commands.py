@@ -1,5 +1,7 @@
 """Module with tests for the commands."""
 
+import os
+
 import commands
 import cityjson.citymodel as cjm
 import cityjson.versioning as cjv
@@ -28,3 +30,416 @@ class TestCommitCommand:
         assert version.author == "John Doe"
         assert version.message == "Test Message"
         assert len(version.versioned_objects) == 0
+
+    def test_commit_with_different_transforms(self):
+        """Tests if vertices of models with a different transform are
+        quantized with the transform of the versioned city model."""
+        vcm = cjv.VersionedCityJSON()
+
+        for i, (translate, scale, vertices) in enumerate([
+                ([100, 200, 0], [0.01, 0.01, 0.01], [[100, 100, 100], [200, 0, 0]]),
+                ([101, 200, 0], [0.001, 0.001, 0.001], [[0, 1000, 1000], [3000, 0, 0]])]):
+            cm = cjm.CityJSON()
+            cm["transform"] = {"translate": translate, "scale": scale}
+            cm["vertices"] = vertices
+            cm["CityObjects"] = {"building": {
+                "type": "Building",
+                "geometry": [{"type": "MultiPoint", "boundaries": [0, 1]}]
+            }}
+
+            commands.CommitCommand(vcm, cm, "master", "John Doe", str(i)).execute()
+
+        assert vcm["transform"] == {"translate": [100, 200, 0],
+                                    "scale": [0.01, 0.01, 0.01]}
+        assert vcm["vertices"] == [[100, 100, 100], [200, 0, 0], [400, 0, 0]]
+
+        version = vcm.versioning.get_version("master")
+        building = vcm.cityobjects[version.objects["building"]]
+        assert building["geometry"][0]["boundaries"] == [0, 2]
+
+    def test_partial_commit(self):
+        """Tests if a partial commit keeps the other objects of the parent."""
+        vcm = cjv.VersionedCityJSON()
+
+        cm = cjm.CityJSON()
+        cm["CityObjects"] = {"building1": {"type": "Building"},
+                             "building2": {"type": "Building"},
+                             "building3": {"type": "Building"}}
+        commands.CommitCommand(vcm, cm, "master", "John Doe", "Full").execute()
+        parent = vcm.versioning.get_version("master")
+
+        cm = cjm.CityJSON()
+        cm["CityObjects"] = {"building1": {"type": "BuildingPart"},
+                             "road1": {"type": "Road"}}
+        command = commands.CommitCommand(vcm, cm, "master", "John Doe", "Partial")
+        command.set_partial(True)
+        command.set_deleted(["building3"])
+        command.execute()
+
+        version = vcm.versioning.get_version("master")
+        assert version.parents[0].name == parent.name
+        assert sorted(version.objects) == ["building1", "building2", "road1"]
+        assert version.objects["building2"] == parent.objects["building2"]
+        assert vcm.cityobjects[version.objects["building1"]]["type"] == "BuildingPart"
+
+    def test_partial_commit_merkle(self):
+        """Tests if a partial commit named from the changed ids has the same
+        Merkle hash as the whole objects map."""
+        vcm = cjv.VersionedCityJSON()
+        vcm.versioning.hash_scheme = "merkle"
+
+        cm = cjm.CityJSON()
+        cm["CityObjects"] = {"building{}".format(i): {"type": "Building"}
+                             for i in range(100)}
+        commands.CommitCommand(vcm, cm, "master", "John Doe", "Full").execute()
+
+        cm = cjm.CityJSON()
+        cm["CityObjects"] = {"building1": {"type": "BuildingPart"}}
+        command = commands.CommitCommand(vcm, cm, "master", "John Doe", "Partial")
+        command.set_partial(True)
+        command.set_deleted(["building2"])
+        command.execute()
+
+        vcm.trees_cache.clear()
+        version = vcm.versioning.get_version("master")
+        assert version.hash() == version.name
+
+    def test_commit_saved_tree(self, tmp_path, monkeypatch):
+        """Tests if a commit in a new process starts from the saved tree of
+        its parent, and gets the same Merkle hash."""
+        path = str(tmp_path / "vcm.json")
+        vcm = cjv.VersionedCityJSON()
+        vcm.versioning.hash_scheme = "merkle"
+
+        cm = cjm.CityJSON()
+        cm["CityObjects"] = {"building{}".format(i): {"type": "Building"}
+                             for i in range(100)}
+        commands.CommitCommand(vcm, cm, "master", "John Doe", "Full").execute()
+        vcm.save(path)
+
+        vcm = cjv.VersionedCityJSON.from_file(path)
+        cm = cjm.CityJSON()
+        cm["CityObjects"] = {"building1": {"type": "BuildingPart"}}
+        command = commands.CommitCommand(vcm, cm, "master", "John Doe", "Partial")
+        command.set_partial(True)
+        with monkeypatch.context() as m:
+            m.setattr(cjv.ObjectsTree, "from_objects", None)
+            command.execute()
+        vcm.save(path)
+
+        vcm = cjv.VersionedCityJSON.from_file(path)
+        version = vcm.versioning.get_version("master")
+        vcm.trees_cache.clear()
+        assert cjv.ObjectsTree.from_objects(version.objects).root == \
+            version.get_objects_tree().root
+        assert version.hash() == version.name
+
+class TestBatchCommitCommand:
+    """Group of tests of the batch commit command."""
+
+    def test_commit_chain(self):
+        """Tests if a series of files is committed as a chain of versions."""
+        vcm = cjv.VersionedCityJSON()
+
+        command = commands.BatchCommitCommand(vcm,
+                                              ["Examples/rotterdam/initial.json",
+                                               "Examples/rotterdam/initial_moved_roof.json",
+                                               "Examples/rotterdam/initial_deleted_building.json"],
+                                              "main",
+                                              "John Doe",
+                                              "Nightly snapshot")
+        command.execute()
+
+        assert len(vcm.versioning.versions) == 3
+
+        head = vcm.versioning.get_version("main")
+        assert head.message == "Nightly snapshot (initial_deleted_building.json)"
+        assert len(head.parents) == 1
+        assert len(head.parents[0].parents) == 1
+
+        # No duplicate vertices should be added to the pool
+        keys = set(tuple(v) for v in vcm.data["vertices"])
+        assert len(keys) == len(vcm.data["vertices"])
+
+class TestImportChangeLogCommand:
+    """Group of tests of the import command."""
+
+    def test_import_changes(self):
+        """Tests if every timestamp of a change log becomes a version."""
+        vcm = cjv.VersionedCityJSON()
+
+        square = [{"type": "MultiSurface",
+                   "lod": 1,
+                   "boundaries": [[[[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]]]]}]
+        moved = [{"type": "MultiSurface",
+                  "lod": 1,
+                  "boundaries": [[[[0, 0, 1], [1, 0, 1], [1, 1, 0], [0, 1, 0]]]]}]
+        records = [
+            {"id": "b1", "timestamp": "2021-01-01T00:00:00", "geometry": square},
+            {"id": "b2", "timestamp": "2021-01-01T00:00:00", "geometry": square},
+            {"id": "b1", "timestamp": "2021-02-01T00:00:00", "geometry": moved},
+            {"id": "b2", "timestamp": "2021-03-01T00:00:00", "deleted": True}
+        ]
+
+        command = commands.ImportChangeLogCommand(vcm, records, "main", "John Doe")
+        command.execute()
+
+        assert len(vcm.versioning.versions) == 3
+        assert len(vcm.data["vertices"]) == 6
+
+        head = vcm.versioning.get_version("main")
+        assert list(head.data["objects"]) == ["b1"]
+
+        first, second = head.parents[0].parents[0], head.parents[0]
+        assert first.data["objects"]["b2"] == second.data["objects"]["b2"]
+        assert first.data["objects"]["b1"] != second.data["objects"]["b1"]
+
+    def test_partial_records(self):
+        """Tests if records of the same object and timestamp are all applied."""
+        vcm = cjv.VersionedCityJSON()
+
+        square = [{"type": "MultiSurface",
+                   "lod": 1,
+                   "boundaries": [[[[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]]]]}]
+        records = [
+            {"id": "b1", "timestamp": "2021-01-01T00:00:00", "type": "Building"},
+            {"id": "b1", "timestamp": "2021-02-01T00:00:00",
+             "attributes": {"height": 3}},
+            {"id": "b1", "timestamp": "2021-02-01T00:00:00", "geometry": square}
+        ]
+
+        commands.ImportChangeLogCommand(vcm, records, "main", "John Doe").execute()
+
+        assert len(vcm.versioning.versions) == 2
+        obj = vcm.versioning.get_version("main").versioned_objects[0].original_cityobject
+        assert obj.data["type"] == "Building"
+        assert obj.data["attributes"] == {"height": 3}
+        assert len(obj.data["geometry"]) == 1
+
+def get_object_coordinates(citymodel, obj):
+    """Returns the boundaries of an object with coordinates instead of indices."""
+    def resolve(a):
+        if isinstance(a, list):
+            return [resolve(each) for each in a]
+        return citymodel["vertices"][a]
+    return [resolve(g["boundaries"]) for g in obj.get("geometry", [])]
+
+class TestPatchCommands:
+    """Group of tests of the format-patch and apply commands."""
+
+    def test_apply_patch(self, tmp_path):
+        """Tests if a patched checkout has the objects of the new version."""
+        vcm = cjv.VersionedCityJSON()
+
+        command = commands.BatchCommitCommand(vcm,
+                                              ["Examples/rotterdam/initial.json",
+                                               "Examples/rotterdam/initial_moved_roof.json",
+                                               "Examples/rotterdam/initial_deleted_building.json"],
+                                              "main",
+                                              "John Doe",
+                                              "Snapshot")
+        command.execute()
+        head = vcm.versioning.get_version("main")
+        base = head.parents[0]
+
+        checkout = str(tmp_path / "base.json")
+        commands.CheckoutCommand(vcm, base.name, checkout).execute()
+        expected_file = str(tmp_path / "head.json")
+        commands.CheckoutCommand(vcm, head.name, expected_file).execute()
+        patch = str(tmp_path / "patch.json")
+        commands.FormatPatchCommand(vcm, base.name, head.name, patch).execute()
+        output = str(tmp_path / "patched.json")
+        commands.ApplyPatchCommand(checkout, patch, output).execute()
+
+        patched = cjm.CityJSON.from_file(output)
+        expected = cjm.CityJSON.from_file(expected_file)
+        patch_data = cjm.CityJSON.from_file(patch)
+
+        assert len(patch_data["CityObjects"]) == 1
+        assert len(patch_data["removed"]) == 1
+        assert set(patched["CityObjects"]) == set(expected["CityObjects"])
+        for obj_id, obj in expected["CityObjects"].items():
+            assert (get_object_coordinates(patched, patched["CityObjects"][obj_id]) ==
+                    get_object_coordinates(expected, obj))
+
+class TestGarbageCollectCommand:
+    """Group of tests of the gc command."""
+
+    def test_remove_deleted_branch(self, tmp_path):
+        """Tests if the objects and vertices of a deleted branch are removed."""
+        vcm = cjv.VersionedCityJSON()
+        vcm["vertices"] = [[0, 0, 0], [1, 1, 1], [2, 2, 2], [3, 3, 3]]
+
+        versioning = vcm.versioning
+        for branch, boundaries in [("main", [[[2, 0, 3]]]),
+                                   ("feature", [[[1, 3, 0]]])]:
+            version = cjv.Version(versioning)
+            obj = cjm.CityObject({"type": "Building",
+                                  "geometry": [{"type": "MultiSurface",
+                                                "boundaries": boundaries}]},
+                                 branch)
+            version.add_cityobject(cjv.VersionedCityObject(obj))
+            version.name = version.hash()
+            versioning.add_version(version)
+            versioning.set_branch(branch, version)
+
+        del vcm["versioning"]["branches"]["feature"]
+
+        command = commands.GarbageCollectCommand(vcm, str(tmp_path / "gc.json"))
+        command.execute()
+
+        assert len(vcm.versioning.versions) == 1
+        assert len(vcm.cityobjects) == 1
+        assert vcm["vertices"] == [[2, 2, 2], [0, 0, 0], [3, 3, 3]]
+
+        obj = list(vcm["CityObjects"].values())[0]
+        assert obj["geometry"][0]["boundaries"] == [[[0, 1, 2]]]
+
+    def test_recommit_after_gc(self, tmp_path):
+        """Tests if the objects renumbered by gc match the same model again."""
+        vcm = cjv.VersionedCityJSON()
+        # An unused vertex, as left by a deleted branch
+        vcm["vertices"] = [[5, 5, 5]]
+
+        cm = cjm.CityJSON()
+        cm["vertices"] = [[1, 1, 1]]
+        cm["CityObjects"] = {"NEWBUILDING": {
+            "type": "Building",
+            "geometry": [{"type": "MultiPoint", "boundaries": [0]}]
+        }}
+        commands.CommitCommand(vcm, cm, "main", "John Doe", "New").execute()
+
+        output = str(tmp_path / "gc.json")
+        commands.GarbageCollectCommand(vcm, output).execute()
+        vcm = cjv.VersionedCityJSON.from_file(output)
+        head = vcm.versioning.get_version("main")
+
+        commands.CommitCommand(vcm, cm, "main", "John Doe", "Same").execute()
+
+        assert vcm["vertices"] == [[1, 1, 1]]
+        assert len(vcm.versioning.versions) == 1
+        assert vcm.versioning.get_version("main").name == head.name
+
+    def test_keep_indexes(self, tmp_path):
+        """Tests if gc keeps the indexes when no object was renamed."""
+        path = str(tmp_path / "vcm.json")
+        vcm = cjv.VersionedCityJSON()
+        cm = cjm.CityJSON()
+        cm["vertices"] = [[1, 1, 1]]
+        cm["CityObjects"] = {"NEWBUILDING": {
+            "type": "Building",
+            "geometry": [{"type": "MultiPoint", "boundaries": [0]}]
+        }}
+        commands.CommitCommand(vcm, cm, "main", "John Doe", "New").execute()
+        vcm.save(path)
+
+        vcm = cjv.VersionedCityJSON.from_file(path)
+        vcm.get_type_index()
+        commands.GarbageCollectCommand(vcm, path).execute()
+
+        assert os.path.isfile(path + ".tidx")
+
+    def test_gc_database(self, tmp_path):
+        """Tests if the objects renamed by gc are still found in a database."""
+        db_file = str(tmp_path / "model.cjvdb")
+        vcm = cjv.VersionedCityJSON()
+        vcm["vertices"] = [[5, 5, 5]]
+
+        cm = cjm.CityJSON()
+        cm["vertices"] = [[1, 1, 1]]
+        cm["CityObjects"] = {"NEWBUILDING": {
+            "type": "Building",
+            "geometry": [{"type": "MultiPoint", "boundaries": [0]}]
+        }}
+        commands.CommitCommand(vcm, cm, "main", "John Doe", "New").execute()
+        vcm.save(db_file)
+
+        vcm = cjv.VersionedCityJSON.from_file(db_file)
+        commands.GarbageCollectCommand(vcm, db_file).execute()
+
+        vcm = cjv.VersionedCityJSON.from_file(db_file)
+        output = str(tmp_path / "out.json")
+        commands.CheckoutCommand(vcm, "main", output).execute()
+        result = cjm.CityJSON.from_file(output)
+        assert list(result["CityObjects"]) == ["NEWBUILDING"]
+        assert result["vertices"] == [[1, 1, 1]]
+
+class TestRepackCommand:
+    """Group of tests of the repack command."""
+
+    def test_repack(self, tmp_path):
+        """Tests if only the objects of older versions are packed."""
+        vcm = cjv.VersionedCityJSON()
+
+        command = commands.BatchCommitCommand(vcm,
+                                              ["Examples/rotterdam/initial.json",
+                                               "Examples/rotterdam/initial_moved_roof.json"],
+                                              "main",
+                                              "John Doe",
+                                              "Snapshot")
+        command.execute()
+
+        output = str(tmp_path / "repacked.json")
+        command = commands.RepackCommand(vcm, output)
+        command.execute()
+
+        vcm = cjv.VersionedCityJSON.from_file(output)
+        head = vcm.versioning.get_version("main")
+        old = head.parents[0]
+
+        assert len(vcm["CityObjects"]) == len(head.objects)
+        assert len(vcm.packs) == 1
+        assert len(old.versioned_objects) == len(old.objects)
+
+    def test_remove_replaced_pack(self, tmp_path):
+        """Tests if gc over a packed file removes its old pack, while a
+        repack to another file keeps it."""
+        vcm = cjv.VersionedCityJSON()
+        commands.BatchCommitCommand(vcm,
+                                    ["Examples/rotterdam/initial.json",
+                                     "Examples/rotterdam/initial_moved_roof.json"],
+                                    "main",
+                                    "John Doe",
+                                    "Snapshot").execute()
+
+        output = str(tmp_path / "repacked.json")
+        commands.RepackCommand(vcm, output).execute()
+
+        vcm = cjv.VersionedCityJSON.from_file(output)
+        other = str(tmp_path / "other.json")
+        commands.RepackCommand(vcm, other).execute()
+        assert os.path.isfile(output + ".pack")
+        assert os.path.isfile(other + ".pack")
+
+        vcm = cjv.VersionedCityJSON.from_file(output)
+        commands.GarbageCollectCommand(vcm, output).execute()
+        assert not os.path.isfile(output + ".pack")
+        assert not os.path.isfile(output + ".pack.idx")
+
+class TestRehashCommand:
+    """Group of tests of the rehash command."""
+
+    def test_rehash_merkle(self, tmp_path):
+        """Tests if versions are renamed after the roots of their objects maps."""
+        vcm = cjv.VersionedCityJSON()
+
+        command = commands.BatchCommitCommand(vcm,
+                                              ["Examples/rotterdam/initial.json",
+                                               "Examples/rotterdam/initial_moved_roof.json"],
+                                              "main",
+                                              "John Doe",
+                                              "Snapshot")
+        command.execute()
+        legacy_name = vcm.versioning.get_version("main").name
+
+        output = str(tmp_path / "rehashed.json")
+        command = commands.RehashCommand(vcm, output, "merkle")
+        command.execute()
+
+        vcm = cjv.VersionedCityJSON.from_file(output)
+        head = vcm.versioning.get_version("main")
+
+        assert vcm.versioning.hash_scheme == "merkle"
+        assert head.name != legacy_name
+        assert head.hash() == head.name
+        assert head.parents[0].hash() == head.parents[0].name
@@ -0,0 +1,48 @@
+"""Module with tests for the cache of diffs."""
+
+import os
+
+from cityjson.diffcache import DiffCache
+import cityjson.citymodel as cjm
+import cityjson.versioning as cjv
+
+class TestDiffCache:
+    """Group of tests of the diff cache."""
+
+    def test_get_and_evict(self, tmp_path):
+        """Tests if diffs are stored and the least recently used ones are
+        evicted when the cache is full."""
+        cache = DiffCache(str(tmp_path / "cache"), max_size=200)
+        result = {"changed": {}, "added": {"a": "1" * 40}, "removed": {}}
+
+        assert cache.get("v1", "v2") is None
+        cache.put("v1", "v2", result)
+        assert cache.get("v1", "v2") == result
+
+        os.utime(cache.get_path("v1", "v2"), (0, 0))
+        cache.put("v2", "v3", result)
+        cache.put("v3", "v4", result)
+
+        assert cache.get("v1", "v2") is None
+        assert cache.get("v3", "v4") == result
+
+    def test_cached_diff(self, tmp_path):
+        """Tests if a diff of two named versions comes from the cache."""
+        cm = cjv.VersionedCityJSON()
+        versioning = cjv.Versioning(cm)
+        cache = DiffCache(str(tmp_path / "cache"))
+
+        source_version = cjv.Version(versioning)
+        source_version.name = "v1"
+        dest_version = cjv.Version(versioning)
+        dest_version.name = "v2"
+        obj = cjv.VersionedCityObject(cjm.CityObject({"type" : "Building"}, "building1"))
+        dest_version.add_cityobject(obj)
+
+        result = cjv.SimpleVersionDiff(source_version, dest_version, cache=cache).compute()
+        assert list(result.added) == ["building1"]
+        assert cache.get("v1", "v2")["added"] == {"building1": obj.name}
+
+        cache.put("v1", "v2", {"changed": {}, "added": {}, "removed": {}})
+        result = cjv.SimpleVersionDiff(source_version, dest_version, cache=cache).compute()
+        assert len(result.added) == 0
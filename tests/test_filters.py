@@ -0,0 +1,25 @@
+"""Module with tests for the attribute filters."""
+
+import pytest
+
+from cityjson.filters import AttributeFilter
+
+class TestAttributeFilter:
+    """Group of tests of the attribute filters."""
+
+    def test_parse_and_match(self):
+        """Tests if expressions are parsed and compared by value type."""
+        obj = {"attributes": {"height": 12.5, "status": "1", "roof": "flat"}}
+
+        assert AttributeFilter.parse("height > 10").matches(obj)
+        assert not AttributeFilter.parse("height<=10").matches(obj)
+        assert AttributeFilter.parse("status = 1").matches(obj)
+        assert AttributeFilter.parse("roof != gabled").matches(obj)
+        assert not AttributeFilter.parse("roof > 3").matches({"attributes": {"roof": [5]}})
+        assert not AttributeFilter.parse("missing = 1").matches(obj)
+        assert not AttributeFilter.parse("height = 1").matches({})
+
+    def test_invalid_expression(self):
+        """Tests if an expression without an operator is rejected."""
+        with pytest.raises(ValueError):
+            AttributeFilter.parse("height")
@@ -0,0 +1,50 @@
+import cityjson.geometry as geometry
+
+class TestFlatBoundaries:
+    """Tests the FlatBoundaries class."""
+
+    def test_round_trip(self):
+        """Are nested boundaries the same after flattening them?"""
+        solid = [[[[0, 1, 2, 3]], [[4, 5, 6, 7], [8, 9, 10]]],
+                 [[[3, 2, 1]]]]
+
+        flat = geometry.FlatBoundaries.from_nested(solid)
+
+        assert flat.depth == 4
+        assert flat.indices.tolist() == [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 3, 2, 1]
+        assert [o.tolist() for o in flat.offsets] == [[0, 2, 3],
+                                                      [0, 1, 3, 4],
+                                                      [0, 4, 8, 11, 14]]
+        assert flat.to_nested() == solid
+
+        assert geometry.FlatBoundaries.from_nested([0, 1]).to_nested() == [0, 1]
+        assert geometry.FlatBoundaries.from_nested([]).to_nested() == []
+
+    def test_empty_first_child(self):
+        """Is the depth found when the first child is empty?"""
+        boundaries = [[], [[0, 1, 2]]]
+        assert geometry.get_depth(boundaries) == 3
+
+        flat = geometry.FlatBoundaries.from_nested(boundaries)
+        assert flat.indices.tolist() == [0, 1, 2]
+        assert flat.to_nested() == boundaries
+
+class TestGeometryHelpers:
+    """Tests the functions over the boundaries of many geometries."""
+
+    def test_shift_and_compact(self):
+        """Are the indices of all geometries shifted and compacted at once?"""
+        geometries = [{"type": "MultiPoint", "boundaries": [4, 1]},
+                      {"type": "MultiSurface", "boundaries": [[[1, 2, None]], []]}]
+        assert geometry.get_max_index(geometries) == 4
+
+        geometry.shift_geometries(geometries, 2, 10)
+        assert geometries[0]["boundaries"] == [14, 1]
+        assert geometries[1]["boundaries"] == [[[1, 12, None]], []]
+        assert geometry.get_used_vertices(geometries).tolist() == [1, 12, 14]
+
+        vertices = [[i, i, i] for i in range(15)]
+        assert geometry.compact_vertices(geometries, vertices, first_use=True) == \
+            [[14, 14, 14], [1, 1, 1], [12, 12, 12]]
+        assert geometries[0]["boundaries"] == [0, 1]
+        assert geometries[1]["boundaries"] == [[[1, 2, None]], []]
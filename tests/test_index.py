@@ -0,0 +1,53 @@
+"""Module with tests for the indexes of versioned city models."""
+
+import commands
+import cityjson.citymodel as cjm
+import cityjson.versioning as cjv
+from cityjson.index import HistoryIndex, get_history_index_path
+
+class TestHistoryIndex:
+    """Group of tests of the history index."""
+
+    def commit(self, vcm, cityobjects, ref="main"):
+        """Commits a model with the given city objects and returns the new
+        version."""
+        cm = cjm.CityJSON()
+        cm["CityObjects"] = cityobjects
+        commands.CommitCommand(vcm, cm, ref, "John Doe", "Test").execute()
+        return vcm.versioning.resolve_ref(ref)
+
+    def test_transitions(self):
+        """Tests if additions, changes and removals are indexed, also for
+        versions added after the index was built."""
+        vcm = cjv.VersionedCityJSON()
+
+        v1 = self.commit(vcm, {"a": {"type": "Building"}, "b": {"type": "Road"}})
+        v2 = self.commit(vcm, {"a": {"type": "BuildingPart"}, "b": {"type": "Road"}})
+        index = vcm.get_history_index()
+
+        assert len(index.get_transitions("a")) == 2
+        assert [t[0] for t in index.get_transitions("a")] == [v1, v2]
+        assert [t[0] for t in index.get_transitions("b")] == [v1]
+
+        v3 = self.commit(vcm, {"a": {"type": "BuildingPart"}})
+        index = vcm.get_history_index()
+
+        assert index.get_transitions("b") == [[v1, vcm.versioning.versions[v1].objects["b"]],
+                                              [v3, None]]
+        assert [t[0] for t in index.get_transitions("a")] == [v1, v2]
+
+    def test_update_on_commit(self, tmp_path):
+        """Tests if a commit adds its version to an existing index, which is
+        saved with the versioned file."""
+        path = str(tmp_path / "vcm.json")
+        vcm = cjv.VersionedCityJSON()
+        self.commit(vcm, {"a": {"type": "Building"}})
+        vcm.save(path)
+        cjv.VersionedCityJSON.from_file(path).get_history_index()
+
+        vcm = cjv.VersionedCityJSON.from_file(path)
+        v2 = self.commit(vcm, {"a": {"type": "BuildingPart"}})
+        vcm.save(path)
+
+        index = HistoryIndex.load(get_history_index_path(path))
+        assert [t[0] for t in index.get_transitions("a")][-1] == v2
@@ -0,0 +1,68 @@
+"""Module with tests for the journal of versioned files."""
+
+import os
+
+import commands
+import cityjson.citymodel as cjm
+import cityjson.versioning as cjv
+from cityjson.journal import Journal, apply_record, get_journal_path
+
+def get_model(vertices):
+    """Returns a CityJSON with a building made of the given vertices."""
+    cm = cjm.CityJSON()
+    cm["vertices"] = vertices
+    cm["CityObjects"] = {"building1": {
+        "type": "Building",
+        "geometry": [{"type": "MultiPoint", "boundaries": list(range(len(vertices)))}]
+    }}
+    return cm
+
+class TestJournal:
+    """Group of tests of the journal."""
+
+    def test_append_and_compact(self, tmp_path):
+        """Tests if commits and branches are appended to the journal, loaded
+        from it, and folded back into the file."""
+        path = str(tmp_path / "vcm.json")
+        vcm = cjv.VersionedCityJSON()
+        commands.CommitCommand(vcm, get_model([[0, 0, 0], [1, 1, 1]]),
+                               "main", "John Doe", "Initial").execute()
+        vcm.save(path)
+        size = os.path.getsize(path)
+
+        vcm = cjv.VersionedCityJSON.from_file(path)
+        commands.BranchCommand(vcm, "main", "feature", path).execute()
+        vcm = cjv.VersionedCityJSON.from_file(path)
+        commands.CommitCommand(vcm, get_model([[0, 0, 0], [2, 2, 2]]),
+                               "feature", "John Doe", "Feature").execute()
+        vcm.save(path, append=True)
+
+        assert os.path.getsize(path) == size
+        records, _ = Journal(get_journal_path(path)).read()
+        assert len(records) == 2
+
+        vcm = cjv.VersionedCityJSON.from_file(path)
+        commands.CompactCommand(vcm, path).execute()
+        assert not os.path.exists(get_journal_path(path))
+
+        vcm = cjv.VersionedCityJSON.from_file(path)
+        version = vcm.versioning.get_version("feature")
+        obj = vcm.cityobjects[version.objects["building1"]]
+        boundaries = obj["geometry"][0]["boundaries"]
+        assert [vcm["vertices"][i] for i in boundaries] == [[0, 0, 0], [2, 2, 2]]
+        assert len(vcm["vertices"]) == 3
+
+    def test_replay_twice(self):
+        """Tests if a record that was already folded in has no effect."""
+        data = {"CityObjects": {}, "vertices": [[0, 0, 0]],
+                "versioning": {"versions": {}, "branches": {"old": "a"}, "tags": {}}}
+        record = {"vertices_start": 1, "vertices": [[1, 1, 1]],
+                  "CityObjects": {"b": {"type": "Building"}},
+                  "versions": {"c": {}},
+                  "branches": {"main": "c", "old": None}}
+
+        apply_record(data, record)
+        apply_record(data, record)
+
+        assert data["vertices"] == [[0, 0, 0], [1, 1, 1]]
+        assert data["versioning"]["branches"] == {"main": "c"}
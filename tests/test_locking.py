@@ -0,0 +1,97 @@
+"""Module with tests for concurrent writes to versioned files."""
+
+import pytest
+
+import commands
+import cityjson.citymodel as cjm
+import cityjson.versioning as cjv
+from cityjson.locking import RefConflict
+
+def get_model(name, vertices, obj_type="Building"):
+    """Returns a CityJSON with an object made of the given vertices."""
+    cm = cjm.CityJSON({"type": "CityJSON",
+                       "version": "1.1",
+                       "CityObjects": {name: {
+                           "type": obj_type,
+                           "geometry": [{"type": "MultiPoint",
+                                         "boundaries": list(range(len(vertices)))}]
+                       }},
+                       "vertices": vertices})
+    return cm
+
+def create_file(path):
+    """Creates a versioned file with a version in 'main'."""
+    vcm = cjv.VersionedCityJSON()
+    commands.CommitCommand(vcm, get_model("building1", [[0, 0, 0], [1, 1, 1]]),
+                           "main", "John Doe", "Initial").execute()
+    vcm.save(path)
+
+class TestConcurrentWrites:
+    """Group of tests of concurrent writes to the same file."""
+
+    def test_different_branches(self, tmp_path):
+        """Tests if commits to different branches are both kept."""
+        path = str(tmp_path / "vcm.json")
+        create_file(path)
+        first = cjv.VersionedCityJSON.from_file(path)
+        second = cjv.VersionedCityJSON.from_file(path)
+
+        commands.CommitCommand(first, get_model("building1", [[0, 0, 0], [2, 2, 2]]),
+                               "main", "John Doe", "Main").execute()
+        first.save(path)
+
+        second["versioning"]["branches"]["feature"] = second.versioning.resolve_ref("main")
+        commands.CommitCommand(second, get_model("building1", [[0, 0, 0], [3, 3, 3]], "BuildingPart"),
+                               "feature", "John Doe", "Feature").execute()
+        second.save(path)
+
+        result = cjv.VersionedCityJSON.from_file(path)
+        for branch, vertex in [("main", [2, 2, 2]), ("feature", [3, 3, 3])]:
+            version = result.versioning.get_version(branch)
+            obj = result.cityobjects[version.objects["building1"]]
+            boundaries = obj["geometry"][0]["boundaries"]
+            assert [result["vertices"][i] for i in boundaries] == [[0, 0, 0], vertex]
+
+    def test_recommit_after_merge(self, tmp_path):
+        """Tests if the objects renumbered by a merge match the same model
+        again."""
+        path = str(tmp_path / "vcm.json")
+        create_file(path)
+        first = cjv.VersionedCityJSON.from_file(path)
+        second = cjv.VersionedCityJSON.from_file(path)
+        for vcm in [first, second]:
+            vcm["versioning"]["branches"]["a" if vcm is first else "b"] = \
+                vcm.versioning.resolve_ref("main")
+
+        commands.CommitCommand(first, get_model("building1", [[2, 2, 2]]),
+                               "a", "John Doe", "A").execute()
+        first.save(path)
+        model = get_model("NEWBUILDING", [[3, 3, 3]])
+        commands.CommitCommand(second, model, "b", "John Doe", "B").execute()
+        second.save(path)
+
+        result = cjv.VersionedCityJSON.from_file(path)
+        head = result.versioning.get_version("b")
+        assert head.hash() == head.name
+        commands.CommitCommand(result, get_model("NEWBUILDING", [[3, 3, 3]]),
+                               "b", "John Doe", "Same").execute()
+        assert result.versioning.get_version("b").name == head.name
+
+    def test_same_branch(self, tmp_path):
+        """Tests if the second commit to the same branch is rejected."""
+        path = str(tmp_path / "vcm.json")
+        create_file(path)
+        first = cjv.VersionedCityJSON.from_file(path)
+        second = cjv.VersionedCityJSON.from_file(path)
+
+        commands.CommitCommand(first, get_model("building1", [[2, 2, 2]]),
+                               "main", "John Doe", "First").execute()
+        first.save(path)
+        head = first.versioning.resolve_ref("main")
+
+        commands.CommitCommand(second, get_model("building1", [[3, 3, 3]]),
+                               "main", "John Doe", "Second").execute()
+        with pytest.raises(RefConflict):
+            second.save(path)
+
+        assert cjv.VersionedCityJSON.from_file(path).versioning.resolve_ref("main") == head
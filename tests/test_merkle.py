@@ -0,0 +1,41 @@
+import cityjson.merkle as merkle
+
+class TestObjectsTree:
+    """Tests the ObjectsTree class."""
+
+    def test_root_ignores_order(self):
+        """Is the root the same for the same map in a different order?"""
+        objects = {"building{}".format(i): "hash{}".format(i) for i in range(100)}
+        reversed_objects = dict(reversed(list(objects.items())))
+
+        tree = merkle.ObjectsTree.from_objects(objects)
+        assert tree.root == merkle.ObjectsTree.from_objects(reversed_objects).root
+        assert tree.root != merkle.ObjectsTree.from_objects({}).root
+
+    def test_update(self):
+        """Is the updated tree the same as the tree of the new map?"""
+        objects = {"building{}".format(i): "hash{}".format(i) for i in range(100)}
+        tree = merkle.ObjectsTree.from_objects(objects)
+
+        new_objects = dict(objects)
+        new_objects["building1"] = "changed"
+        new_objects["road1"] = "added"
+        del new_objects["building2"]
+
+        updated = tree.update(new_objects, ["building1", "road1", "building2"])
+        assert updated.root == merkle.ObjectsTree.from_objects(new_objects).root
+        assert tree.root == merkle.ObjectsTree.from_objects(objects).root
+
+    def test_update_from_hashes(self):
+        """Is a tree with only the bucket hashes updated like the full one?"""
+        objects = {"building{}".format(i): "hash{}".format(i) for i in range(100)}
+        tree = merkle.ObjectsTree.from_objects(objects)
+
+        new_objects = dict(objects)
+        new_objects["building1"] = "changed"
+        del new_objects["building2"]
+
+        loaded = merkle.ObjectsTree.from_hashes(tree.hashes)
+        updated = loaded.update(new_objects, ["building1", "building2"])
+        assert updated.root == merkle.ObjectsTree.from_objects(new_objects).root
+        assert updated.update(objects, ["building1", "building2"]).root == tree.root
@@ -0,0 +1,66 @@
+"""Module with tests for the part by part comparison of city objects."""
+
+import copy
+
+import cityjson.citymodel as cjm
+import cityjson.versioning as cjv
+from cityjson.objectdiff import ObjectDiff
+
+def get_object(data):
+    """Returns a versioned city object with the given data."""
+    return cjv.VersionedCityObject(cjm.CityObject(data, "building1"))
+
+class TestObjectDiff:
+    """Group of tests of the object diff."""
+
+    def get_building(self):
+        """Returns a building with a MultiSurface of three surfaces."""
+        return {
+            "type": "Building",
+            "attributes": {"height": 10, "roof": "flat"},
+            "geometry": [{
+                "type": "MultiSurface",
+                "lod": 2,
+                "boundaries": [[[0, 1, 2]], [[2, 3, 0]], [[3, 4, 5]]],
+                "semantics": {
+                    "surfaces": [{"type": "RoofSurface"}, {"type": "WallSurface"}],
+                    "values": [0, 1, 1]
+                }
+            }]
+        }
+
+    def test_compare(self):
+        """Tests if the changed attributes and surfaces are found."""
+        old = self.get_building()
+        new = copy.deepcopy(old)
+        new["attributes"]["height"] = 12
+        new["geometry"][0]["boundaries"][2] = [[3, 4, 6]]
+        new["geometry"][0]["semantics"]["values"][0] = 1
+
+        paths = ObjectDiff().compare(get_object(old), get_object(new))
+
+        assert paths == [("attributes", "height"),
+                         ("geometry", 0, "surfaces", 0),
+                         ("geometry", 0, "surfaces", 2)]
+
+    def test_merge(self):
+        """Tests if changes of different parts are merged, and changes of the
+        same part are a conflict."""
+        common = self.get_building()
+        left = copy.deepcopy(common)
+        left["attributes"]["height"] = 12
+        left["geometry"][0]["boundaries"][0] = [[0, 1, 7]]
+        right = copy.deepcopy(common)
+        right["attributes"]["roof"] = "gabled"
+        right["geometry"][0]["boundaries"][2] = [[3, 4, 6]]
+        right["geometry"][0]["semantics"]["values"][2] = 0
+
+        result = ObjectDiff().merge(get_object(common), get_object(left), get_object(right))
+
+        assert result["attributes"] == {"height": 12, "roof": "gabled"}
+        assert result["geometry"][0]["boundaries"] == [[[0, 1, 7]], [[2, 3, 0]], [[3, 4, 6]]]
+        assert result["geometry"][0]["semantics"]["values"] == [0, 1, 0]
+        assert common == self.get_building()
+
+        right["attributes"]["height"] = 11
+        assert ObjectDiff().merge(get_object(common), get_object(left), get_object(right)) is None
@@ -0,0 +1,29 @@
+import cityjson.citymodel as cjm
+from cityjson.pack import PackFile
+
+class TestPackFile:
+    """Tests the PackFile class."""
+
+    def test_write_and_read(self, tmp_path):
+        """Are objects read back from a pack the same as the written ones?"""
+        objects = {"a": {"type": "Building"}, "b": {"type": "Bridge"}}
+        filename = str(tmp_path / "objects.pack")
+
+        PackFile.write(filename, objects.items())
+        pack = PackFile(filename)
+
+        assert len(pack) == 2
+        assert "a" in pack
+        assert pack["b"] == {"type": "Bridge"}
+
+    def test_cityobjects_from_pack(self, tmp_path):
+        """Are packed objects found through the dict of city objects?"""
+        filename = str(tmp_path / "objects.pack")
+        pack = PackFile.write(filename, [("a", {"type": "Building"})])
+
+        cityobjects = cjm.CityObjectDict({"b": {"type": "Bridge"}}, [pack])
+
+        assert len(cityobjects) == 2
+        assert "a" in cityobjects
+        assert cityobjects["a"].data == {"type": "Building"}
+        assert set(cityobjects) == {"a", "b"}
@@ -0,0 +1,48 @@
+"""Module with tests for CityJSONSeq files."""
+
+import io
+
+import commands
+import cityjson.versioning as cjv
+from cityjson.seq import SeqReader, SeqWriter, get_feature
+
+class TestSeq:
+    """Group of tests of reading and writing CityJSONSeq."""
+
+    def test_feature_vertices(self):
+        """Tests if a feature has only its vertices, in order of use."""
+        vertices = [[i, i, i] for i in range(10)]
+        obj = {"type": "Building",
+               "geometry": [{"type": "MultiSurface", "boundaries": [[[7, 3, 9]], [[3, 9, 1]]]}]}
+
+        feature = get_feature("building1", obj, vertices)
+
+        assert feature["vertices"] == [[7, 7, 7], [3, 3, 3], [9, 9, 9], [1, 1, 1]]
+        geometry = feature["CityObjects"]["building1"]["geometry"][0]
+        assert geometry["boundaries"] == [[[0, 1, 2]], [[1, 2, 3]]]
+        assert obj["geometry"][0]["boundaries"] == [[[7, 3, 9]], [[3, 9, 1]]]
+
+    def test_commit_seq(self):
+        """Tests if a sequence is committed a feature at a time."""
+        stream = io.StringIO()
+        writer = SeqWriter(stream, {"type": "CityJSON",
+                                    "transform": {"translate": [10, 0, 0],
+                                                  "scale": [0.5, 0.5, 0.5]},
+                                    "CityObjects": {},
+                                    "vertices": []})
+        vertices = [[0, 0, 0], [2, 2, 2], [4, 4, 4]]
+        for name, boundaries in [("building1", [0, 1]), ("building2", [1, 2])]:
+            writer.write_object(name,
+                                {"type": "Building",
+                                 "geometry": [{"type": "MultiPoint", "boundaries": boundaries}]},
+                                vertices)
+        stream.seek(0)
+
+        vcm = cjv.VersionedCityJSON()
+        commands.CommitCommand(vcm, SeqReader(stream), "main", "John Doe", "Seq").execute()
+
+        version = vcm.versioning.get_version("main")
+        assert sorted(version.objects) == ["building1", "building2"]
+        assert vcm["vertices"] == vertices
+        building = vcm.cityobjects[version.objects["building2"]]
+        assert building["geometry"][0]["boundaries"] == [1, 2]
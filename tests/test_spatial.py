@@ -0,0 +1,36 @@
+"""Module with tests for the spatial index."""
+
+import cityjson.spatial as spatial
+
+class TestGridIndex:
+    """Group of tests of the grid index."""
+
+    def test_query(self):
+        """Tests if the objects that intersect a bbox are found, also across
+        many cells and after saving and loading the index."""
+        index = spatial.GridIndex(10)
+        vertices = [[0, 0, 0], [5, 5, 1], [30, 30, 0], [45, 35, 2]]
+        cityobjects = {
+            "a": {"geometry": [{"boundaries": [[[0, 1, 0]]]}]},
+            "b": {"geometry": [{"boundaries": [[[2, 3, 2]]]}]},
+            "c": {}
+        }
+
+        assert index.update(["a", "b", "c"], cityobjects, vertices) == 3
+        assert index.update(["a", "b"], cityobjects, vertices) == 0
+        assert index["b"] == [30, 30, 0, 45, 35, 2]
+
+        assert index.query([1, 1, 2, 2]) == {"a"}
+        assert index.query([40, 31, 50, 32]) == {"b"}
+        assert index.query([10, 10, 20, 20]) == set()
+        assert index.query([-1000, -1000, 1000, 1000]) == {"a", "b"}
+
+    def test_transform(self):
+        """Tests if the bboxes are in real coordinates."""
+        index = spatial.GridIndex()
+        index.update(["a"],
+                     {"a": {"geometry": [{"boundaries": [0, 1]}]}},
+                     [[0, 0, 0], [1000, 2000, 3000]],
+                     {"scale": [0.001, 0.001, 0.001], "translate": [100, 200, 0]})
+
+        assert index["a"] == [100, 200, 0, 101, 202, 3]
@@ -0,0 +1,53 @@
+import json
+
+import commands
+import cityjson.citymodel as cjm
+import cityjson.versioning as cjv
+
+class TestSQLiteStorage:
+    """Tests the SQLite storage of versioned city models."""
+
+    def test_import_and_export(self, tmp_path):
+        """Is a versioned CityJSON the same after a round trip to SQLite?"""
+        db_file = str(tmp_path / "model.cjvdb")
+        json_file = str(tmp_path / "model.json")
+
+        vcm = cjv.VersionedCityJSON.from_file("Examples/dummy/buildingBeforeAndAfter.json")
+        vcm.save(db_file)
+
+        vcm = cjv.VersionedCityJSON.from_file(db_file)
+        assert len(vcm.versioning.versions) == 4
+        assert vcm.versioning.get_version("main").name == "v30"
+        vcm.save(json_file)
+
+        with open("Examples/dummy/buildingBeforeAndAfter.json") as original:
+            expected = json.load(original)
+        with open(json_file) as exported:
+            result = json.load(exported)
+
+        assert result == expected
+
+    def test_incremental_commit(self, tmp_path):
+        """Are commits to a database stored without rewriting it?"""
+        db_file = str(tmp_path / "model.cjvdb")
+
+        vcm = cjv.VersionedCityJSON()
+        command = commands.CommitCommand(vcm,
+                                         cjm.CityJSON.from_file("Examples/rotterdam/initial.json"),
+                                         "main", "John Doe", "Initial")
+        command.execute()
+        vcm.save(db_file)
+
+        vcm = cjv.VersionedCityJSON.from_file(db_file)
+        vertex_count = len(vcm["vertices"])
+        command = commands.CommitCommand(vcm,
+                                         cjm.CityJSON.from_file("Examples/rotterdam/initial_moved_roof.json"),
+                                         "main", "John Doe", "Move roof")
+        command.execute()
+        vcm.save(db_file)
+
+        vcm = cjv.VersionedCityJSON.from_file(db_file)
+        head = vcm.versioning.get_version("main")
+        assert head.message == "Move roof"
+        assert len(head.versioned_objects) == len(head.objects)
+        assert len(vcm["vertices"]) > vertex_count
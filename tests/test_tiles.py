@@ -0,0 +1,114 @@
+"""Module with tests for tiled repositories."""
+
+import copy
+import json
+
+import commands
+import cityjson.citymodel as cjm
+from cityjson.tiles import TiledRepository
+
+def get_model(heights, offsets=None):
+    """Returns a CityJSON with a building per tile of 10 units, with the
+    given heights, or in the tiles of the given offsets."""
+    data = copy.deepcopy(cjm.min_cityjson)
+    if offsets is None:
+        offsets = range(len(heights))
+    for i, (height, offset) in enumerate(zip(heights, offsets)):
+        x = offset * 10 + 1
+        data["CityObjects"]["building{}".format(i)] = {
+            "type": "Building",
+            "geometry": [{"type": "MultiPoint",
+                          "boundaries": [len(data["vertices"]), len(data["vertices"]) + 1]}]
+        }
+        data["vertices"].extend([[x, 1, 0], [x + 1, 2, height]])
+    return cjm.CityJSON(data)
+
+class TestTiledRepository:
+    """Group of tests of tiled repositories."""
+
+    def test_commit_tiles(self, tmp_path):
+        """Tests if only the changed tiles get new versions."""
+        repository = TiledRepository.create(str(tmp_path / "repo"), 10)
+        commands.TileCommitCommand(repository, get_model([5, 5]), "main",
+                                   "John Doe", "Initial").execute()
+        heads = dict(repository.get_heads("main"))
+        assert sorted(heads) == ["0_0", "1_0"]
+
+        commands.TileCommitCommand(repository, get_model([5, 8]), "main",
+                                   "John Doe", "Higher").execute()
+        new_heads = TiledRepository(str(tmp_path / "repo")).get_heads("main")
+        assert new_heads["0_0"] == heads["0_0"]
+        assert new_heads["1_0"] != heads["1_0"]
+
+        output = str(tmp_path / "out.json")
+        command = commands.TileCheckoutCommand(repository, "main", output)
+        command.set_bbox([10, 0, 15, 5])
+        command.execute()
+        with open(output, encoding="UTF-8") as infile:
+            result = json.load(infile)
+        assert list(result["CityObjects"]) == ["building1"]
+        assert result["vertices"] == [[11, 1, 0], [12, 2, 8]]
+
+    def test_delete_object(self, tmp_path):
+        """Tests if a tile whose objects were all deleted gets an empty version."""
+        repository = TiledRepository.create(str(tmp_path / "repo"), 10)
+        commands.TileCommitCommand(repository, get_model([5, 5]), "main",
+                                   "John Doe", "Initial").execute()
+        commands.TileCommitCommand(repository, get_model([5]), "main",
+                                   "John Doe", "Deleted").execute()
+
+        output = str(tmp_path / "out.json")
+        commands.TileCheckoutCommand(TiledRepository(str(tmp_path / "repo")),
+                                     "main", output).execute()
+        with open(output, encoding="UTF-8") as infile:
+            result = json.load(infile)
+        assert list(result["CityObjects"]) == ["building0"]
+
+    def test_move_object(self, tmp_path):
+        """Tests if an object moved to another tile is removed from the old one."""
+        repository = TiledRepository.create(str(tmp_path / "repo"), 10)
+        commands.TileCommitCommand(repository, get_model([5, 5]), "main",
+                                   "John Doe", "Initial").execute()
+        commands.TileCommitCommand(repository, get_model([5, 5], [0, 2]), "main",
+                                   "John Doe", "Moved").execute()
+
+        output = str(tmp_path / "out.json")
+        commands.TileCheckoutCommand(TiledRepository(str(tmp_path / "repo")),
+                                     "main", output).execute()
+        with open(output, encoding="UTF-8") as infile:
+            result = json.load(infile)
+        assert sorted(result["CityObjects"]) == ["building0", "building1"]
+        assert result["vertices"] == [[1, 1, 0], [2, 2, 5], [21, 1, 0], [22, 2, 5]]
+
+    def test_checkout_crossing_object(self, tmp_path):
+        """Tests if a bbox finds an object whose center is in a tile out of it."""
+        repository = TiledRepository.create(str(tmp_path / "repo"), 10)
+        data = copy.deepcopy(cjm.min_cityjson)
+        data["CityObjects"]["bridge"] = {
+            "type": "Bridge",
+            "geometry": [{"type": "MultiPoint", "boundaries": [0, 1]}]
+        }
+        data["vertices"] = [[8, 1, 0], [14, 2, 5]]
+        commands.TileCommitCommand(repository, cjm.CityJSON(data), "main",
+                                   "John Doe", "Initial").execute()
+        assert list(repository.get_heads("main")) == ["1_0"]
+
+        output = str(tmp_path / "out.json")
+        command = commands.TileCheckoutCommand(TiledRepository(str(tmp_path / "repo")),
+                                               "main", output)
+        command.set_bbox([0, 0, 9, 5])
+        command.execute()
+        with open(output, encoding="UTF-8") as infile:
+            result = json.load(infile)
+        assert list(result["CityObjects"]) == ["bridge"]
+
+    def test_update_heads(self, tmp_path):
+        """Tests if the heads of tiles updated by another process are kept."""
+        directory = str(tmp_path / "repo")
+        first = TiledRepository.create(directory, 10)
+        second = TiledRepository(directory)
+
+        first.update_heads("main", {"0_0": "a"})
+        second.update_heads("main", {"1_0": "b"})
+
+        assert TiledRepository(directory).get_heads("main") == {"0_0": "a", "1_0": "b"}
@@ -0,0 +1,30 @@
+"""Module with tests for the utility functions."""
+
+import numpy as np
+
+import utils
+
+class TestRemapGeometries:
+    """Group of tests of the remapping of vertex indices."""
+
+    def get_geometries(self):
+        """Returns geometries of different depths."""
+        return [
+            {"type": "MultiPoint", "boundaries": [0, 1]},
+            {"type": "MultiSurface", "boundaries": [[[0, 1, 2]], [[2, 3, 0], [1]]]},
+            {"type": "Solid", "boundaries": [[[[3, 2, 1]]], []]}
+        ]
+
+    def test_remap(self):
+        """Tests if all indices are replaced in place, with a list and with an
+        array of new ids."""
+        for newids in [[10, 11, 12, 13], np.array([10, 11, 12, 13])]:
+            geometries = self.get_geometries()
+            ring = geometries[1]["boundaries"][0][0]
+
+            utils.remap_geometries(geometries, newids)
+
+            assert geometries[0]["boundaries"] == [10, 11]
+            assert geometries[1]["boundaries"] == [[[10, 11, 12]], [[12, 13, 10], [11]]]
+            assert geometries[2]["boundaries"] == [[[[13, 12, 11]]], []]
+            assert geometries[1]["boundaries"][0][0] is ring
@@ -1,6 +1,7 @@
 import pytest
 import cityjson.versioning as cjv
 import cityjson.citymodel as cjm
+from cityjson.diffcache import DiffCache
 from utils import get_hash_of_object
 
 class TestVersionedCityJSON:
@@ -47,6 +48,24 @@ class TestVersion:
         assert obtained_vobj.name == ver_obj.name
         assert obtained_vobj.original_cityobject.name == "building1"
 
+    def test_objects_of_type(self):
+        """Are the objects of a type selected through the type index?"""
+
+        cm = cjv.VersionedCityJSON()
+        versioning = cjv.Versioning(cm)
+
+        version = cjv.Version(versioning)
+        for name, obj_type in [("building1", "Building"),
+                               ("road1", "Road"),
+                               ("building2", "Building")]:
+            obj = cjm.CityObject({"type" : obj_type}, name)
+            version.add_cityobject(cjv.VersionedCityObject(obj))
+
+        assert version.get_objects_of_type(["Building"]) == {"building1", "building2"}
+        assert version.get_objects_of_type(["Road", "Bridge"]) == {"road1"}
+        # Both buildings have the same content, so they share a hash
+        assert len(cm.get_type_index()) == 2
+
 
 class TestVersionedCityObject:
     """Tests the VersionedCityObject class."""
@@ -170,3 +189,59 @@ class TestSimpleVersionDiff:
         assert len(result.added) == 0
         assert len(result.removed) == 1
         assert len(result.unchanged) == 0
+
+    def test_iter_changes(self, tmp_path):
+        """Are the streamed records the same with and without the cache?"""
+        cm = (cjv.VersionedCityJSON
+              .from_file("Examples/dummy/buildingBeforeAndAfter.json"))
+        v30 = cm.versioning.get_version("v30")
+        v29 = cm.versioning.get_version("v29")
+        cache = DiffCache(str(tmp_path / "cache"))
+
+        diff = cjv.SimpleVersionDiff(v29, v30, cache=cache)
+        records = list(diff.iter_changes())
+
+        assert len(records) == 1
+        assert records[0][0] == "removed" and records[0][3] is None
+        assert list(diff.iter_changes()) == records
+        assert diff.compute_ids()["removed"] == {records[0][1]: records[0][2]}
+
+class TestDeltaEncodedVersions:
+    """Tests versions with delta-encoded objects maps."""
+
+    def create_chain(self, cm, keyframe_interval):
+        """Adds a chain of five versions, each changing one object."""
+        versioning = cm.versioning
+        versioning.keyframe_interval = keyframe_interval
+
+        parent = None
+        for i in range(5):
+            version = cjv.Version(versioning)
+            if parent is not None:
+                version.data["objects"] = dict(parent.objects)
+                version.add_parent(parent)
+            obj = cjm.CityObject({"type" : "Building", "version": i},
+                                 "building{}".format(i % 2))
+            version.add_cityobject(cjv.VersionedCityObject(obj))
+            version.name = version.hash()
+            versioning.add_version(version)
+            parent = versioning.versions[version.name]
+
+        return parent
+
+    def test_resolve_objects(self):
+        """Are delta-encoded maps resolved to the same objects and hashes?"""
+        cm = cjv.VersionedCityJSON()
+        head = self.create_chain(cm, 3)
+
+        full_cm = cjv.VersionedCityJSON()
+        full_head = self.create_chain(full_cm, None)
+
+        assert head.name == full_head.name
+        assert [v.delta_depth for v in cm.versioning.versions.values()] == [0, 1, 2, 0, 1]
+
+        cm.objects_cache.clear()
+        assert head.is_delta_encoded()
+        assert head.objects == full_head.objects
+        assert head.hash() == head.name
+        assert len(head.versioned_objects) == 2
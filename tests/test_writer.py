@@ -0,0 +1,31 @@
+"""Module with tests for the parallel writer."""
+
+import json
+
+from cityjson.writer import ParallelWriter, get_used_vertices
+
+class TestParallelWriter:
+    """Group of tests of the parallel writer."""
+
+    def test_write_shards(self, tmp_path):
+        """Tests if the shards are written in order, with only the used
+        vertices renumbered."""
+        objects = [("building{}".format(i),
+                    {"type": "Building",
+                     "geometry": [{"type": "MultiPoint", "boundaries": [i * 2, 1]}]})
+                   for i in range(5)]
+        vertices = [[i, i, i] for i in range(12)]
+        used = get_used_vertices(obj for _, obj in objects)
+        assert used.tolist() == [0, 1, 2, 4, 6, 8]
+
+        filename = str(tmp_path / "out.json")
+        writer = ParallelWriter(2, shard_size=2)
+        writer.write(filename, {"type": "CityJSON"}, iter(objects), vertices, used)
+
+        with open(filename, encoding="UTF-8") as infile:
+            result = json.load(infile)
+
+        assert list(result["CityObjects"]) == [name for name, _ in objects]
+        assert result["CityObjects"]["building4"]["geometry"][0]["boundaries"] == [5, 1]
+        assert result["vertices"] == [vertices[i] for i in used.tolist()]
+        assert result["type"] == "CityJSON"
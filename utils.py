@@ -1,8 +1,14 @@
 """This module provides functions to manipulate data for the prototype"""
 
+import csv
 import json
 import hashlib
 
+import numpy as np
+
+from cityjson.citymodel import CoordinatesTransformer
+from cityjson.geometry import compact_vertices, remap_geometries
+
 # Code to have colors at the console output
 from colorama import init, Fore, Back, Style
 init()
@@ -213,21 +219,6 @@ def convert_to_versioned_city_objects(city_objects, id_property_name="cityobject
     
     return new_objects
 
-def update_geom_indices_by_offset(a, offset):
-    for i, each in enumerate(a):
-        if isinstance(each, list):
-            update_geom_indices_by_offset(each, offset)
-        else:
-            if each is not None:
-                a[i] = each + offset
-
-def update_geom_indices_by_map(a, newids):
-    for i, each in enumerate(a):
-        if isinstance(each, list):
-            update_geom_indices_by_map(each, newids)
-        else:
-            a[i] = newids[each]
-
 def remove_duplicate_vertices(cm, precision):     
     totalinput = len(cm["vertices"])        
     h = {}
@@ -253,6 +244,100 @@ def remove_duplicate_vertices(cm, precision):
     cm["vertices"] = newv2
     return (newids, totalinput - len(cm["vertices"]))
 
+def get_coordinates(vertices, transform=None):
+    """Returns the real coordinates of a list of vertices as a (N, 3) array,
+    applying the transform (if any)."""
+    if transform is None:
+        return np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    return get_transformer(transform).decode_many(vertices)
+
+def get_transformer(transform):
+    """Returns the coordinates transformer of a transform object."""
+    return CoordinatesTransformer(transform["translate"], transform["scale"])
+
+def get_vertex_keys(coords, precision):
+    """Returns the keys used to detect duplicate vertices: their coordinates
+    rounded to the precision, as tuples of integers."""
+    keys = np.round(coords * 10 ** precision).astype(np.int64)
+    return list(map(tuple, keys.tolist()))
+
+def build_vertex_lookup(vertices, precision, transform=None):
+    """Returns a dict with the key of every vertex and its (first) index"""
+    h = {}
+    for i, key in enumerate(get_vertex_keys(get_coordinates(vertices, transform),
+                                            precision)):
+        h.setdefault(key, i)
+    return h
+
+def append_vertices(cm, vertices, lookup, precision, transform=None):
+    """Appends vertices to the model, reusing the ones already in the lookup.
+
+    The vertices can have their own transform, in which case they are
+    quantized again with the transform of the model (or the model takes
+    theirs, if it has no vertices yet). The lookup is updated in place, so it
+    can be kept between calls to avoid hashing the whole vertex list again.
+    Returns the new index of every appended vertex.
+    """
+    if transform is not None and "transform" not in cm and len(cm["vertices"]) == 0:
+        cm.set_transform(list(transform["translate"]), list(transform["scale"]))
+
+    coords = get_coordinates(vertices, transform)
+    keys = get_vertex_keys(coords, precision)
+
+    start = len(cm["vertices"])
+    newids = [-1] * len(keys)
+    added = []
+    for i, key in enumerate(keys):
+        newid = lookup.get(key)
+        if newid is None:
+            newid = lookup[key] = start + len(added)
+            added.append(i)
+        newids[i] = newid
+
+    if "transform" in cm:
+        new_vertices = get_transformer(cm["transform"]).encode_many(coords[added])
+    else:
+        new_vertices = np.array([keys[i] for i in added]).reshape(-1, 3) / 10 ** precision
+    cm["vertices"].extend(new_vertices.tolist())
+
+    return newids
+
+def extract_vertices_from_boundaries(a, vertices):
+    """Replaces the coordinates of nested boundaries with indices to the given
+    list of vertices, which is extended with the coordinates"""
+    for i, each in enumerate(a):
+        if isinstance(each[0], list):
+            extract_vertices_from_boundaries(each, vertices)
+        else:
+            a[i] = len(vertices)
+            vertices.append(each)
+
+def load_change_log(input_file):
+    """Loads a log of object changes from a CSV, JSON or JSON Lines file.
+
+    Every record has an 'id', a 'timestamp' and a 'geometry' (a list of
+    CityJSON geometries with coordinates as boundaries). Optionally, it can
+    have a 'type', 'attributes' or a 'deleted' flag. Returns the records
+    sorted by timestamp."""
+    with open(input_file, encoding="UTF-8") as infile:
+        if input_file.endswith(".csv"):
+            records = []
+            for row in csv.DictReader(infile):
+                record = {k: v for k, v in row.items() if v not in (None, "")}
+                for key in ["geometry", "attributes"]:
+                    if key in record:
+                        record[key] = json.loads(record[key])
+                record["deleted"] = (record.get("deleted", "false").lower()
+                                     in ("1", "true", "yes"))
+                records.append(record)
+        elif input_file.endswith(".jsonl"):
+            records = [json.loads(line) for line in infile if line.strip()]
+        else:
+            records = json.load(infile)
+
+    records.sort(key=lambda r: r["timestamp"])
+    return records
+
 def get_hash_of_object(object):
     # TODO This has to normalise the input (sort as well)
     encoded = json.dumps(object).encode('utf-8')